@@ -1,49 +1,233 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
 from hashlib import sha256
 
+import aiofiles
 import jwt
-from async_lru import alru_cache
 from fastapi import HTTPException
 
 from skynet import http_client
 from skynet.env import (
     asap_pub_keys_auds,
+    asap_pub_keys_cache_dir,
     asap_pub_keys_fallback_folder,
     asap_pub_keys_folder,
     asap_pub_keys_max_cache_size,
+    asap_pub_keys_max_negative_ttl,
+    asap_pub_keys_negative_ttl,
+    asap_pub_keys_ttl,
     asap_pub_keys_url,
+    asap_verified_tokens_cache_size,
     bypass_auth,
 )
 from skynet.logs import get_logger
 
 log = get_logger(__name__)
 
+# keys are refreshed in the background once they reach this fraction of their ttl
+REFRESH_AFTER = 0.8
 
-@alru_cache(maxsize=asap_pub_keys_max_cache_size)
-async def get_public_key(kid: str) -> str:
-    encoded_pub_key_name = sha256(kid.encode('UTF-8')).hexdigest()
-    pub_key_remote_filename = f'{encoded_pub_key_name}.pem'
 
-    url = f'{asap_pub_keys_url}/{asap_pub_keys_folder}/{pub_key_remote_filename}'
+class PublicKeyCache:
+    """
+    Caches public keys in memory and, if `ASAP_PUB_KEYS_CACHE_DIR` is set, on disk so that they survive restarts.
+
+    Keys close to expiry are still served while being refreshed in the background. Failed lookups are cached with an
+    exponential backoff, so an unknown `kid` doesn't send every connection attempt to the key server. An expired key
+    keeps being served while it can't be refreshed, an outage of the key server doesn't lock out the clients.
+    """
+
+    def __init__(
+        self,
+        ttl: int = asap_pub_keys_ttl,
+        negative_ttl: int = asap_pub_keys_negative_ttl,
+        max_negative_ttl: int = asap_pub_keys_max_negative_ttl,
+        max_size: int = asap_pub_keys_max_cache_size,
+        cache_dir: str = asap_pub_keys_cache_dir,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_negative_ttl = max_negative_ttl
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.keys: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self.failures: dict[str, tuple[int, float]] = {}
+        self.pending: dict[str, asyncio.Future] = {}
+        # the event loop only keeps weak references to the tasks
+        self.refreshes: set[asyncio.Task] = set()
+
+    @staticmethod
+    def get_filename(kid: str) -> str:
+        return f'{sha256(kid.encode("UTF-8")).hexdigest()}.pem'
+
+    async def get(self, kid: str) -> str:
+        now = time.time()
+        cached = self.keys.get(kid)
+        retry_at = self.failures.get(kid, (0, 0))[1]
+
+        if cached is not None:
+            key, fetched_at = cached
+            self.keys.move_to_end(kid)
+
+            if now - fetched_at < self.ttl:
+                if now - fetched_at > self.ttl * REFRESH_AFTER and now >= retry_at and kid not in self.pending:
+                    self.refresh(kid)
+                return key
+
+        if now < retry_at:
+            if cached is not None:
+                return cached[0]
+            raise Exception(f'Public key {kid} is not available, retrying in {int(retry_at - now)}s')
+
+        try:
+            return await self.load(kid)
+        except Exception:
+            if cached is None:
+                raise
+
+            log.warning(f'Serving the expired public key {kid} until it can be refreshed')
+            return cached[0]
+
+    def refresh(self, kid: str):
+        task = asyncio.create_task(self.load(kid), name=kid)
+        self.refreshes.add(task)
+        task.add_done_callback(self.on_refreshed)
+
+    def on_refreshed(self, task: asyncio.Task):
+        self.refreshes.discard(task)
 
-    log.info(f'Fetching public key {kid} from {url}')
-    response = await http_client.request('GET', url)
+        if not task.cancelled() and task.exception() is not None:
+            log.warning(f'Failed to refresh public key {task.get_name()} in the background: {task.exception()}')
 
-    if response.status != 200:
-        error = f'Failed to retrieve public key {kid}'
+    async def load(self, kid: str) -> str:
+        # concurrent lookups of the same key share a single fetch
+        if kid in self.pending:
+            return await asyncio.shield(self.pending[kid])
 
-        if asap_pub_keys_fallback_folder:
-            url = f'{asap_pub_keys_url}/{asap_pub_keys_fallback_folder}/{pub_key_remote_filename}'
+        future = asyncio.get_running_loop().create_future()
+        self.pending[kid] = future
+
+        try:
+            key, fetched_at = await self.read_from_disk(kid)
+            if key is None:
+                key, fetched_at = await self.fetch(kid), time.time()
+                await self.write_to_disk(kid, key)
+
+            self.store(kid, key, fetched_at)
+            future.set_result(key)
+        except Exception as e:
+            failures = self.failures.get(kid, (0, 0))[0] + 1
+            backoff = min(self.negative_ttl * 2 ** (failures - 1), self.max_negative_ttl)
+            self.failures[kid] = (failures, time.time() + backoff)
+
+            log.warning(f'Failed to load public key {kid}, attempt {failures}, backing off for {backoff}s')
+            future.set_exception(e)
+        finally:
+            del self.pending[kid]
+
+        return await future
+
+    def store(self, kid: str, key: str, fetched_at: float):
+        self.failures.pop(kid, None)
+        self.keys[kid] = (key, fetched_at)
+        self.keys.move_to_end(kid)
+
+        while len(self.keys) > self.max_size:
+            self.keys.popitem(last=False)
+
+    async def fetch(self, kid: str) -> str:
+        pub_key_remote_filename = self.get_filename(kid)
+        folders = [asap_pub_keys_folder] + ([asap_pub_keys_fallback_folder] if asap_pub_keys_fallback_folder else [])
+
+        for folder in folders:
+            url = f'{asap_pub_keys_url}/{folder}/{pub_key_remote_filename}'
 
             log.info(f'Fetching public key {kid} from {url}')
+            response = await http_client.request('GET', url, http2=True)
+
+            if response.status == 200:
+                return response.text()
+
+        raise Exception(f'Failed to retrieve public key {kid}')
+
+    async def read_from_disk(self, kid: str) -> tuple[str | None, float]:
+        if not self.cache_dir:
+            return None, 0
+
+        path = os.path.join(self.cache_dir, self.get_filename(kid))
+
+        try:
+            fetched_at = os.path.getmtime(path)
+            if time.time() - fetched_at > self.ttl * REFRESH_AFTER:
+                return None, 0
 
-            response = await http_client.request('GET', url)
+            async with aiofiles.open(path, mode='r') as file:
+                return await file.read(), fetched_at
+        except FileNotFoundError:
+            return None, 0
 
-            if response.status != 200:
-                raise Exception(error)
-        else:
-            raise Exception(error)
+    async def write_to_disk(self, kid: str, key: str):
+        if not self.cache_dir:
+            return
 
-    return await response.text()
+        path = os.path.join(self.cache_dir, self.get_filename(kid))
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            # write to a temporary file first so that other workers never read a partial key
+            async with aiofiles.open(f'{path}.tmp', mode='w') as file:
+                await file.write(key)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            log.warning(f'Failed to write public key {kid} to the disk cache: {e}')
+
+
+class VerifiedTokenCache:
+    """Remembers already verified tokens by their hash until they expire."""
+
+    def __init__(self, max_size: int = asap_verified_tokens_cache_size):
+        self.max_size = max_size
+        self.tokens: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+
+    @staticmethod
+    def get_hash(token: str) -> str:
+        return sha256(token.encode('UTF-8')).hexdigest()
+
+    def get(self, token_hash: str) -> dict | None:
+        cached = self.tokens.get(token_hash)
+
+        if cached is None:
+            return None
+
+        decoded, expires_at = cached
+        if time.time() >= expires_at:
+            del self.tokens[token_hash]
+            return None
+
+        self.tokens.move_to_end(token_hash)
+        return decoded
+
+    def set(self, token_hash: str, decoded: dict):
+        # tokens without an expiration date are verified every time
+        if 'exp' not in decoded:
+            return
+
+        self.tokens[token_hash] = (decoded, float(decoded['exp']))
+        self.tokens.move_to_end(token_hash)
+
+        while len(self.tokens) > self.max_size:
+            self.tokens.popitem(last=False)
+
+
+public_keys = PublicKeyCache()
+verified_tokens = VerifiedTokenCache()
+
+
+async def get_public_key(kid: str) -> str:
+    return await public_keys.get(kid)
 
 
 async def authorize(jwt_incoming: str) -> dict:
@@ -52,6 +236,32 @@ async def authorize(jwt_incoming: str) -> dict:
     """
     if bypass_auth:
         return {}
-        
-    # We should never reach here since bypass_auth is True
-    raise NotImplementedError("Auth is bypassed")
+
+    token_hash = verified_tokens.get_hash(jwt_incoming)
+    decoded = verified_tokens.get(token_hash)
+
+    if decoded is not None:
+        return decoded
+
+    try:
+        kid = jwt.get_unverified_header(jwt_incoming).get('kid')
+    except jwt.exceptions.DecodeError:
+        raise HTTPException(status_code=401, detail='Invalid token')
+
+    if not kid:
+        raise HTTPException(status_code=401, detail='Missing kid header')
+
+    try:
+        public_key = await get_public_key(kid)
+    except Exception as e:
+        log.warning(e)
+        raise HTTPException(status_code=401, detail=f'Failed to retrieve public key {kid}')
+
+    try:
+        decoded = jwt.decode(jwt_incoming, public_key, algorithms=['RS256'], audience=asap_pub_keys_auds)
+    except jwt.exceptions.PyJWTError as e:
+        raise HTTPException(status_code=401, detail=f'Invalid token: {e}')
+
+    verified_tokens.set(token_hash, decoded)
+
+    return decoded
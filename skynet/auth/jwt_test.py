@@ -0,0 +1,127 @@
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+
+@pytest.fixture(scope='module')
+def keypair():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_key = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+    return private_key, public_key.decode()
+
+
+@pytest.fixture()
+def jwt_fixture(mocker, keypair):
+    from skynet.auth.jwt import PublicKeyCache, VerifiedTokenCache
+
+    mocker.patch('skynet.auth.jwt.bypass_auth', False)
+    mocker.patch('skynet.auth.jwt.asap_pub_keys_auds', ['skynet'])
+    mocker.patch('skynet.auth.jwt.public_keys', PublicKeyCache(negative_ttl=30, cache_dir=''))
+    mocker.patch('skynet.auth.jwt.verified_tokens', VerifiedTokenCache())
+    fetch = mocker.patch('skynet.auth.jwt.PublicKeyCache.fetch', return_value=keypair[1])
+
+    return fetch
+
+
+def create_token(private_key, kid='test-kid', **claims):
+    payload = {'aud': 'skynet', 'exp': int(time.time()) + 60, **claims}
+
+    return jwt.encode(payload, private_key, algorithm='RS256', headers={'kid': kid})
+
+
+class TestAuthorize:
+    @pytest.mark.asyncio
+    async def test_authorize(self, jwt_fixture, keypair):
+        '''Test that a valid token is decoded.'''
+
+        from skynet.auth.jwt import authorize
+
+        decoded = await authorize(create_token(keypair[0], sub='someone'))
+
+        assert decoded['sub'] == 'someone'
+
+    @pytest.mark.asyncio
+    async def test_authorize_memoizes_verified_tokens(self, jwt_fixture, keypair, mocker):
+        '''Test that a token is only verified once.'''
+
+        from skynet.auth.jwt import authorize
+
+        decode = mocker.spy(jwt, 'decode')
+        token = create_token(keypair[0])
+
+        await authorize(token)
+        await authorize(token)
+
+        decode.assert_called_once()
+        jwt_fixture.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_authorize_invalid_audience(self, jwt_fixture, keypair):
+        '''Test that a token for a different audience is rejected.'''
+
+        from skynet.auth.jwt import authorize
+
+        with pytest.raises(HTTPException):
+            await authorize(create_token(keypair[0], aud='someone-else'))
+
+    @pytest.mark.asyncio
+    async def test_authorize_caches_key_failures(self, jwt_fixture, keypair):
+        '''Test that a missing key is not fetched again until the backoff expires.'''
+
+        from skynet.auth.jwt import authorize
+
+        jwt_fixture.side_effect = Exception('Not found')
+
+        for _ in range(3):
+            with pytest.raises(HTTPException):
+                await authorize(create_token(keypair[0], kid='missing-kid'))
+
+        jwt_fixture.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_background_refresh(self, jwt_fixture, keypair, mocker):
+        '''Test that a key close to expiry is served while refreshed in the background, and a failed refresh logged.'''
+
+        import asyncio
+
+        from skynet.auth import jwt as jwt_module
+
+        public_keys = jwt_module.public_keys
+        public_keys.store('test-kid', keypair[1], time.time() - public_keys.ttl * 0.9)
+        jwt_fixture.side_effect = Exception('Not found')
+        warning = mocker.patch.object(jwt_module.log, 'warning')
+
+        assert await public_keys.get('test-kid') == keypair[1]
+        assert len(public_keys.refreshes) == 1
+
+        await asyncio.gather(*public_keys.refreshes, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert not public_keys.refreshes
+        assert 'Failed to refresh public key test-kid' in warning.call_args.args[0]
+
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self, jwt_fixture, keypair):
+        '''Test that an expired key is served while it can't be refreshed, and only a key never loaded is missing.'''
+
+        from skynet.auth import jwt as jwt_module
+
+        public_keys = jwt_module.public_keys
+        public_keys.store('test-kid', keypair[1], time.time() - public_keys.ttl - 1)
+        jwt_fixture.side_effect = Exception('Not found')
+
+        # the failed refresh, then the backoff
+        for _ in range(2):
+            assert await public_keys.get('test-kid') == keypair[1]
+
+        jwt_fixture.assert_called_once()
+
+        with pytest.raises(Exception, match='Not found'):
+            await public_keys.get('missing-kid')
@@ -1,32 +1,120 @@
+import asyncio
+from dataclasses import dataclass, field
 from enum import Enum
+from types import MappingProxyType
+from typing import Mapping
 
 import aiofiles
 import yaml
 
-from skynet.env import openai_credentials_file
+from skynet.env import openai_credentials_file, summary_routing_policy
 from skynet.logs import get_logger
 from skynet.modules.file_watcher import FileWatcher
+from skynet.modules.ttt.summaries.v1.models import Processors
 
 log = get_logger(__name__)
 
-credentials = dict()
-
 
 class CredentialsType(Enum):
     OPENAI = 'OPENAI'
     AZURE_OPENAI = 'AZURE_OPENAI'
 
 
+class RoutingPolicy(Enum):
+    PINNED = 'pinned'
+    COST = 'cost'
+    LATENCY = 'latency'
+
+
+@dataclass(frozen=True)
+class CustomerCredentials:
+    processor: Processors
+    options: Mapping
+    # the options of the customer's other enabled credentials, which the router may use instead
+    alternatives: tuple[Mapping, ...] = ()
+    policy: RoutingPolicy = field(default_factory=lambda: RoutingPolicy(summary_routing_policy))
+
+
+@dataclass(frozen=True)
+class CredentialsIndex:
+    version: int
+    customers: Mapping[str, CustomerCredentials]
+
+
+default_credentials = CustomerCredentials(
+    processor=Processors.LOCAL, options=MappingProxyType({'type': CredentialsType.OPENAI.value})
+)
+
+# Replaced as a whole every time the credentials file changes, readers never see a partially built index.
+index = CredentialsIndex(version=0, customers=MappingProxyType({}))
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    return value
+
+
+def resolve_all_options(customer_credentials: dict) -> list[dict]:
+    multiple_credentials = customer_credentials.get('credentialsMap')
+
+    if multiple_credentials:
+        return [val for val in multiple_credentials.values() if val['enabled']]
+
+    # backwards compatibility
+    return [{'type': CredentialsType.OPENAI.value, **customer_credentials}]
+
+
+def resolve_policy(customer_credentials: dict) -> RoutingPolicy:
+    policy = customer_credentials.get('routingPolicy', summary_routing_policy)
+
+    try:
+        return RoutingPolicy(policy)
+    except ValueError:
+        log.warning(f'Unknown routing policy {policy}, using {summary_routing_policy}')
+        return RoutingPolicy(summary_routing_policy)
+
+
+def resolve_processor(options: dict) -> Processors:
+    if options.get('secret'):
+        if options.get('type') == CredentialsType.OPENAI.value:
+            return Processors.OPENAI
+        elif options.get('type') == CredentialsType.AZURE_OPENAI.value:
+            return Processors.AZURE
+
+    return Processors.LOCAL
+
+
+def build_index(contents: str, version: int) -> CredentialsIndex:
+    customers = {}
+
+    for customer_id, customer_credentials in (yaml.safe_load(contents)['customer_credentials'] or {}).items():
+        all_options = resolve_all_options(customer_credentials or {})
+        options = all_options[0] if all_options else {}
+        customers[customer_id] = CustomerCredentials(
+            processor=resolve_processor(options),
+            options=freeze(options),
+            alternatives=tuple(freeze(alternative) for alternative in all_options[1:]),
+            policy=resolve_policy(customer_credentials or {}),
+        )
+
+    return CredentialsIndex(version=version, customers=MappingProxyType(customers))
+
+
 async def open_yaml(file_path):
+    global index
+
     try:
         async with aiofiles.open(file_path, mode='r') as file:
-            global credentials
-
             contents = await file.read()
-            credentials = yaml.safe_load(contents)['customer_credentials'] or {}
+
+        # parsing a large file would block the event loop
+        index = await asyncio.to_thread(build_index, contents, index.version + 1)
     except Exception as e:
         raise RuntimeError(f'Error loading credentials file: {e}')
 
+    log.info(f'Loaded credentials for {len(index.customers)} customers, version {index.version}')
+
 
 async def open_credentials_yaml():
     await open_yaml(openai_credentials_file)
@@ -46,14 +134,14 @@ async def setup_credentials():
     log.info('Credentials set. Watching for changes...')
 
 
-def get_credentials(customer_id):
-    customer_credentials = credentials.get(customer_id, {}) or {}
-    multiple_credentials = customer_credentials.get('credentialsMap')
+def get_credentials_version() -> int:
+    """Changes every time the credentials are reloaded, so anything derived from them can be invalidated."""
+    return index.version
 
-    if multiple_credentials:
-        result = [val for val in multiple_credentials.values() if val['enabled']]
-        return result[0] if result else {}
 
-    # backwards compatibility
-    customer_credentials.setdefault('type', CredentialsType.OPENAI.value)
-    return customer_credentials
+def get_customer_credentials(customer_id: str | None) -> CustomerCredentials:
+    return index.customers.get(customer_id, default_credentials)
+
+
+def get_credentials(customer_id: str | None) -> Mapping:
+    return get_customer_credentials(customer_id).options
@@ -19,6 +19,7 @@ log_level = os.environ.get('LOG_LEVEL', 'DEBUG').strip().upper()
 supported_modules = {'streaming_whisper'}
 enabled_modules = set(os.environ.get('ENABLED_MODULES', 'streaming_whisper').split(','))
 modules = supported_modules.intersection(enabled_modules)
+preload_modules = tobool(os.environ.get('PRELOAD_MODULES'))
 
 # WebSocket settings
 ws_max_size_bytes = int(os.environ.get('WS_MAX_SIZE_BYTES', 1000000))
@@ -27,10 +28,53 @@ ws_max_ping_interval = int(os.environ.get('WS_MAX_PING_INTERVAL', 30))
 ws_max_ping_timeout = int(os.environ.get('WS_MAX_PING_TIMEOUT', 30))
 whisper_max_connections = int(os.environ.get('WHISPER_MAX_CONNECTIONS', 10))
 whisper_flush_interval = int(os.environ.get('WHISPER_FLUSH_BUFFER_INTERVAL', 2000))
+whisper_return_transcribed_audio = tobool(os.environ.get('WHISPER_RETURN_TRANSCRIBED_AUDIO'))
+whisper_max_speakers = int(os.environ.get('WHISPER_MAX_SPEAKERS', whisper_max_connections * 4))
+whisper_max_backend_sessions = int(os.environ.get('WHISPER_MAX_BACKEND_SESSIONS', whisper_max_speakers * 2))
+whisper_admission_control = tobool(os.environ.get('WHISPER_ADMISSION_CONTROL', 'true'))
+whisper_admission_retry_after = int(os.environ.get('WHISPER_ADMISSION_RETRY_AFTER', 5))
+whisper_backend = os.environ.get('WHISPER_BACKEND', 'fireworks')
+whisper_mock_latency = int(os.environ.get('WHISPER_MOCK_LATENCY_MS', 150))
+fireworks_streaming_url = os.environ.get(
+    'FIREWORKS_STREAMING_URL',
+    'wss://audio-streaming.us-virginia-1.direct.fireworks.ai/v1/audio/transcriptions/streaming',
+)
+whisper_backend_timeout = float(os.environ.get('WHISPER_BACKEND_TIMEOUT', 5))
+whisper_hedge_requests = tobool(os.environ.get('WHISPER_HEDGE_REQUESTS', 'true'))
+whisper_hedge_idle_timeout = float(os.environ.get('WHISPER_HEDGE_IDLE_TIMEOUT', 30))
+whisper_reconnect_max_backoff = float(os.environ.get('WHISPER_RECONNECT_MAX_BACKOFF', 30))
+whisper_circuit_breaker_threshold = int(os.environ.get('WHISPER_CIRCUIT_BREAKER_THRESHOLD', 5))
+whisper_circuit_breaker_reset = float(os.environ.get('WHISPER_CIRCUIT_BREAKER_RESET', 30))
+whisper_fallback_to_local = tobool(os.environ.get('WHISPER_FALLBACK_TO_LOCAL'))
+whisper_adaptive_cadence = tobool(os.environ.get('WHISPER_ADAPTIVE_CADENCE', 'true'))
+whisper_finals_only_load = float(os.environ.get('WHISPER_FINALS_ONLY_LOAD', 0.85))
+whisper_suppress_interims = tobool(os.environ.get('WHISPER_SUPPRESS_INTERIMS', 'true'))
+whisper_max_interim_delay = float(os.environ.get('WHISPER_MAX_INTERIM_DELAY', 3))
+whisper_mixed_max_speakers = int(os.environ.get('WHISPER_MIXED_MAX_SPEAKERS', 8))
+whisper_mixed_speaker_threshold = float(os.environ.get('WHISPER_MIXED_SPEAKER_THRESHOLD', 0.9))
+whisper_segment_log_dir = os.environ.get('WHISPER_SEGMENT_LOG_DIR', '')
+whisper_segment_log_retention = int(os.environ.get('WHISPER_SEGMENT_LOG_RETENTION', 7 * 24 * 3600))
+whisper_context_words = int(os.environ.get('WHISPER_CONTEXT_WORDS', 64))
+whisper_subscriber_queue_size = int(os.environ.get('WHISPER_SUBSCRIBER_QUEUE_SIZE', 100))
+whisper_subscriber_backend = os.environ.get('WHISPER_SUBSCRIBER_BACKEND', 'memory')
+
+# local faster-whisper model, used as a fallback when the backend is unavailable
+beam_size = int(os.environ.get('BEAM_SIZE', 1))
+whisper_model_name = os.environ.get('WHISPER_MODEL_NAME')
+whisper_model_path = os.environ.get('WHISPER_MODEL_PATH', f'{os.getcwd()}/models/streaming_whisper')
+whisper_compute_type = os.environ.get('WHISPER_COMPUTE_TYPE', 'int8')
+whisper_device = os.environ.get('WHISPER_DEVICE', 'auto')
+whisper_gpu_indices = [int(i) for i in os.environ.get('WHISPER_GPU_INDICES', '0').split(',')]
 
 # monitoring
 enable_metrics = tobool(os.environ.get('ENABLE_METRICS'))
+metrics_publish_interval = float(os.environ.get('METRICS_PUBLISH_INTERVAL', 1))
 enable_haproxy_agent = tobool(os.environ.get('ENABLE_HAPROXY_AGENT'))
+haproxy_agent_port = int(os.environ.get('HAPROXY_AGENT_PORT', 8002))
+autoscaler_port = int(os.environ.get('AUTOSCALER_PORT', 8003))
+load_sample_interval = float(os.environ.get('LOAD_SAMPLE_INTERVAL', 1))
+load_ewma_alpha = float(os.environ.get('LOAD_EWMA_ALPHA', 0.3))
+load_max_loop_lag_ms = int(os.environ.get('LOAD_MAX_LOOP_LAG_MS', 200))
 
 # auth
 bypass_auth = tobool(os.environ.get('BYPASS_AUTHORIZATION'))
@@ -39,6 +83,51 @@ asap_pub_keys_folder = os.environ.get('ASAP_PUB_KEYS_FOLDER', '')
 asap_pub_keys_fallback_folder = os.environ.get('ASAP_PUB_KEYS_FALLBACK_FOLDER', '')
 asap_pub_keys_max_cache_size = int(os.environ.get('ASAP_PUB_KEYS_MAX_CACHE_SIZE', '1000'))
 asap_pub_keys_auds = os.environ.get('ASAP_PUB_KEYS_AUDS', '').split(',')
+asap_pub_keys_cache_dir = os.environ.get('ASAP_PUB_KEYS_CACHE_DIR', '')
+asap_pub_keys_ttl = int(os.environ.get('ASAP_PUB_KEYS_TTL', 60 * 60))
+asap_pub_keys_negative_ttl = int(os.environ.get('ASAP_PUB_KEYS_NEGATIVE_TTL', 30))
+asap_pub_keys_max_negative_ttl = int(os.environ.get('ASAP_PUB_KEYS_MAX_NEGATIVE_TTL', 60 * 15))
+asap_verified_tokens_cache_size = int(os.environ.get('ASAP_VERIFIED_TOKENS_CACHE_SIZE', 10000))
+
+# shared http client
+http_client_max_connections = int(os.environ.get('HTTP_CLIENT_MAX_CONNECTIONS', 100))
+http_client_max_connections_per_host = int(os.environ.get('HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST', 10))
+http_client_dns_cache_ttl = int(os.environ.get('HTTP_CLIENT_DNS_CACHE_TTL', 300))
+http_client_keepalive_timeout = float(os.environ.get('HTTP_CLIENT_KEEPALIVE_TIMEOUT', 30))
+http_client_timeout = float(os.environ.get('HTTP_CLIENT_TIMEOUT', 10))
+http_client_connect_timeout = float(os.environ.get('HTTP_CLIENT_CONNECT_TIMEOUT', 3))
+http_client_http2 = tobool(os.environ.get('HTTP_CLIENT_HTTP2'))
+
+# redis
+redis_exp_seconds = int(os.environ.get('REDIS_EXP_SECONDS', 60 * 30))
+redis_host = os.environ.get('REDIS_HOST', 'localhost')
+redis_port = int(os.environ.get('REDIS_PORT', 6379))
+redis_use_tls = tobool(os.environ.get('REDIS_USE_TLS'))
+redis_db_no = int(os.environ.get('REDIS_DB_NO', 0))
+redis_usr = os.environ.get('REDIS_USR')
+redis_pwd = os.environ.get('REDIS_PWD')
+redis_namespace = os.environ.get('REDIS_NAMESPACE', 'skynet')
+
+# summaries job queue
+enable_job_queue = tobool(os.environ.get('ENABLE_JOB_QUEUE'))
+job_timeout = int(os.environ.get('JOB_TIMEOUT', 60 * 10))
+job_queue_workers = int(os.environ.get('JOB_QUEUE_WORKERS', 4))
+job_queue_poll_interval = float(os.environ.get('JOB_QUEUE_POLL_INTERVAL', 0.5))
+job_queue_max_attempts = int(os.environ.get('JOB_QUEUE_MAX_ATTEMPTS', 3))
+job_queue_priorities = os.environ.get('JOB_QUEUE_PRIORITIES', 'summary,summary_and_action_items,action_items').split(',')
+summary_routing_policy = os.environ.get('SUMMARY_ROUTING_POLICY', 'pinned')
+summary_rate_limit_requests = int(os.environ.get('SUMMARY_RATE_LIMIT_REQUESTS', 0))
+summary_rate_limit_tokens = int(os.environ.get('SUMMARY_RATE_LIMIT_TOKENS', 0))
+summary_rate_limit_backend = os.environ.get('SUMMARY_RATE_LIMIT_BACKEND', 'memory')
+
+# extractive compression of the text before it's summarized
+enable_summary_compression = tobool(os.environ.get('ENABLE_SUMMARY_COMPRESSION'))
+summary_compression_budget = int(os.environ.get('SUMMARY_COMPRESSION_BUDGET', 0))
+
+# rolling summaries of live meetings
+enable_rolling_summaries = tobool(os.environ.get('ENABLE_ROLLING_SUMMARIES'))
+rolling_summary_window_tokens = int(os.environ.get('ROLLING_SUMMARY_WINDOW_TOKENS', 2000))
+rolling_summary_retention = int(os.environ.get('ROLLING_SUMMARY_RETENTION', 60 * 60))
 
 # Fireworks.ai settings
 fireworks_api_key = os.environ.get('FIREWORKS_API_KEY')
@@ -1,13 +1,12 @@
 import asyncio
-import math
 
 from fastapi import FastAPI, Request
 from pydantic import BaseModel
 
-from skynet.env import whisper_max_connections
-
+from skynet.env import modules
 from skynet.logs import get_logger
-from skynet.modules.monitoring import CONNECTIONS_METRIC, TRANSCRIBE_GRACEFUL_SHUTDOWN, TRANSCRIBE_STRESS_LEVEL_METRIC
+from skynet.modules.load_monitor import load_monitor
+from skynet.modules.monitoring import graceful_shutdown, live_connections
 
 log = get_logger(__name__)
 
@@ -16,17 +15,13 @@ log = get_logger(__name__)
 # bound to the REST API server as the latter will inform HAProxy if the system was set to drain mode.
 
 autoscaler_rest_app = FastAPI()
-TRANSCRIBE_GRACEFUL_SHUTDOWN.set(0)
 haproxy_state = 'ready'
+# the event loop only keeps weak references to the tasks
+drain_tasks: set[asyncio.Task] = set()
 
 
 def get_haproxy_lb_percentage():
-    conns = CONNECTIONS_METRIC._value.get()
-    perc = int(math.floor(conns * 100 / whisper_max_connections))
-    inverted = 100 - perc
-    if inverted <= 0:
-        return 1
-    return int(inverted)
+    return load_monitor.get_lb_percentage()
 
 
 async def handle_tcp_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
@@ -43,13 +38,18 @@ async def handle_tcp_request(reader: asyncio.StreamReader, writer: asyncio.Strea
             log.debug('HAProxy agent socket closed.')
 
 
-async def create_tcpserver(port):
+async def create_tcpserver(port: int) -> asyncio.Server:
     tcpserver = await asyncio.start_server(handle_tcp_request, '0.0.0.0', port)
     log.info(f'HaProxy Agent Check TCP Server listening on 0.0.0.0:{port}')
-    try:
-        await tcpserver.serve_forever()
-    except KeyboardInterrupt:
-        tcpserver.close()
+
+    return tcpserver
+
+
+def on_drained(task: asyncio.Task):
+    drain_tasks.discard(task)
+
+    if not task.cancelled() and task.exception() is not None:
+        log.error(f'Failed to drain the node: {task.exception()}')
 
 
 # Endpoints for the autoscaler to query the current state of the system
@@ -63,6 +63,8 @@ class CurrentStateResponse(BaseModel):
     state: str
     connections: int
     stress_level: float
+    load_components: dict[str, float]
+    lb_percentage: int
     graceful_shutdown: bool
 
 
@@ -77,7 +79,21 @@ async def set_state(request: Request):
         haproxy_state = payload['state'].strip()
 
         if haproxy_state == 'drain':
-            TRANSCRIBE_GRACEFUL_SHUTDOWN.set(1)
+            graceful_shutdown.set(1)
+
+            if 'streaming_whisper' in modules:
+                from skynet.modules.stt.streaming_whisper.app import ws_connection_manager
+
+                task = asyncio.create_task(ws_connection_manager.drain())
+                drain_tasks.add(task)
+                task.add_done_callback(on_drained)
+        elif haproxy_state == 'ready':
+            graceful_shutdown.set(0)
+
+            if 'streaming_whisper' in modules:
+                from skynet.modules.stt.streaming_whisper.app import ws_connection_manager
+
+                ws_connection_manager.resume()
 
         return UpdateStateResponse(
             request_status='success',
@@ -93,7 +109,9 @@ async def set_state(request: Request):
 async def get_state(request: Request):
     return CurrentStateResponse(
         state=haproxy_state,
-        connections=CONNECTIONS_METRIC._value.get(),
-        stress_level=TRANSCRIBE_STRESS_LEVEL_METRIC._value.get(),
-        graceful_shutdown=bool(TRANSCRIBE_GRACEFUL_SHUTDOWN._value.get()),
+        connections=int(live_connections.get()),
+        stress_level=load_monitor.get_load(),
+        load_components=load_monitor.components,
+        lb_percentage=get_haproxy_lb_percentage(),
+        graceful_shutdown=bool(graceful_shutdown.get()),
     )
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+
+class TestHaproxyAgent:
+    @pytest.mark.asyncio
+    async def test_agent_check(self):
+        '''Test that the agent check server answers with the state and the weight of the node.'''
+
+        from skynet.haproxy_agent import create_tcpserver
+
+        tcpserver = await create_tcpserver(0)
+        port = tcpserver.sockets[0].getsockname()[1]
+
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            response = await reader.read()
+            writer.close()
+        finally:
+            tcpserver.close()
+            await tcpserver.wait_closed()
+
+        assert response.decode().startswith('up ready ')
+
+    @pytest.mark.asyncio
+    async def test_state(self):
+        '''Test that the autoscaler API reports the state of the node.'''
+
+        from skynet.haproxy_agent import get_state
+
+        assert (await get_state(None)).state == 'ready'
+
+    @pytest.mark.asyncio
+    async def test_ready_after_drain(self, mocker):
+        '''Test that a node set back to ready accepts new meetings again.'''
+
+        from skynet.haproxy_agent import drain_tasks, set_state
+        from skynet.modules.stt.streaming_whisper.app import ws_connection_manager
+
+        mocker.patch('skynet.haproxy_agent.modules', {'streaming_whisper'})
+        drain = mocker.patch.object(ws_connection_manager, 'drain')
+        request = mocker.AsyncMock()
+
+        request.json.return_value = {'state': 'drain'}
+        await set_state(request)
+        await asyncio.gather(*drain_tasks)
+        ws_connection_manager.draining = True
+        drain.assert_called_once()
+        assert not drain_tasks
+
+        request.json.return_value = {'state': 'ready'}
+        assert (await set_state(request)).new_state == 'ready'
+        assert not ws_connection_manager.draining
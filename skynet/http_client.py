@@ -2,22 +2,129 @@
 Simple async HTTP client with a shared session. We are not going to
 make requests to an arbitrarily large amount of domains so using a single
 session is OK.
-"""
 
-import aiohttp
+The session keeps a pool of at most `HTTP_CLIENT_MAX_CONNECTIONS` connections, `HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST`
+to the same host, kept alive for `HTTP_CLIENT_KEEPALIVE_TIMEOUT` seconds, and caches DNS lookups for
+`HTTP_CLIENT_DNS_CACHE_TTL` seconds. Requests time out after `HTTP_CLIENT_TIMEOUT` seconds. The responses are read
+and their connection released before being returned, so callers can't leak connections from the pool.
+
+With `HTTP_CLIENT_HTTP2` enabled, the requests made with `http2=True`, e.g. the public key fetches, share a single
+HTTP/2 connection per host instead, made with httpx.
+
+The session is started by the app lifespan when something needs it, and otherwise with the first request. aiohttp and
+httpx are only imported then, most deployments never make a request.
+"""
 
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Mapping
+
+from skynet.env import (
+    http_client_connect_timeout,
+    http_client_dns_cache_ttl,
+    http_client_http2,
+    http_client_keepalive_timeout,
+    http_client_max_connections,
+    http_client_max_connections_per_host,
+    http_client_timeout,
+)
 
 _session = None
+_http2_client = None
+
+
+@dataclass
+class Response:
+    status: int
+    body: bytes
+    headers: Mapping[str, str] = field(default_factory=dict)
+
+    def text(self, encoding: str = 'utf-8') -> str:
+        return self.body.decode(encoding)
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+def _get_trace_config():
+    import aiohttp
+
+    from skynet.modules.monitoring import http_client_connections, http_client_inflight_requests, http_client_queue_time
+
+    async def on_request_start(session, context, params):
+        http_client_inflight_requests.inc()
+
+    async def on_request_end(session, context, params):
+        http_client_inflight_requests.dec()
+
+    async def on_connection_queued_start(session, context, params):
+        context.queued_at = time.perf_counter()
+
+    async def on_connection_queued_end(session, context, params):
+        http_client_queue_time.observe(time.perf_counter() - context.queued_at)
+
+    async def on_connection_create_end(session, context, params):
+        http_client_connections['created'].inc()
+
+    async def on_connection_reuseconn(session, context, params):
+        http_client_connections['reused'].inc()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_end)
+    trace_config.on_connection_queued_start.append(on_connection_queued_start)
+    trace_config.on_connection_queued_end.append(on_connection_queued_end)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+
+    return trace_config
 
 
 def _get_session():
     global _session
 
     if _session is None:
-        _session = aiohttp.ClientSession()
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(
+            limit=http_client_max_connections,
+            limit_per_host=http_client_max_connections_per_host,
+            ttl_dns_cache=http_client_dns_cache_ttl,
+            keepalive_timeout=http_client_keepalive_timeout,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=http_client_timeout, connect=http_client_connect_timeout),
+            trace_configs=[_get_trace_config()],
+        )
     return _session
 
 
+def _get_http2_client():
+    global _http2_client
+
+    if _http2_client is None:
+        import httpx
+
+        _http2_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(http_client_timeout, connect=http_client_connect_timeout),
+            limits=httpx.Limits(
+                max_connections=http_client_max_connections,
+                keepalive_expiry=http_client_keepalive_timeout,
+            ),
+        )
+    return _http2_client
+
+
+async def start():
+    _get_session()
+    if http_client_http2:
+        _get_http2_client()
+
+
 async def get(url, type='json', **kwargs):
     session = _get_session()
     async with session.get(url, **kwargs) as response:
@@ -33,19 +140,28 @@ async def post(url, **kwargs):
         return await response.json()
 
 
-async def request(method, url, **kwargs) -> aiohttp.ClientResponse:
-    session = _get_session()
+async def request(method, url, http2=False, **kwargs) -> Response:
+    if http2 and http_client_http2:
+        response = await _get_http2_client().request(method, url, **kwargs)
+        return Response(response.status_code, response.content, response.headers)
 
-    return await session.request(method, url, **kwargs)
+    session = _get_session()
+    async with session.request(method, url, **kwargs) as response:
+        return Response(response.status, await response.read(), response.headers)
 
 
 async def close():
-    global _session
+    global _session, _http2_client
 
     if _session is not None:
         await _session.close()
 
         _session = None
 
+    if _http2_client is not None:
+        await _http2_client.aclose()
+
+        _http2_client = None
+
 
-__all__ = ['close', 'get', 'post', 'request']
+__all__ = ['close', 'get', 'post', 'request', 'Response', 'start']
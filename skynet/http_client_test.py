@@ -0,0 +1,70 @@
+import pytest
+from aiohttp import web
+
+
+class TestHttpClient:
+    @pytest.mark.asyncio
+    async def test_request(self, mocker):
+        '''Test that a response is read and its connection released back to the pool for the next request.'''
+
+        from skynet import http_client
+        from skynet.modules.monitoring import http_client_connections
+
+        async def handler(request):
+            return web.Response(text='key')
+
+        app = web.Application()
+        app.router.add_get('/key', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        url = f'http://127.0.0.1:{runner.addresses[0][1]}/key'
+
+        created = mocker.patch.object(http_client_connections['created'], 'inc')
+        reused = mocker.patch.object(http_client_connections['reused'], 'inc')
+
+        try:
+            response = await http_client.request('GET', url)
+            assert response.status == 200
+            assert response.text() == 'key'
+
+            response = await http_client.request('GET', url, http2=True)
+            assert response.text() == 'key'
+        finally:
+            await http_client.close()
+            await runner.cleanup()
+
+        created.assert_called_once()
+        reused.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_http2(self, mocker):
+        '''Test that the requests asking for HTTP/2 go through the httpx client when it's enabled.'''
+
+        from skynet import http_client
+
+        async def handler(request):
+            return web.Response(text='key')
+
+        app = web.Application()
+        app.router.add_get('/key', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        url = f'http://127.0.0.1:{runner.addresses[0][1]}/key'
+
+        mocker.patch.object(http_client, 'http_client_http2', True)
+        session = mocker.patch.object(http_client, '_get_session')
+
+        try:
+            await http_client.start()
+            response = await http_client.request('GET', url, http2=True)
+            assert response.status == 200
+            assert response.text() == 'key'
+            assert http_client._http2_client is not None
+        finally:
+            await http_client.close()
+            await runner.cleanup()
+
+        assert http_client._http2_client is None
+        session.return_value.request.assert_not_called()
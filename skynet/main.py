@@ -7,8 +7,17 @@ from fastapi import FastAPI
 from fastapi.responses import FileResponse
 
 from skynet import http_client
-from skynet.env import app_port, enable_haproxy_agent, enable_metrics, modules
-from skynet.haproxy_agent import create_tcpserver
+from skynet.env import (
+    app_port,
+    autoscaler_port,
+    bypass_auth,
+    enable_haproxy_agent,
+    enable_job_queue,
+    enable_metrics,
+    haproxy_agent_port,
+    modules,
+    preload_modules,
+)
 from skynet.logs import get_logger
 from skynet.utils import create_app, create_webserver
 
@@ -25,35 +34,67 @@ log.info('Using CPU')
 async def lifespan(main_app: FastAPI):
     log.info('Skynet became self aware')
 
+    # only the public key fetches use it
+    if not bypass_auth:
+        await http_client.start()
+
     if 'streaming_whisper' in modules:
         from skynet.modules.stt.streaming_whisper.app import app as streaming_whisper_app
         main_app.mount('/streaming-whisper', streaming_whisper_app)
 
+        from skynet.modules.load_monitor import load_monitor
+        load_monitor.start()
+
+    if enable_job_queue:
+        from skynet.modules.ttt.job_queue import job_queue
+        job_queue.start()
+
     if enable_metrics:
         from skynet.metrics import metrics
+        from skynet.modules.monitoring import publisher
         main_app.mount('/metrics', metrics)
+        publisher.start()
 
     yield
 
+    if enable_job_queue:
+        await job_queue.stop()
+
+    if enable_metrics:
+        publisher.flush()
+
+    await http_client.close()
+
 app = create_app(lifespan=lifespan)
 
 @app.get('/')
 def root():
     return FileResponse('demos/streaming-whisper/index.html')
 
+def warmup():
+    '''
+    Imports the enabled modules and loads their models before the server starts listening, so a new worker only gets
+    traffic once it can serve it right away. Everything else is imported when first needed.
+    '''
+    if 'streaming_whisper' in modules:
+        from skynet.modules.stt.streaming_whisper.app import warmup as streaming_whisper_warmup
+        streaming_whisper_warmup()
+
 async def main():
+    if preload_modules:
+        warmup()
+
     server = await create_webserver(app, port=app_port)
-    
+    servers = [server.serve()]
+
     if enable_haproxy_agent:
-        tcpserver = await create_tcpserver()
-    
-    try:
-        await asyncio.gather(
-            server.serve(),
-            *([] if not enable_haproxy_agent else [tcpserver.serve()])
-        )
-    finally:
-        await http_client.close()
+        from skynet.haproxy_agent import autoscaler_rest_app, create_tcpserver
+        tcpserver = await create_tcpserver(haproxy_agent_port)
+        autoscaler_server = await create_webserver(autoscaler_rest_app, port=autoscaler_port)
+        # started first, so that the main server hands the shutdown signal over to it once it stopped
+        servers = [autoscaler_server.serve(), *servers, tcpserver.serve_forever()]
+
+    await asyncio.gather(*servers)
 
 if __name__ == "__main__":
     try:
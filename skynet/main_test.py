@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+# seconds a worker may spend importing what it needs to accept websockets
+IMPORT_TIME_BUDGET = 1.0
+
+
+def get_import_times(*modules: str) -> dict[str, float]:
+    '''Imports `modules` in a new interpreter and returns the cumulative import time, in seconds, of every module.'''
+
+    code = '; '.join(f'import {module}' for module in modules)
+    env = {**os.environ, 'ENABLED_MODULES': 'streaming_whisper', 'ENABLE_METRICS': 'false', 'ENABLE_HAPROXY_AGENT': ''}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], env=env, capture_output=True, text=True, check=True
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative) / 1e6
+
+    return times
+
+
+class TestImportTime:
+    def test_lazy_imports(self):
+        '''Test that the modules which aren't needed to start serving aren't imported.'''
+
+        times = get_import_times('skynet.main')
+
+        for module in (
+            'aiohttp',
+            'faster_whisper',
+            'langchain',
+            'openai',
+            'skynet.haproxy_agent',
+            'skynet.metrics',
+            'skynet.modules.stt.streaming_whisper.app',
+            'skynet.modules.ttt.processor',
+        ):
+            assert module not in times
+
+    def test_budget(self):
+        '''Test that a worker imports everything it needs to accept websockets within the budget.'''
+
+        # the first import compiles the modules changed since the last run, which a deployed worker doesn't do
+        get_import_times('skynet.main', 'skynet.modules.stt.streaming_whisper.app')
+        times = get_import_times('skynet.main', 'skynet.modules.stt.streaming_whisper.app')
+
+        assert times['skynet.main'] + times['skynet.modules.stt.streaming_whisper.app'] < IMPORT_TIME_BUDGET
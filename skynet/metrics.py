@@ -25,3 +25,6 @@ if enable_metrics:
             streaming_whisper_app,
             prefix=f'{PROMETHEUS_NAMESPACE}_{PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM}'
         )
+
+    # aggregates the metrics of all the workers when PROMETHEUS_MULTIPROC_DIR is set
+    instrumentator.expose(metrics, endpoint='/')
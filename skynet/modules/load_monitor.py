@@ -0,0 +1,122 @@
+"""
+Estimates how loaded this node is from the work it is actually doing, not just from how many connections it holds.
+
+Every `LOAD_SAMPLE_INTERVAL` seconds the monitor collects signals from the registered sources, measures how late the
+event loop woke up and how much CPU the process used, and turns each signal into a utilisation between 0 and 1. The
+most utilised resource determines the load of the node, which is then smoothed with an EWMA so a short burst doesn't
+make HAProxy move traffic back and forth.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from skynet.env import (
+    load_ewma_alpha,
+    load_max_loop_lag_ms,
+    load_sample_interval,
+    whisper_max_connections,
+    whisper_max_speakers,
+)
+from skynet.logs import get_logger
+from skynet.modules.monitoring import event_loop_lag, stress_level
+
+log = get_logger(__name__)
+
+
+@dataclass
+class LoadSignals:
+    connections: int = 0
+    speaking_participants: int = 0
+    inflight_transcriptions: int = 0
+    pending_transcriptions: int = 0
+
+    def __add__(self, other: 'LoadSignals') -> 'LoadSignals':
+        return LoadSignals(
+            connections=self.connections + other.connections,
+            speaking_participants=self.speaking_participants + other.speaking_participants,
+            inflight_transcriptions=self.inflight_transcriptions + other.inflight_transcriptions,
+            pending_transcriptions=self.pending_transcriptions + other.pending_transcriptions,
+        )
+
+
+class LoadMonitor:
+    sources: list[Callable[[], LoadSignals]]
+    components: dict[str, float]
+    load: float
+
+    def __init__(self, interval: float = load_sample_interval, alpha: float = load_ewma_alpha):
+        self.interval = interval
+        self.alpha = alpha
+        self.sources = []
+        self.components = {}
+        self.load = 0.0
+        self.task = None
+
+    def register_source(self, source: Callable[[], LoadSignals]):
+        self.sources.append(source)
+
+    def collect(self) -> LoadSignals:
+        signals = LoadSignals()
+
+        for source in self.sources:
+            try:
+                signals += source()
+            except Exception as e:
+                log.warning(f'Failed to collect load signals: {e}')
+
+        return signals
+
+    def get_components(self, signals: LoadSignals, loop_lag: float, cpu: float) -> dict[str, float]:
+        return {
+            'connections': signals.connections / whisper_max_connections,
+            'speaking_participants': signals.speaking_participants / whisper_max_speakers,
+            # every in-flight or pending transcription holds a backend session
+            'transcriptions': (signals.inflight_transcriptions + signals.pending_transcriptions) / whisper_max_speakers,
+            'loop_lag': loop_lag * 1000 / load_max_loop_lag_ms,
+            'cpu': cpu,
+        }
+
+    def update(self, signals: LoadSignals, loop_lag: float, cpu: float) -> float:
+        self.components = {
+            name: min(max(value, 0.0), 1.0) for name, value in self.get_components(signals, loop_lag, cpu).items()
+        }
+        self.load = self.alpha * max(self.components.values()) + (1 - self.alpha) * self.load
+        stress_level.set(self.load)
+
+        return self.load
+
+    def get_load(self) -> float:
+        return self.load
+
+    def get_lb_percentage(self) -> int:
+        """The weight HAProxy should give this node, between 1 and 100."""
+        return max(1, int(100 - self.load * 100))
+
+    async def run(self):
+        last_wall = time.perf_counter()
+        last_cpu = time.process_time()
+
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            cpu_now = time.process_time()
+
+            loop_lag = max(0.0, now - expected)
+            event_loop_lag.set(loop_lag)
+            # the event loop runs on a single core, so that's the capacity we compare against
+            cpu = (cpu_now - last_cpu) / (now - last_wall)
+            last_wall, last_cpu = now, cpu_now
+
+            self.update(self.collect(), loop_lag, cpu)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+
+load_monitor = LoadMonitor()
+
+__all__ = ['LoadMonitor', 'LoadSignals', 'load_monitor']
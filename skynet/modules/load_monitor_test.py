@@ -0,0 +1,40 @@
+from skynet.modules.load_monitor import LoadMonitor, LoadSignals
+
+
+class TestLoadMonitor:
+    def test_busiest_resource_drives_the_load(self, mocker):
+        '''Test that the load follows the most utilised resource and not the connection count.'''
+
+        mocker.patch('skynet.modules.load_monitor.whisper_max_connections', 10)
+        mocker.patch('skynet.modules.load_monitor.whisper_max_speakers', 20)
+
+        monitor = LoadMonitor(alpha=1)
+        monitor.update(LoadSignals(connections=1, speaking_participants=15), loop_lag=0, cpu=0.1)
+
+        assert monitor.get_load() == 0.75
+        assert monitor.get_lb_percentage() == 25
+
+    def test_load_is_smoothed(self, mocker):
+        '''Test that a single spike only moves the load by alpha.'''
+
+        monitor = LoadMonitor(alpha=0.5)
+        monitor.update(LoadSignals(), loop_lag=0, cpu=1)
+
+        assert monitor.get_load() == 0.5
+
+    def test_lb_percentage_is_never_zero(self):
+        '''Test that a saturated node still reports a weight HAProxy accepts.'''
+
+        monitor = LoadMonitor(alpha=1)
+        monitor.update(LoadSignals(), loop_lag=10, cpu=2)
+
+        assert monitor.get_lb_percentage() == 1
+
+    def test_collect_sums_sources(self):
+        '''Test that the signals from all sources are added up.'''
+
+        monitor = LoadMonitor()
+        monitor.register_source(lambda: LoadSignals(connections=1, inflight_transcriptions=2))
+        monitor.register_source(lambda: LoadSignals(connections=2, pending_transcriptions=1))
+
+        assert monitor.collect() == LoadSignals(connections=3, inflight_transcriptions=2, pending_transcriptions=1)
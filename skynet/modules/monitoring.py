@@ -1,14 +1,25 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
 from prometheus_client import Counter, Gauge, Histogram
 from prometheus_fastapi_instrumentator import Instrumentator, metrics
 
+from skynet.env import enable_metrics, metrics_publish_interval
+from skynet.logs import get_logger
+
+log = get_logger(__name__)
+
 PROMETHEUS_NAMESPACE = 'Skynet'
 PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM = 'Streaming_Whisper'
+PROMETHEUS_SUMMARIES_SUBSYSTEM = 'Summaries'
 
 CONNECTIONS_METRIC = Gauge(
     'LiveWsConnections',
     documentation='Number of active WS connections',
     namespace=PROMETHEUS_NAMESPACE,
     subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    multiprocess_mode='livesum',
 )
 
 TRANSCRIBE_GRACEFUL_SHUTDOWN = Gauge(
@@ -16,6 +27,7 @@ TRANSCRIBE_GRACEFUL_SHUTDOWN = Gauge(
     documentation='Indicates if the transcriber is in the process of shutting down gracefully',
     namespace=PROMETHEUS_NAMESPACE,
     subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    multiprocess_mode='livemax',
 )
 
 TRANSCRIBE_STRESS_LEVEL_METRIC = Gauge(
@@ -23,6 +35,7 @@ TRANSCRIBE_STRESS_LEVEL_METRIC = Gauge(
     documentation='Whisper stress level',
     namespace=PROMETHEUS_NAMESPACE,
     subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    multiprocess_mode='livemax',
 )
 
 TRANSCRIBE_CONNECTIONS_COUNTER = Counter(
@@ -40,6 +53,414 @@ TRANSCRIBE_DURATION_METRIC = Histogram(
     buckets=[x / 10.0 for x in range(1, 31)],
 )
 
+TRANSCRIBE_STAGE_DURATION_METRIC = Histogram(
+    'WhisperStageDuration',
+    documentation='Measures the duration of each stage of the streaming path in seconds',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5],
+    labelnames=['stage'],
+)
+
+TRANSCRIBE_END_TO_END_LATENCY_METRIC = Histogram(
+    'WhisperEndToEndLatency',
+    documentation='Measures the time from receiving the audio of a transcription to sending it in seconds',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    buckets=[0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4, 5, 7.5, 10],
+    labelnames=['type'],
+)
+
+TRANSCRIBE_BACKEND_TIMEOUTS_COUNTER = Counter(
+    'WhisperBackendTimeouts',
+    documentation='Number of transcription requests that missed their deadline',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+)
+
+TRANSCRIBE_BACKEND_RECONNECTS_COUNTER = Counter(
+    'WhisperBackendReconnects',
+    documentation='Number of times a connection to the transcription backend was re-established',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+)
+
+TRANSCRIBE_BACKEND_HEDGED_COUNTER = Counter(
+    'WhisperBackendHedgedRequests',
+    documentation='Number of transcription requests also sent to a second connection, labeled by the one that answered',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    labelnames=['winner'],
+)
+
+TRANSCRIBE_CIRCUIT_BREAKER_STATE_METRIC = Gauge(
+    'WhisperCircuitBreakerState',
+    documentation='State of the transcription backend circuit breaker, 0 closed, 1 half open, 2 open',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    multiprocess_mode='livemax',
+)
+
+TRANSCRIBE_SUPPRESSED_INTERIMS_COUNTER = Counter(
+    'WhisperSuppressedInterims',
+    documentation='Number of interim requests skipped for lack of new speech, and of unchanged interims not sent',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    labelnames=['reason'],
+)
+
+TRANSCRIBE_FINALS_ONLY_METRIC = Gauge(
+    'WhisperFinalsOnlyParticipants',
+    documentation='Number of participants only getting final transcriptions because the node is under pressure',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    multiprocess_mode='livesum',
+)
+
+TRANSCRIBE_FALLBACK_COUNTER = Counter(
+    'WhisperFallbackTranscriptions',
+    documentation='Number of transcriptions done by the local model while the circuit breaker was open',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+)
+
+TRANSCRIBE_REJECTED_CONNECTIONS_COUNTER = Counter(
+    'WhisperRejectedConnections',
+    documentation='Number of meetings turned away, because the node was draining or ran out of the labeled resource',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    labelnames=['reason'],
+)
+
+TRANSCRIBE_BACKEND_SESSIONS_METRIC = Gauge(
+    'WhisperBackendSessions',
+    documentation='Number of sessions open with the transcription backend',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    multiprocess_mode='livesum',
+)
+
+TRANSCRIBE_SUBSCRIBERS_METRIC = Gauge(
+    'WhisperSubscribers',
+    documentation='Number of read-only subscribers to the transcriptions of the meetings',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+    multiprocess_mode='livesum',
+)
+
+TRANSCRIBE_DROPPED_SUBSCRIBERS_COUNTER = Counter(
+    'WhisperDroppedSubscribers',
+    documentation='Number of subscribers disconnected for falling too far behind',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_STREAMING_WHISPER_SUBSYSTEM,
+)
+
+EVENT_LOOP_LAG_METRIC = Gauge(
+    'event_loop_lag_seconds',
+    documentation='How late the event loop woke up from a sleep during the last load sample',
+    namespace=PROMETHEUS_NAMESPACE,
+    multiprocess_mode='livemax',
+)
+
+HTTP_CLIENT_INFLIGHT_REQUESTS_METRIC = Gauge(
+    'http_client_inflight_requests',
+    documentation='Number of requests of the shared HTTP client waiting for a response',
+    namespace=PROMETHEUS_NAMESPACE,
+    multiprocess_mode='livesum',
+)
+
+HTTP_CLIENT_CONNECTIONS_COUNTER = Counter(
+    'http_client_connections',
+    documentation='Number of connections the shared HTTP client opened, or reused from its pool',
+    namespace=PROMETHEUS_NAMESPACE,
+    labelnames=['type'],
+)
+
+HTTP_CLIENT_QUEUE_TIME_METRIC = Histogram(
+    'http_client_queue_time_seconds',
+    documentation='Time requests of the shared HTTP client waited for a connection of the full pool',
+    namespace=PROMETHEUS_NAMESPACE,
+    buckets=[0.01, 0.05, 0.1, 0.5, 1, 5],
+)
+
+SUMMARY_QUEUE_SIZE_METRIC = Gauge(
+    'summary_queue_size',
+    documentation='Number of jobs in the queue',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    labelnames=['type'],
+)
+
+SUMMARY_QUEUE_TIME_METRIC = Histogram(
+    'summary_queue_time_seconds',
+    documentation='Measures the time spent in the queue in seconds',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    buckets=[1, 5, 25, 125, 625],
+    labelnames=['type'],
+)
+
+SUMMARY_DURATION_METRIC = Histogram(
+    'summary_duration_seconds',
+    documentation='Measures the duration of the summary / action items inference in seconds',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    buckets=[1, 5, 25, 125],
+    labelnames=['type'],
+)
+
+SUMMARY_RUNNING_JOBS_METRIC = Gauge(
+    'summary_running_jobs',
+    documentation='Number of jobs currently being processed by this worker',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    multiprocess_mode='livesum',
+)
+
+SUMMARY_REQUEUED_JOBS_COUNTER = Counter(
+    'summary_requeued_jobs',
+    documentation='Number of jobs put back in the queue after their visibility timeout expired',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+)
+
+SUMMARY_COMPRESSION_DURATION_METRIC = Histogram(
+    'summary_compression_duration_seconds',
+    documentation='Measures the duration of the extractive compression of the text in seconds',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    buckets=[0.01, 0.05, 0.25, 1, 5],
+)
+
+SUMMARY_COMPRESSION_RATIO_METRIC = Histogram(
+    'summary_compression_ratio',
+    documentation='Number of tokens of the compressed text relative to the original text',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    buckets=[0.25, 0.5, 0.75, 0.9, 1],
+)
+
+SUMMARY_COMPRESSION_SAVED_TOKENS_COUNTER = Counter(
+    'summary_compression_saved_tokens',
+    documentation='Number of input tokens removed by the extractive compression',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+)
+
+SUMMARY_ROUTED_JOBS_COUNTER = Counter(
+    'summary_routed_jobs',
+    documentation='Number of jobs sent to each processor, by the routing policy of their customer',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    labelnames=['processor', 'policy'],
+)
+
+SUMMARY_SPILLED_JOBS_COUNTER = Counter(
+    'summary_spilled_jobs',
+    documentation='Number of jobs sent to another processor than the one configured for their customer',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    labelnames=['processor', 'reason'],
+)
+
+SUMMARY_BACKEND_INFLIGHT_METRIC = Gauge(
+    'summary_backend_inflight_jobs',
+    documentation='Number of jobs running on each processor',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    labelnames=['processor'],
+    multiprocess_mode='livesum',
+)
+
+SUMMARY_BACKEND_THROUGHPUT_METRIC = Gauge(
+    'summary_backend_throughput',
+    documentation='Moving average of the characters of input text processed per second by each processor',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    labelnames=['processor'],
+    multiprocess_mode='livemax',
+)
+
+SUMMARY_BACKEND_ERROR_RATE_METRIC = Gauge(
+    'summary_backend_error_rate',
+    documentation='Moving average of the fraction of failed jobs on each processor',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+    labelnames=['processor'],
+    multiprocess_mode='livemax',
+)
+
+SUMMARY_RATE_LIMITED_JOBS_COUNTER = Counter(
+    'summary_rate_limited_jobs',
+    documentation='Number of jobs deferred because their customer exceeded its request or token rate limit',
+    namespace=PROMETHEUS_NAMESPACE,
+    subsystem=PROMETHEUS_SUMMARIES_SUBSYSTEM,
+)
+
 instrumentator = Instrumentator(
     excluded_handlers=["/healthz", "/metrics"],
 )
+
+
+# Metrics updated on the hot path of the event loop go through the buffered wrappers below. They only touch plain
+# python values, which is safe without locks as long as only the event loop touches them: every
+# `METRICS_PUBLISH_INTERVAL` seconds the publisher takes a snapshot of the pending values on the event loop, then
+# publishes the snapshot into the prometheus_client metrics from a worker thread. In multiprocess mode
+# (`PROMETHEUS_MULTIPROC_DIR` set) prometheus_client then aggregates the published values of all the workers.
+
+
+class BufferedCounter:
+    def __init__(self, counter: Counter, *labels: str):
+        self.metric = counter.labels(*labels) if labels else counter
+        self.pending = 0
+
+    def inc(self, amount: float = 1):
+        self.pending += amount
+
+    def snapshot(self) -> float:
+        pending, self.pending = self.pending, 0
+        return pending
+
+    def publish(self, pending: float):
+        if pending:
+            self.metric.inc(pending)
+
+    def flush(self):
+        self.publish(self.snapshot())
+
+
+class BufferedGauge:
+    def __init__(self, gauge: Gauge, *labels: str):
+        self.metric = gauge.labels(*labels) if labels else gauge
+        self.value = 0.0
+        self.published = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def get(self) -> float:
+        return self.value
+
+    def snapshot(self) -> float:
+        return self.value
+
+    def publish(self, value: float):
+        if value != self.published:
+            self.metric.set(value)
+            self.published = value
+
+    def flush(self):
+        self.publish(self.snapshot())
+
+
+class BufferedHistogram:
+    def __init__(self, histogram: Histogram, *labels: str):
+        self.metric = histogram.labels(*labels) if labels else histogram
+        self.values = []
+
+    def observe(self, value: float):
+        if enable_metrics:
+            self.values.append(value)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> list[float]:
+        values, self.values = self.values, []
+        return values
+
+    def publish(self, values: list[float]):
+        for value in values:
+            self.metric.observe(value)
+
+    def flush(self):
+        self.publish(self.snapshot())
+
+
+class MetricsPublisher:
+    def __init__(self, interval: float = metrics_publish_interval):
+        self.interval = interval
+        self.metrics: list[BufferedCounter | BufferedGauge | BufferedHistogram] = []
+        self.task = None
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> list[tuple]:
+        return [(metric, metric.snapshot()) for metric in self.metrics]
+
+    def publish(self, snapshots: list[tuple]):
+        for metric, snapshot in snapshots:
+            metric.publish(snapshot)
+
+    def flush(self):
+        self.publish(self.snapshot())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # only the publishing runs in the thread, the event loop keeps updating the metrics meanwhile
+                await asyncio.to_thread(self.publish, self.snapshot())
+            except Exception as e:
+                log.warning(f'Failed to publish metrics: {e}')
+
+    def start(self):
+        if enable_metrics and self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+
+publisher = MetricsPublisher()
+
+live_connections = publisher.register(BufferedGauge(CONNECTIONS_METRIC))
+graceful_shutdown = publisher.register(BufferedGauge(TRANSCRIBE_GRACEFUL_SHUTDOWN))
+stress_level = publisher.register(BufferedGauge(TRANSCRIBE_STRESS_LEVEL_METRIC))
+event_loop_lag = publisher.register(BufferedGauge(EVENT_LOOP_LAG_METRIC))
+connections_counter = publisher.register(BufferedCounter(TRANSCRIBE_CONNECTIONS_COUNTER))
+transcription_duration = publisher.register(BufferedHistogram(TRANSCRIBE_DURATION_METRIC))
+stage_durations = {
+    stage: publisher.register(BufferedHistogram(TRANSCRIBE_STAGE_DURATION_METRIC, stage))
+    for stage in ['ingest', 'decode', 'vad', 'queue', 'backend', 'post_process', 'send']
+}
+backend_timeouts = publisher.register(BufferedCounter(TRANSCRIBE_BACKEND_TIMEOUTS_COUNTER))
+backend_reconnects = publisher.register(BufferedCounter(TRANSCRIBE_BACKEND_RECONNECTS_COUNTER))
+hedged_requests = {
+    winner: publisher.register(BufferedCounter(TRANSCRIBE_BACKEND_HEDGED_COUNTER, winner))
+    for winner in ['primary', 'hedge', 'none']
+}
+circuit_breaker_state = publisher.register(BufferedGauge(TRANSCRIBE_CIRCUIT_BREAKER_STATE_METRIC))
+fallback_transcriptions = publisher.register(BufferedCounter(TRANSCRIBE_FALLBACK_COUNTER))
+finals_only_participants = publisher.register(BufferedGauge(TRANSCRIBE_FINALS_ONLY_METRIC))
+backend_sessions = publisher.register(BufferedGauge(TRANSCRIBE_BACKEND_SESSIONS_METRIC))
+rejected_connections = {
+    reason: publisher.register(BufferedCounter(TRANSCRIBE_REJECTED_CONNECTIONS_COUNTER, reason))
+    for reason in ['draining', 'meetings', 'participants', 'backend_sessions']
+}
+http_client_inflight_requests = publisher.register(BufferedGauge(HTTP_CLIENT_INFLIGHT_REQUESTS_METRIC))
+http_client_connections = {
+    connection_type: publisher.register(BufferedCounter(HTTP_CLIENT_CONNECTIONS_COUNTER, connection_type))
+    for connection_type in ['created', 'reused']
+}
+http_client_queue_time = publisher.register(BufferedHistogram(HTTP_CLIENT_QUEUE_TIME_METRIC))
+live_subscribers = publisher.register(BufferedGauge(TRANSCRIBE_SUBSCRIBERS_METRIC))
+dropped_subscribers = publisher.register(BufferedCounter(TRANSCRIBE_DROPPED_SUBSCRIBERS_COUNTER))
+suppressed_interims = {
+    reason: publisher.register(BufferedCounter(TRANSCRIBE_SUPPRESSED_INTERIMS_COUNTER, reason))
+    for reason in ['request', 'unchanged']
+}
+end_to_end_latencies = {
+    result_type: publisher.register(BufferedHistogram(TRANSCRIBE_END_TO_END_LATENCY_METRIC, result_type))
+    for result_type in ['interim', 'final']
+}
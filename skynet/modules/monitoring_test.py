@@ -0,0 +1,75 @@
+import pytest
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+
+@pytest.fixture()
+def registry():
+    return CollectorRegistry()
+
+
+class TestBufferedMetrics:
+    def test_counter_is_published_on_flush(self, registry):
+        '''Test that increments are only published when the counter is flushed.'''
+
+        from skynet.modules.monitoring import BufferedCounter
+
+        counter = BufferedCounter(Counter('requests', 'requests', registry=registry))
+        counter.inc()
+        counter.inc(2)
+
+        assert registry.get_sample_value('requests_total') == 0
+
+        counter.flush()
+
+        assert registry.get_sample_value('requests_total') == 3
+
+    def test_gauge_value_is_available_before_flush(self, registry):
+        '''Test that the current value of a gauge can be read without going through prometheus.'''
+
+        from skynet.modules.monitoring import BufferedGauge
+
+        gauge = BufferedGauge(Gauge('connections', 'connections', registry=registry))
+        gauge.set(5)
+        gauge.dec()
+
+        assert gauge.get() == 4
+        assert registry.get_sample_value('connections') == 0
+
+        gauge.flush()
+
+        assert registry.get_sample_value('connections') == 4
+
+    def test_histogram_observations_are_published_on_flush(self, registry, mocker):
+        '''Test that buffered observations are all published when the histogram is flushed.'''
+
+        from skynet.modules.monitoring import BufferedHistogram
+
+        mocker.patch('skynet.modules.monitoring.enable_metrics', True)
+        histogram = BufferedHistogram(Histogram('duration', 'duration', ['stage'], registry=registry), 'send')
+
+        histogram.observe(0.1)
+        with histogram.time():
+            pass
+        histogram.flush()
+
+        assert registry.get_sample_value('duration_count', {'stage': 'send'}) == 2
+        assert histogram.values == []
+
+    def test_publisher_snapshot(self, registry):
+        '''Test that increments made while a snapshot is published are kept for the next one.'''
+
+        from skynet.modules.monitoring import BufferedCounter, MetricsPublisher
+
+        publisher = MetricsPublisher()
+        counter = publisher.register(BufferedCounter(Counter('requests', 'requests', registry=registry)))
+
+        counter.inc(2)
+        snapshots = publisher.snapshot()
+        counter.inc()
+        publisher.publish(snapshots)
+
+        assert registry.get_sample_value('requests_total') == 2
+
+        publisher.flush()
+
+        assert registry.get_sample_value('requests_total') == 3
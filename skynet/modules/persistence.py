@@ -0,0 +1,47 @@
+"""
+Shared async Redis connection used by the modules that need state across workers.
+The connection pool is created lazily so that modules which never touch Redis don't need it running.
+"""
+
+from redis.asyncio import Redis
+
+from skynet.env import redis_db_no, redis_host, redis_namespace, redis_port, redis_pwd, redis_use_tls, redis_usr
+from skynet.logs import get_logger
+
+log = get_logger(__name__)
+
+_db = None
+
+
+def get_db() -> Redis:
+    global _db
+
+    if _db is None:
+        log.info(f'Connecting to Redis at {redis_host}:{redis_port}')
+        _db = Redis(
+            host=redis_host,
+            port=redis_port,
+            db=redis_db_no,
+            username=redis_usr,
+            password=redis_pwd,
+            ssl=redis_use_tls,
+            decode_responses=True,
+        )
+    return _db
+
+
+def key(*parts: str) -> str:
+    """Prefixes a key with the configured namespace."""
+    return ':'.join([redis_namespace, *parts])
+
+
+async def close():
+    global _db
+
+    if _db is not None:
+        await _db.aclose()
+
+        _db = None
+
+
+__all__ = ['close', 'get_db', 'key']
@@ -0,0 +1,62 @@
+"""
+Admission control of new meetings, so a full node turns meetings away instead of degrading the latency of all of them.
+
+A new meeting is rejected when the node already holds `WHISPER_MAX_CONNECTIONS` meetings, has `WHISPER_MAX_SPEAKERS`
+participants speaking or `WHISPER_MAX_BACKEND_SESSIONS` sessions open with the transcription backend. The client is
+told when to retry, with some jitter so the rejected clients don't all come back at once, and can try another node in
+the meantime. Reconnections of a meeting the node already holds are always admitted.
+"""
+
+import random
+
+from skynet.env import (
+    whisper_admission_control,
+    whisper_admission_retry_after,
+    whisper_max_backend_sessions,
+    whisper_max_connections,
+    whisper_max_speakers,
+)
+from skynet.modules.load_monitor import LoadSignals
+from skynet.modules.monitoring import rejected_connections
+
+# the close code asking the client to try again later
+TRY_AGAIN_LATER_CODE = 1013
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        enabled: bool = whisper_admission_control,
+        max_meetings: int = whisper_max_connections,
+        max_speakers: int = whisper_max_speakers,
+        max_backend_sessions: int = whisper_max_backend_sessions,
+        retry_after: int = whisper_admission_retry_after,
+    ):
+        self.enabled = enabled
+        self.max_meetings = max_meetings
+        self.max_speakers = max_speakers
+        self.max_backend_sessions = max_backend_sessions
+        self.retry_after = retry_after
+
+    def check(self, signals: LoadSignals, backend_sessions: int) -> str | None:
+        """Returns the resource the node ran out of, or None if a new meeting can be admitted."""
+        if not self.enabled:
+            return None
+
+        if signals.connections >= self.max_meetings:
+            reason = 'meetings'
+        elif signals.speaking_participants >= self.max_speakers:
+            reason = 'participants'
+        elif self.max_backend_sessions > 0 and backend_sessions >= self.max_backend_sessions:
+            reason = 'backend_sessions'
+        else:
+            return None
+
+        rejected_connections[reason].inc()
+        return reason
+
+    def get_retry_after(self) -> int:
+        return random.randint(self.retry_after, self.retry_after * 2)
+
+
+admission = AdmissionController()
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from skynet.modules.load_monitor import LoadSignals
+
+
+class TestAdmission:
+    def test_check(self):
+        '''Test that a new meeting is rejected once any of the resources of the node is used up.'''
+
+        from skynet.modules.stt.streaming_whisper.admission import AdmissionController
+
+        admission = AdmissionController(enabled=True, max_meetings=2, max_speakers=4, max_backend_sessions=8)
+
+        assert admission.check(LoadSignals(connections=1, speaking_participants=3), 7) is None
+        assert admission.check(LoadSignals(connections=2), 0) == 'meetings'
+        assert admission.check(LoadSignals(connections=1, speaking_participants=4), 0) == 'participants'
+        assert admission.check(LoadSignals(connections=1), 8) == 'backend_sessions'
+
+        assert AdmissionController(enabled=False, max_meetings=2).check(LoadSignals(connections=5), 0) is None
+
+    @pytest.mark.asyncio
+    async def test_reject_before_authorization(self, mocker):
+        '''Test that a full node turns a new meeting away before checking its JWT, but not a reconnection.'''
+
+        from skynet.modules.stt.streaming_whisper.admission import AdmissionController, TRY_AGAIN_LATER_CODE
+        from skynet.modules.stt.streaming_whisper.connection_manager import ConnectionManager
+
+        mocker.patch(
+            'skynet.modules.stt.streaming_whisper.connection_manager.admission',
+            AdmissionController(enabled=True, max_meetings=1, retry_after=5),
+        )
+        authorize = mocker.patch('skynet.modules.stt.streaming_whisper.connection_manager.authorize')
+        manager = ConnectionManager()
+        manager.connections['live'] = mocker.MagicMock(participants={})
+        websocket = mocker.AsyncMock()
+
+        assert not await manager.connect(websocket, 'new', 'token')
+
+        authorize.assert_not_called()
+        code, reason = websocket.close.call_args.args
+        assert code == TRY_AGAIN_LATER_CODE
+        assert 5 <= websocket.send_json.call_args.args[0]['retry_after'] <= 10
+
+        mocker.patch('skynet.modules.stt.streaming_whisper.connection_manager.bypass_auth', True)
+
+        assert await manager.connect(mocker.AsyncMock(), 'live', None)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_connects(self, mocker):
+        '''Test that meetings connecting at once are admitted against the slots held by the ones still authorizing.'''
+
+        from skynet.modules.stt.streaming_whisper.admission import AdmissionController, TRY_AGAIN_LATER_CODE
+        from skynet.modules.stt.streaming_whisper.connection_manager import ConnectionManager
+
+        async def authorize(websocket, meeting_id, auth_token):
+            await asyncio.sleep(0)
+            if meeting_id == 'unauthorized':
+                return None
+            return {}
+
+        mocker.patch(
+            'skynet.modules.stt.streaming_whisper.connection_manager.admission',
+            AdmissionController(enabled=True, max_meetings=2, retry_after=5),
+        )
+        mocker.patch('skynet.modules.stt.streaming_whisper.connection_manager.MeetingConnection')
+        mocker.patch('skynet.modules.stt.streaming_whisper.connection_manager.segment_logs')
+        mocker.patch('skynet.modules.stt.streaming_whisper.connection_manager.rolling_summaries')
+        mocker.patch('skynet.modules.stt.streaming_whisper.connection_manager.bypass_auth', True)
+        manager = ConnectionManager()
+        manager.authorize = authorize
+        manager.flush_audio_task = mocker.MagicMock()
+        websockets = [mocker.AsyncMock() for _ in range(4)]
+
+        connected = await asyncio.gather(
+            *[manager.connect(ws, f'meeting-{i}', 'token') for i, ws in enumerate(websockets)]
+        )
+
+        assert connected == [True, True, False, False]
+        assert [ws.close.call_args.args[0] for ws in websockets[2:]] == [TRY_AGAIN_LATER_CODE] * 2
+        assert manager.admitting == 0
+        assert len(manager.connections) == 2
+
+        manager.connections.clear()
+
+        assert not await manager.connect(mocker.AsyncMock(), 'unauthorized', 'token')
+        assert manager.admitting == 0
@@ -1,31 +1,115 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import time
 
+from fastapi import Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+
+from skynet.env import app_uuid, bypass_auth, whisper_fallback_to_local
 from skynet.logs import get_logger
+from skynet.modules.load_monitor import load_monitor
 from skynet.modules.stt.streaming_whisper.connection_manager import ConnectionManager
+from skynet.modules.stt.streaming_whisper.local_client import local_client
+from skynet.modules.stt.streaming_whisper.segment_log import segment_logs
 from skynet.modules.stt.streaming_whisper.utils import utils
+from skynet.modules.ttt.rolling_summary import rolling_summaries
+from skynet.utils import get_router
 
 log = get_logger(__name__)
 
 ws_connection_manager = ConnectionManager()
+load_monitor.register_source(ws_connection_manager.get_load_signals)
 app = FastAPI()  # No need for CORS middleware
+router = get_router()
+
+
+def get_customer_id(request: Request) -> str | None:
+    return getattr(request.state, 'decoded_jwt', {}).get('cid')
+
+
+def authorize_meeting(request: Request, meeting_id: str):
+    """
+    Only lets the clients of the customer a meeting belongs to read it. A meeting unknown to this node has nothing to
+    read yet.
+    """
+    if bypass_auth or request.headers.get('X-Skynet-UUID') == app_uuid:
+        return
+
+    owner = ws_connection_manager.get_owner(meeting_id)
+    if owner is None and not segment_logs.exists(meeting_id):
+        return
+
+    if owner != (get_customer_id(request) or ''):
+        raise HTTPException(status_code=403, detail='Not allowed to read this meeting')
+
+
+@router.get('/transcripts/{meeting_id}', dependencies=[Depends(authorize_meeting)])
+def get_transcript(
+    meeting_id: str, start: int | None = None, end: int | None = None
+) -> list[utils.TranscriptionResponse]:
+    """
+    Returns the final transcriptions of a meeting starting between the `start` and `end` timestamps, in millis.
+    """
+    return segment_logs.read(meeting_id, start, end)
+
+
+@router.get('/transcripts/{meeting_id}/summary', dependencies=[Depends(authorize_meeting)])
+async def get_summary(request: Request, meeting_id: str) -> str:
+    """
+    Returns the summary of a meeting so far, reduced from the summaries of the transcript windows.
+    """
+    if not rolling_summaries.is_enabled():
+        raise HTTPException(status_code=404, detail='Rolling summaries are disabled')
+
+    lines = None
+    if rolling_summaries.get(meeting_id) is None:
+        lines = [(segment.participant_id, segment.text) for segment in segment_logs.read(meeting_id)]
+
+    summary = await rolling_summaries.get_summary(meeting_id, lines, get_customer_id(request))
+    if summary is None:
+        raise HTTPException(status_code=404, detail='Meeting not found')
+
+    return summary
+
+
+app.include_router(router)
+
+
+def warmup():
+    """
+    Loads what the first meetings would otherwise wait for: the local model and the summary processor.
+    """
+    if whisper_fallback_to_local and local_client.is_available():
+        local_client.load()
+
+    if rolling_summaries.is_enabled():
+        import skynet.modules.ttt.processor  # noqa: F401
 
 
 @app.websocket('/ws/{meeting_id}')
-async def websocket_endpoint(websocket: WebSocket, meeting_id: str, auth_token: str | None = None):
-    await ws_connection_manager.connect(websocket, meeting_id, auth_token)
+async def websocket_endpoint(websocket: WebSocket, meeting_id: str, auth_token: str | None = None, mixed: bool = False):
+    if not await ws_connection_manager.connect(websocket, meeting_id, auth_token, mixed):
+        return
     try:
         while True:
             try:
                 chunk = await websocket.receive_bytes()
+                received_at = time.perf_counter()
             except Exception as err:
                 log.warning(f'Expected bytes, received something else, disconnecting {meeting_id}. Error: \n{err}')
-                ws_connection_manager.disconnect(meeting_id)
+                ws_connection_manager.disconnect(meeting_id, websocket)
                 break
             if len(chunk) == 1 and ord(b'' + chunk) == 0:
                 log.info(f'Received disconnect message for {meeting_id}')
-                ws_connection_manager.disconnect(meeting_id)
+                ws_connection_manager.disconnect(meeting_id, websocket)
                 break
-            await ws_connection_manager.process(meeting_id, chunk, utils.now())
+            await ws_connection_manager.process(meeting_id, chunk, utils.now(), received_at)
     except WebSocketDisconnect:
-        ws_connection_manager.disconnect(meeting_id)
+        ws_connection_manager.disconnect(meeting_id, websocket)
         log.info(f'Meeting {meeting_id} has ended')
+
+
+@app.websocket('/ws/{meeting_id}/subscribe')
+async def subscribe_endpoint(websocket: WebSocket, meeting_id: str, auth_token: str | None = None):
+    """
+    Read-only stream of the transcriptions of a meeting, for dashboards and recorders. Messages sent by the client
+    are ignored.
+    """
+    await ws_connection_manager.subscribe(websocket, meeting_id, auth_token)
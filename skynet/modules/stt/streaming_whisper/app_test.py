@@ -0,0 +1,85 @@
+import pytest
+from fastapi import HTTPException
+
+
+class TestMeetingAuthorization:
+    def test_authorize_meeting(self, mocker, tmp_path):
+        '''Test that only the clients of the customer a meeting belongs to can read it.'''
+
+        from skynet.modules.stt.streaming_whisper import app
+        from skynet.modules.stt.streaming_whisper.segment_log import SegmentLogStore
+
+        segment_logs = SegmentLogStore(str(tmp_path))
+        mocker.patch.object(app, 'bypass_auth', False)
+        mocker.patch.object(app, 'segment_logs', segment_logs)
+        mocker.patch('skynet.modules.stt.streaming_whisper.connection_manager.segment_logs', segment_logs)
+
+        def request(cid: str | None):
+            return mocker.MagicMock(headers={}, state=mocker.MagicMock(decoded_jwt={'cid': cid}))
+
+        # nothing to read yet
+        app.authorize_meeting(request('other'), 'meeting')
+
+        segment_logs.set_owner('meeting', 'customer')
+        app.authorize_meeting(request('customer'), 'meeting')
+
+        with pytest.raises(HTTPException) as e:
+            app.authorize_meeting(request('other'), 'meeting')
+
+        assert e.value.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_other_customer_is_rejected(self, mocker, tmp_path):
+        '''Test that the clients of another customer can neither follow nor take over a meeting.'''
+
+        from skynet.modules.stt.streaming_whisper import connection_manager
+        from skynet.modules.stt.streaming_whisper.segment_log import SegmentLogStore
+
+        segment_logs = SegmentLogStore(str(tmp_path))
+        mocker.patch.object(connection_manager, 'bypass_auth', False)
+        mocker.patch.object(connection_manager, 'segment_logs', segment_logs)
+        manager = connection_manager.ConnectionManager()
+        mocker.patch.object(manager, 'authorize', return_value={'cid': 'other'})
+        segment_logs.set_owner('meeting', 'customer')
+
+        producer, subscriber = mocker.AsyncMock(), mocker.AsyncMock()
+        assert not await manager.connect(producer, 'meeting', None)
+        await manager.subscribe(subscriber, 'meeting', None)
+
+        for websocket in [producer, subscriber]:
+            websocket.close.assert_called_once_with(
+                connection_manager.POLICY_VIOLATION_CODE, 'Meeting belongs to another customer'
+            )
+        assert 'meeting' not in manager.connections
+
+
+class TestFlushWorker:
+    @pytest.mark.asyncio
+    async def test_meeting_ends_during_flush(self, mocker):
+        '''Test that a meeting ending while the audio of another one is flushed doesn't stop the worker.'''
+
+        import asyncio
+
+        from skynet.modules.stt.streaming_whisper import connection_manager
+
+        manager = connection_manager.ConnectionManager()
+        mocker.patch.object(manager, 'send')
+
+        def get_meeting():
+            meeting = mocker.MagicMock()
+            meeting.participants = {
+                'participant': mocker.MagicMock(last_received_chunk=0, working_audio=b'audio', is_transcribing=False)
+            }
+            meeting.force_transcription = mocker.AsyncMock(return_value=None)
+            return meeting
+
+        first, second = get_meeting(), get_meeting()
+        manager.connections = {'first': first, 'second': second}
+        first.force_transcription.side_effect = lambda participant: manager.connections.pop('second') and None
+        mocker.patch.object(connection_manager.asyncio, 'sleep', side_effect=asyncio.CancelledError)
+
+        with pytest.raises(asyncio.CancelledError):
+            await manager.flush_working_audio_worker()
+
+        first.force_transcription.assert_called_once_with('participant')
+        second.force_transcription.assert_not_called()
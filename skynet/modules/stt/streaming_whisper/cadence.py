@@ -0,0 +1,123 @@
+"""
+Adapts how often a participant's audio is transcribed to how fast the backend answers and how loaded the node is.
+
+Requesting an interim more often than the backend can answer only queues work, so the interval between two requests
+grows with the observed latency of the participant's transcriptions and with the load of the node. Once the load
+reaches `WHISPER_FINALS_ONLY_LOAD` the participant only gets a transcription after pausing, which is mostly final, and
+returns to interims once the load drops again.
+
+During continuous speech most interim requests re-send audio that was already transcribed and get the same text back.
+An interim request is skipped when less than `MIN_NEW_SPEECH` seconds of the audio added since the previous request is
+voiced, unless the previous request is `WHISPER_MAX_INTERIM_DELAY` seconds of audio old, which bounds how late an
+interim can be. Interims with the same text as the previous one aren't sent again.
+"""
+
+from skynet.env import (
+    whisper_adaptive_cadence,
+    whisper_finals_only_load,
+    whisper_max_interim_delay,
+    whisper_suppress_interims,
+)
+from skynet.modules.load_monitor import load_monitor
+from skynet.modules.monitoring import finals_only_participants, suppressed_interims
+
+# how much of a participant's new audio, in seconds, triggers an interim at least
+MIN_INTERIM_INTERVAL = 1.0
+MAX_INTERIM_INTERVAL = 5.0
+
+# interims are requested at most this often relative to how long the backend takes to answer
+LATENCY_FACTOR = 1.5
+LATENCY_EWMA_ALPHA = 0.3
+
+# leaving the finals only mode requires the load to drop this much below the threshold, so it doesn't flap
+FINALS_ONLY_HYSTERESIS = 0.1
+
+# above this load no silent chunks are added to the audio to transcribe
+DROP_SILENCE_LOAD = 0.5
+
+# seconds of voiced audio since the last request below which an interim request is skipped
+MIN_NEW_SPEECH = 0.5
+
+
+class CadenceController:
+    def __init__(self, add_max_silent_chunks: int = 1, final_after_x_silent_chunks: int = 2):
+        self.base_add_max_silent_chunks = add_max_silent_chunks
+        self.base_final_after_x_silent_chunks = final_after_x_silent_chunks
+        self.add_max_silent_chunks = add_max_silent_chunks
+        self.final_after_x_silent_chunks = final_after_x_silent_chunks
+        self.interim_interval = MIN_INTERIM_INTERVAL
+        self.finals_only = False
+        self.latency = None
+
+    def observe_latency(self, latency: float):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self.latency
+
+    def set_finals_only(self, finals_only: bool):
+        if finals_only != self.finals_only:
+            finals_only_participants.inc(1 if finals_only else -1)
+        self.finals_only = finals_only
+
+    def update(self, load: float | None = None):
+        if not whisper_adaptive_cadence:
+            return
+
+        load = load_monitor.get_load() if load is None else load
+
+        if load >= whisper_finals_only_load:
+            self.set_finals_only(True)
+        elif load < whisper_finals_only_load - FINALS_ONLY_HYSTERESIS:
+            self.set_finals_only(False)
+
+        interval = max(MIN_INTERIM_INTERVAL, (self.latency or 0) * LATENCY_FACTOR) * (1 + load)
+        self.interim_interval = min(interval, MAX_INTERIM_INTERVAL)
+
+        self.add_max_silent_chunks = 0 if load >= DROP_SILENCE_LOAD else self.base_add_max_silent_chunks
+        # cutting finals sooner keeps the audio sent with each request short
+        self.final_after_x_silent_chunks = (
+            max(1, self.base_final_after_x_silent_chunks - 1)
+            if self.finals_only
+            else self.base_final_after_x_silent_chunks
+        )
+
+    def close(self):
+        self.set_finals_only(False)
+
+
+class InterimSuppressor:
+    def __init__(self, enabled: bool = whisper_suppress_interims, max_delay: float = whisper_max_interim_delay):
+        self.enabled = enabled
+        self.max_delay = max_delay
+        # seconds of audio, and of voiced audio, added since the last request
+        self.new_audio = 0.0
+        self.new_speech = 0.0
+        self.last_interim = None
+
+    def add(self, duration: float, speech_duration: float):
+        self.new_audio += duration
+        self.new_speech += speech_duration
+
+    def should_skip(self) -> bool:
+        if not self.enabled or self.new_audio >= self.max_delay or self.new_speech >= MIN_NEW_SPEECH:
+            return False
+
+        suppressed_interims['request'].inc()
+        return True
+
+    def on_request(self):
+        self.new_audio = 0.0
+        self.new_speech = 0.0
+
+    def is_unchanged(self, interim: str) -> bool:
+        text = ' '.join(interim.split()).lower()
+        if self.enabled and text == self.last_interim:
+            suppressed_interims['unchanged'].inc()
+            return True
+
+        self.last_interim = text
+        return False
+
+    def on_final(self):
+        self.last_interim = None
@@ -0,0 +1,81 @@
+import pytest
+
+
+@pytest.fixture()
+def controller(mocker):
+    from skynet.modules.stt.streaming_whisper.cadence import CadenceController
+
+    mocker.patch('skynet.modules.stt.streaming_whisper.cadence.whisper_adaptive_cadence', True)
+    mocker.patch('skynet.modules.stt.streaming_whisper.cadence.whisper_finals_only_load', 0.8)
+
+    return CadenceController(add_max_silent_chunks=1, final_after_x_silent_chunks=2)
+
+
+class TestCadenceController:
+    def test_idle_node_keeps_the_default_cadence(self, controller):
+        '''Test that a fast backend on an idle node transcribes every second of new audio.'''
+
+        controller.observe_latency(0.2)
+        controller.update(load=0)
+
+        assert controller.interim_interval == 1
+        assert (controller.add_max_silent_chunks, controller.final_after_x_silent_chunks) == (1, 2)
+        assert not controller.finals_only
+
+    def test_interval_follows_latency_and_load(self, controller):
+        '''Test that interims are requested less often when the backend is slow and the node is loaded.'''
+
+        controller.observe_latency(2)
+        controller.update(load=0.5)
+
+        assert controller.interim_interval == pytest.approx(4.5)
+        assert controller.add_max_silent_chunks == 0
+
+    def test_finals_only_under_pressure(self, controller):
+        '''Test that the participant only gets finals above the load threshold, until the load drops enough.'''
+
+        controller.update(load=0.9)
+        assert controller.finals_only
+        assert controller.final_after_x_silent_chunks == 1
+
+        controller.update(load=0.75)
+        assert controller.finals_only
+
+        controller.update(load=0.5)
+        assert not controller.finals_only
+
+
+class TestInterimSuppressor:
+    def test_skips_requests_without_new_speech(self):
+        '''Test that interim requests are skipped without new speech, but never for longer than the maximum delay.'''
+
+        from skynet.modules.stt.streaming_whisper.cadence import InterimSuppressor
+
+        suppressor = InterimSuppressor(enabled=True, max_delay=3)
+
+        suppressor.add(1, 0.2)
+        assert suppressor.should_skip()
+
+        suppressor.add(1, 0.2)
+        assert suppressor.should_skip()
+
+        suppressor.add(1, 0)
+        assert not suppressor.should_skip()
+
+        suppressor.on_request()
+        suppressor.add(1, 0.8)
+        assert not suppressor.should_skip()
+
+    def test_drops_unchanged_interims(self):
+        '''Test that an interim with the same text as the previous one is dropped until a final resets it.'''
+
+        from skynet.modules.stt.streaming_whisper.cadence import InterimSuppressor
+
+        suppressor = InterimSuppressor(enabled=True)
+
+        assert not suppressor.is_unchanged('Hello there')
+        assert suppressor.is_unchanged(' hello  there ')
+        assert not suppressor.is_unchanged('Hello there, how')
+
+        suppressor.on_final()
+        assert not suppressor.is_unchanged('Hello there, how')
@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 import struct
+import time
 import numpy as np
+from skynet.modules.monitoring import stage_durations
 from skynet.modules.stt.streaming_whisper.utils import utils
 from skynet.logs import get_logger
 
@@ -16,13 +18,18 @@ class Chunk:
     speech_timestamps: iter
     participant_id: str
     language: str
+    received_at: float
 
-    def __init__(self, chunk: bytes, chunk_timestamp: int):
-        self._extract(chunk)
+    def __init__(self, chunk: bytes, chunk_timestamp: int, received_at: float | None = None):
+        # perf_counter reading of when the chunk was received
+        self.received_at = time.perf_counter() if received_at is None else received_at
+        with stage_durations['decode'].time():
+            self._extract(chunk)
         self.timestamp = chunk_timestamp
         self.duration = utils.convert_bytes_to_seconds(self.raw)
         self.size = len(self.raw)
-        self.silent, self.speech_timestamps = utils.is_silent(self.raw)
+        with stage_durations['vad'].time():
+            self.silent, self.speech_timestamps = utils.is_silent(self.raw)
 
     def _extract(self, chunk: bytes):
         """Extract participant ID, language and audio data from the chunk"""
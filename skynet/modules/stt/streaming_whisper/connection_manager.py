@@ -1,17 +1,33 @@
 import asyncio
+import base64
+import time
 from asyncio import Task
 
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
 
 from skynet.auth.jwt import authorize
-from skynet.env import bypass_auth, whisper_flush_interval, whisper_max_connections
+from skynet.env import bypass_auth, whisper_flush_interval
 from skynet.logs import get_logger
-from skynet.modules.monitoring import CONNECTIONS_METRIC, TRANSCRIBE_CONNECTIONS_COUNTER, TRANSCRIBE_STRESS_LEVEL_METRIC
+from skynet.modules.load_monitor import LoadSignals
+from skynet.modules.monitoring import (
+    backend_sessions,
+    connections_counter,
+    end_to_end_latencies,
+    live_connections,
+    rejected_connections,
+    stage_durations,
+)
+from skynet.modules.stt.streaming_whisper.admission import admission, TRY_AGAIN_LATER_CODE
+from skynet.modules.stt.streaming_whisper.hub import hub
 from skynet.modules.stt.streaming_whisper.meeting_connection import MeetingConnection
+from skynet.modules.stt.streaming_whisper.segment_log import segment_logs
 from skynet.modules.stt.streaming_whisper.utils import utils
+from skynet.modules.ttt.rolling_summary import rolling_summaries
 
 log = get_logger(__name__)
 
+POLICY_VIOLATION_CODE = 1008
+
 
 class ConnectionManager:
     connections: dict[str, MeetingConnection]
@@ -20,50 +36,236 @@ class ConnectionManager:
     def __init__(self):
         self.connections: dict[str, MeetingConnection] = {}
         self.flush_audio_task = None
+        self.draining = False
+        # new meetings admitted but still authorizing, they count against the capacity
+        self.admitting = 0
+
+    async def reject(self, websocket: WebSocket, meeting_id: str, code: int, reason: str, retry_after: int = 0):
+        """
+        Turns a client away with a close code and a hint of when to retry. The connection is accepted first, a close
+        before the handshake only reaches the client as an HTTP 403.
+        """
+        log.info(f'Meeting {meeting_id}: refusing connection, {reason}')
+        try:
+            await websocket.accept()
+            await websocket.send_json({'type': 'rejected', 'reason': reason, 'retry_after': retry_after})
+            await websocket.close(code, reason)
+        except Exception as e:
+            log.debug(f'Meeting {meeting_id}: failed to reject the connection {e}')
+
+    async def authorize(self, websocket: WebSocket, meeting_id: str, auth_token: str | None) -> dict | None:
+        """
+        Returns the claims of the client's JWT, or None after closing the connection if the client isn't authorized.
+        """
+        if bypass_auth:
+            return {}
 
-    async def connect(self, websocket: WebSocket, meeting_id: str, auth_token: str | None):
-        if not bypass_auth:
-            jwt_token = utils.get_jwt(websocket.headers, auth_token)
+        jwt_token = utils.get_jwt(websocket.headers, auth_token)
+        try:
             authorized = await authorize(jwt_token)
-            if not authorized:
-                await websocket.close(401, 'Bad JWT token')
-                return
+        except HTTPException as e:
+            log.warning(f'Meeting {meeting_id}: unauthorized connection attempt, {e.detail}')
+            authorized = None
+        if not authorized:
+            await websocket.close(401, 'Bad JWT token')
+            return None
+
+        return authorized
+
+    async def connect(self, websocket: WebSocket, meeting_id: str, auth_token: str | None, mixed: bool = False) -> bool:
+        # checked before the JWT, whose public key may have to be fetched
+        if self.draining:
+            rejected_connections['draining'].inc()
+            await self.reject(websocket, meeting_id, 1012, 'Node is draining')
+            return False
+        if meeting_id not in self.connections:
+            resource = admission.check(self.get_load_signals(), backend_sessions.get())
+            if resource is not None:
+                retry_after = admission.get_retry_after()
+                reason = f'Node is out of {resource.replace("_", " ")}, retry after {retry_after}s'
+                await self.reject(websocket, meeting_id, TRY_AGAIN_LATER_CODE, reason, retry_after)
+                return False
+            # hold the slot while authorizing, concurrent connects would be admitted against the same count otherwise
+            self.admitting += 1
+            try:
+                return await self.open(websocket, meeting_id, auth_token, mixed)
+            finally:
+                self.admitting -= 1
+        return await self.open(websocket, meeting_id, auth_token, mixed)
+
+    async def open(self, websocket: WebSocket, meeting_id: str, auth_token: str | None, mixed: bool) -> bool:
+        authorized = await self.authorize(websocket, meeting_id, auth_token)
+        if authorized is None:
+            return False
+        customer_id = authorized.get('cid')
+        if not self.may_access(meeting_id, customer_id):
+            await self.reject(websocket, meeting_id, POLICY_VIOLATION_CODE, 'Meeting belongs to another customer')
+            return False
         await websocket.accept()
-        self.connections[meeting_id] = MeetingConnection(websocket)
+        previous = self.connections.get(meeting_id)
+        if previous is not None:
+            # the client reconnected before its previous connection timed out, it takes over the meeting's state
+            log.info(f'Meeting {meeting_id}: a new connection replaced the previous one')
+            previous_websocket, previous.websocket = previous.websocket, websocket
+            try:
+                await previous_websocket.close(1000, 'Replaced by a new connection')
+            except Exception as e:
+                log.debug(f'Meeting {meeting_id}: failed to close the previous connection {e}')
+            return True
+        self.connections[meeting_id] = MeetingConnection(websocket, mixed, customer_id)
+        segment_logs.set_owner(meeting_id, customer_id)
+        rolling_summaries.start(meeting_id, customer_id)
         if self.flush_audio_task is None:
             loop = asyncio.get_running_loop()
             self.flush_audio_task = loop.create_task(self.flush_working_audio_worker())
-        CONNECTIONS_METRIC.set(len(self.connections))
-        TRANSCRIBE_STRESS_LEVEL_METRIC.set(len(self.connections) / whisper_max_connections)
-        TRANSCRIBE_CONNECTIONS_COUNTER.inc()
+        live_connections.set(len(self.connections))
+        connections_counter.inc()
         log.info(f'Meeting with id {meeting_id} started. Ongoing meetings {len(self.connections)}')
+        return True
+
+    def get_owner(self, meeting_id: str) -> str | None:
+        """The customer id of the meeting, empty if it has none, None if it isn't known."""
+        meeting_connection = self.connections.get(meeting_id)
+        if meeting_connection is not None:
+            return meeting_connection.customer_id or ''
+
+        summary = rolling_summaries.get(meeting_id)
+        if summary is not None:
+            return summary.customer_id or ''
+
+        return segment_logs.get_owner(meeting_id)
+
+    def may_access(self, meeting_id: str, customer_id: str | None) -> bool:
+        """
+        If a client of `customer_id` may produce or follow the meeting. A meeting belongs to the customer who started
+        it, one unknown to this node to whoever starts it.
+        """
+        if bypass_auth:
+            return True
+
+        owner = self.get_owner(meeting_id)
+        return owner is None or owner == (customer_id or '')
+
+    async def subscribe(self, websocket: WebSocket, meeting_id: str, auth_token: str | None):
+        """
+        Sends the results of a meeting to a read-only client until it disconnects. The meeting doesn't need to be live
+        on this node, or to have started yet.
+        """
+        if self.draining:
+            await self.reject(websocket, meeting_id, 1012, 'Node is draining')
+            return
+        authorized = await self.authorize(websocket, meeting_id, auth_token)
+        if authorized is None:
+            return
+        # the results of a meeting which isn't known yet only reach the subscribers of the customer who starts it
+        customer_id = authorized.get('cid')
+        if not self.may_access(meeting_id, customer_id):
+            await self.reject(websocket, meeting_id, POLICY_VIOLATION_CODE, 'Meeting belongs to another customer')
+            return
+        await websocket.accept()
+        subscriber = await hub.subscribe(meeting_id, customer_id, websocket)
+        try:
+            while (await websocket.receive())['type'] != 'websocket.disconnect':
+                pass
+        finally:
+            await hub.unsubscribe(meeting_id, customer_id, subscriber)
 
-    async def process(self, meeting_id: str, chunk: bytes, chunk_timestamp: int):
+    async def process(self, meeting_id: str, chunk: bytes, chunk_timestamp: int, received_at: float):
         log.debug(f'Processing chunk for meeting {meeting_id}')
         if meeting_id not in self.connections:
             log.warning(f'No such meeting id {meeting_id}, the connection was probably closed.')
             return
-        results = await self.connections[meeting_id].process(chunk, chunk_timestamp)
+        results = await self.connections[meeting_id].process(chunk, chunk_timestamp, received_at)
         await self.send(meeting_id, results)
 
     async def send(self, meeting_id: str, results: list[utils.TranscriptionResponse] | None):
         if results is not None:
+            customer_id = getattr(self.connections.get(meeting_id), 'customer_id', None)
             for result in results:
+                await segment_logs.append(meeting_id, result)
+                if result.type == 'final':
+                    rolling_summaries.add(meeting_id, result.participant_id, result.text)
+                # serialized once for the client and all the subscribers
+                message = result.model_dump_json()
                 try:
-                    await self.connections[meeting_id].ws.send_json(result.model_dump())
+                    with stage_durations['send'].time():
+                        await self.connections[meeting_id].websocket.send_text(message)
+                    if result._received_at is not None:
+                        end_to_end_latencies[result.type].observe(time.perf_counter() - result._received_at)
                 except WebSocketDisconnect as e:
                     log.warning(f'Meeting {meeting_id}: the connection was closed before sending all results: {e}')
                     self.disconnect(meeting_id)
                 except Exception as ex:
                     log.error(f'Meeting {meeting_id}: exception while sending transcription results {ex}')
+                await hub.publish(meeting_id, customer_id, message)
 
-    def disconnect(self, meeting_id: str):
+    def disconnect(self, meeting_id: str, websocket: WebSocket | None = None):
+        """
+        `websocket` is the connection that ended, the meeting goes on if another connection took it over since.
+        """
+        meeting_connection = self.connections.get(meeting_id)
+        if websocket is not None and meeting_connection is not None and meeting_connection.websocket is not websocket:
+            return
         try:
-            del self.connections[meeting_id]
+            self.connections.pop(meeting_id).disconnect()
         except KeyError:
             log.warning(f'The meeting {meeting_id} doesn\'t exist anymore.')
-        CONNECTIONS_METRIC.set(len(self.connections))
-        TRANSCRIBE_STRESS_LEVEL_METRIC.set(len(self.connections) / whisper_max_connections)
+        segment_logs.close(meeting_id)
+        rolling_summaries.end(meeting_id)
+        live_connections.set(len(self.connections))
+
+    async def drain(self):
+        """
+        Flushes the pending audio of every participant and asks the clients to reconnect, handing them a snapshot of the
+        remaining state which they send as the first message to the node they reconnect to.
+        """
+        self.draining = True
+        log.info(f'Draining {len(self.connections)} meetings')
+
+        await asyncio.gather(*[self.hand_off(meeting_id) for meeting_id in list(self.connections)])
+        await hub.close(1012, 'Node is draining, please reconnect')
+
+    def resume(self):
+        """Accepts new meetings again once the node is set back to ready."""
+        self.draining = False
+
+    async def hand_off(self, meeting_id: str):
+        meeting_connection = self.connections.get(meeting_id)
+        if meeting_connection is None:
+            return
+
+        for participant_id, state in list(meeting_connection.participants.items()):
+            if len(state.working_audio) > 0:
+                results = await meeting_connection.force_transcription(participant_id)
+                await self.send(meeting_id, results)
+
+        if meeting_id not in self.connections:
+            return
+
+        try:
+            data = base64.b64encode(meeting_connection.export_snapshot()).decode('ASCII')
+            await meeting_connection.websocket.send_json({'type': 'reconnect', 'snapshot': data})
+            await meeting_connection.websocket.close(1012, 'Node is draining, please reconnect')
+        except Exception as e:
+            log.warning(f'Meeting {meeting_id}: failed to hand off the meeting {e}')
+
+        self.disconnect(meeting_id)
+        log.info(f'Meeting {meeting_id} handed off')
+
+    def get_load_signals(self) -> LoadSignals:
+        signals = LoadSignals(connections=len(self.connections) + self.admitting)
+        now = utils.now()
+
+        for meeting_connection in self.connections.values():
+            for state in meeting_connection.participants.values():
+                if state.is_transcribing:
+                    signals.inflight_transcriptions += 1
+                elif state.should_transcribe():
+                    signals.pending_transcriptions += 1
+                if not state.long_silence and now - state.last_received_chunk < whisper_flush_interval:
+                    signals.speaking_participants += 1
+
+        return signals
 
     async def flush_working_audio_worker(self):
         """
@@ -72,15 +274,20 @@ class ConnectionManager:
         to the next utterance when the participant resumes speaking.
         """
         while True:
-            for meeting_id in self.connections:
-                for participant in self.connections[meeting_id].participants:
-                    state = self.connections[meeting_id].participants[participant]
+            # meetings and participants come and go while the transcriptions are awaited
+            for meeting_id, meeting_connection in list(self.connections.items()):
+                for participant, state in list(meeting_connection.participants.items()):
+                    if self.connections.get(meeting_id) is not meeting_connection:
+                        break
                     diff = utils.now() - state.last_received_chunk
                     log.debug(
                         f'Participant {participant} in meeting {meeting_id} has been silent for {diff} ms and has {len(state.working_audio)} bytes of audio'
                     )
                     if diff > whisper_flush_interval and len(state.working_audio) > 0 and not state.is_transcribing:
                         log.info(f'Forcing a transcription in meeting {meeting_id} for {participant}')
-                        results = await self.connections[meeting_id].force_transcription(participant)
-                        await self.send(meeting_id, results)
+                        try:
+                            results = await meeting_connection.force_transcription(participant)
+                            await self.send(meeting_id, results)
+                        except Exception as e:
+                            log.error(f'Meeting {meeting_id}: failed to flush the audio of {participant} {e}')
             await asyncio.sleep(1)
@@ -0,0 +1,33 @@
+"""
+The last words a participant said, passed as the prompt of the participant's next transcriptions.
+
+Whisper transcribes the start of an audio slice more accurately when it knows what was said right before it, e.g. a
+sentence cut at a pause is continued instead of being capitalized and punctuated as a new one, and words are spelled the
+same way as earlier in the meeting. The context is a ring of the last `WHISPER_CONTEXT_WORDS` words of the final
+transcriptions, each truncated to `MAX_WORD_LENGTH` characters, so its size per participant is fixed however long the
+meeting is.
+"""
+
+from collections import deque
+
+from skynet.env import whisper_context_words
+from skynet.modules.stt.streaming_whisper.utils import utils
+
+MAX_WORD_LENGTH = 32
+
+
+class TranscriptContext:
+    def __init__(self, max_words: int = whisper_context_words):
+        self.words: deque[str] = deque(maxlen=max_words)
+
+    def is_enabled(self) -> bool:
+        return self.words.maxlen > 0
+
+    def add(self, text: str):
+        if text.strip() in utils.black_listed_prompts:
+            return
+
+        self.words.extend(word[:MAX_WORD_LENGTH] for word in text.split())
+
+    def get_prompt(self) -> str | None:
+        return ' '.join(self.words) or None
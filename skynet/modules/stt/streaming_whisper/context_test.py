@@ -0,0 +1,56 @@
+import pytest
+
+
+class TestTranscriptContext:
+    def test_ring(self):
+        '''Test that only the last words are kept, truncated, and blacklisted transcriptions are ignored.'''
+
+        from skynet.modules.stt.streaming_whisper.context import MAX_WORD_LENGTH, TranscriptContext
+
+        context = TranscriptContext(max_words=4)
+        context.add('one two three')
+        context.add('. .')
+        context.add('four five ' + 'x' * 100)
+
+        assert context.get_prompt() == f'three four five {"x" * MAX_WORD_LENGTH}'
+        assert TranscriptContext(max_words=0).get_prompt() is None
+
+    @pytest.mark.asyncio
+    async def test_prompt(self, mocker):
+        '''Test that the finals of a participant are the prompt of its next transcriptions.'''
+
+        from skynet.modules.stt.streaming_whisper.state import State
+
+        state = State('participant')
+        state.backend_client = mocker.AsyncMock()
+        state.backend_client.transcribe.return_value = {'segments': [{'text': 'there', 'start': 0, 'end': 0.5}]}
+
+        state.get_response_payload('Hello', 0, final=True)
+        state.get_response_payload('Hello again', 0)
+        await state.do_transcription(b'audio')
+
+        state.backend_client.transcribe.assert_called_once_with(b'audio', 'Hello')
+
+    @pytest.mark.asyncio
+    async def test_slicing(self, mocker):
+        '''Test that the audio is only sliced finer when the prompt reached the model, i.e. the local fallback.'''
+
+        from skynet.modules.stt.streaming_whisper import resilient_client
+        from skynet.modules.stt.streaming_whisper.state import SLICE_BYTES, SLICE_BYTES_WITH_CONTEXT, State
+
+        mocker.patch.object(resilient_client.ResilientStreamingClient, 'hedged_request', return_value={'segments': []})
+        mocker.patch.object(resilient_client.local_client, 'transcribe', return_value={'segments': []})
+        mocker.patch.object(resilient_client, 'whisper_fallback_to_local', True)
+        mocker.patch.object(resilient_client.local_client, 'is_available', return_value=True)
+        circuit_breaker = mocker.patch.object(resilient_client, 'circuit_breaker')
+
+        state = State('participant')
+        state.get_response_payload('Hello', 0, final=True)
+
+        circuit_breaker.allow.return_value = True
+        await state.do_transcription(b'audio')
+        assert state.get_slice_bytes() == SLICE_BYTES
+
+        circuit_breaker.allow.return_value = False
+        await state.do_transcription(b'audio')
+        assert state.get_slice_bytes() == SLICE_BYTES_WITH_CONTEXT
@@ -0,0 +1,145 @@
+"""
+A lightweight speaker diarizer for meetings sending a single mixed audio stream.
+
+Each word is described by the spectral shape of the audio around it: the mean and spread of its log energies in
+mel-spaced bands, which mostly depend on the voice of the speaker rather than on what is said. The embeddings are
+clustered online by cosine similarity, a new speaker being added whenever a word isn't close enough to any known one.
+It needs no pretrained model and runs on the CPU in a fraction of the time of the transcription.
+"""
+
+import numpy as np
+
+from skynet.env import whisper_mixed_max_speakers, whisper_mixed_speaker_threshold
+
+SAMPLE_RATE = 16000
+FRAME_SIZE = 400  # 25ms
+HOP_SIZE = 160  # 10ms
+NUM_BANDS = 24
+MIN_FREQUENCY = 100
+MAX_FREQUENCY = 4000
+
+# the audio around a word used to compute its embedding, a single word is too short to tell voices apart
+WINDOW_DURATION = 1.0
+
+# words this much less similar than the threshold to the closest speaker are attributed to them without updating them
+UNCERTAIN_MARGIN = 0.3
+
+# a new speaker only gets words attributed once this many words sound like them, a single odd window is just noise
+MIN_SPEAKER_WORDS = 3
+
+
+def mel(frequency: np.ndarray) -> np.ndarray:
+    return 2595 * np.log10(1 + frequency / 700)
+
+
+def get_filterbank() -> np.ndarray:
+    frequencies = np.fft.rfftfreq(FRAME_SIZE, 1 / SAMPLE_RATE)
+    edges = np.linspace(mel(np.array(MIN_FREQUENCY)), mel(np.array(MAX_FREQUENCY)), NUM_BANDS + 2)
+    edges = 700 * (10 ** (edges / 2595) - 1)
+
+    filterbank = np.zeros((NUM_BANDS, len(frequencies)), dtype=np.float32)
+    for i in range(NUM_BANDS):
+        left, center, right = edges[i : i + 3]
+        rising = (frequencies - left) / (center - left)
+        falling = (right - frequencies) / (right - center)
+        filterbank[i] = np.clip(np.minimum(rising, falling), 0, None)
+
+    return filterbank
+
+
+FILTERBANK = get_filterbank()
+WINDOW = np.hanning(FRAME_SIZE).astype(np.float32)
+
+
+def embed(samples: np.ndarray) -> np.ndarray | None:
+    if len(samples) < FRAME_SIZE:
+        return None
+
+    count = 1 + (len(samples) - FRAME_SIZE) // HOP_SIZE
+    indices = np.arange(FRAME_SIZE)[None, :] + HOP_SIZE * np.arange(count)[:, None]
+    spectrum = np.abs(np.fft.rfft(samples[indices] * WINDOW, axis=1)) ** 2
+    energies = np.log(spectrum @ FILTERBANK.T + 1e-8)
+
+    # only the frames with speech describe the voice
+    loudness = energies.sum(axis=1)
+    voiced = energies[loudness >= np.median(loudness)]
+
+    # removing the mean log energy makes the embedding independent of the volume
+    shape = voiced - voiced.mean(axis=1, keepdims=True)
+    embedding = np.concatenate([shape.mean(axis=0), shape.std(axis=0)])
+
+    return embedding / (np.linalg.norm(embedding) + 1e-8)
+
+
+class SpectralDiarizer:
+    def __init__(
+        self, max_speakers: int = whisper_mixed_max_speakers, threshold: float = whisper_mixed_speaker_threshold
+    ):
+        self.max_speakers = max_speakers
+        self.threshold = threshold
+        self.centroids: list[np.ndarray] = []
+        self.counts: list[int] = []
+
+    def identify(self, embedding: np.ndarray) -> int:
+        if self.centroids:
+            similarities = np.array([float(embedding @ centroid) for centroid in self.centroids])
+            best = int(similarities.argmax())
+
+            if similarities[best] >= self.threshold:
+                self.counts[best] += 1
+                centroid = self.centroids[best] + (embedding - self.centroids[best]) / self.counts[best]
+                self.centroids[best] = centroid / (np.linalg.norm(centroid) + 1e-8)
+                return best
+
+            # windows overlapping two speakers are somewhat close to both, they shouldn't become a new speaker
+            if similarities[best] >= self.threshold - UNCERTAIN_MARGIN:
+                return best
+
+            if len(self.centroids) >= self.max_speakers:
+                unconfirmed = [i for i, count in enumerate(self.counts) if count < MIN_SPEAKER_WORDS]
+                if not unconfirmed:
+                    return best
+
+                # replace a speaker that was never confirmed
+                self.centroids[unconfirmed[0]] = embedding
+                self.counts[unconfirmed[0]] = 1
+                return unconfirmed[0]
+
+        self.centroids.append(embedding)
+        self.counts.append(1)
+
+        return len(self.centroids) - 1
+
+    def is_confirmed(self, speaker: int) -> bool:
+        return self.counts[speaker] >= MIN_SPEAKER_WORDS
+
+    def assign(self, audio: bytes, words: list[dict]) -> list[int]:
+        """Returns the speaker of each word, the word timings are in seconds from the start of the audio."""
+        samples = np.frombuffer(audio[: len(audio) - len(audio) % 2], dtype=np.int16).astype(np.float32) / 32768
+        half_window = int(WINDOW_DURATION * SAMPLE_RATE / 2)
+
+        speakers = []
+        for word in words:
+            middle = int((word['start'] + word['end']) / 2 * SAMPLE_RATE)
+            start = max(0, min(middle - half_window, len(samples) - 2 * half_window))
+            embedding = embed(samples[start : middle + half_window])
+
+            if embedding is None:
+                speakers.append(speakers[-1] if speakers else 0)
+            else:
+                speakers.append(self.identify(embedding))
+
+        # words of unconfirmed speakers belong to the confirmed speaker before them, or after them at the start
+        for i in range(1, len(speakers)):
+            if not self.is_confirmed(speakers[i]) and self.is_confirmed(speakers[i - 1]):
+                speakers[i] = speakers[i - 1]
+        for i in range(len(speakers) - 2, -1, -1):
+            if not self.is_confirmed(speakers[i]) and self.is_confirmed(speakers[i + 1]):
+                speakers[i] = speakers[i + 1]
+
+        # a single word between two words of another speaker is most likely theirs too
+        for i in range(1, len(speakers) - 1):
+            if speakers[i - 1] == speakers[i + 1] != speakers[i]:
+                speakers[i] = speakers[i - 1]
+
+        return speakers
@@ -0,0 +1,61 @@
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def voice(pitch: float, formants: list[float], duration: float) -> np.ndarray:
+    '''Synthesizes a vowel like sound, the pitch and formants set the "voice".'''
+
+    t = np.arange(int(SAMPLE_RATE * duration)) / SAMPLE_RATE
+    phase = 2 * np.pi * np.cumsum(pitch * (1 + 0.03 * np.sin(2 * np.pi * 3 * t))) / SAMPLE_RATE
+    harmonics = sum(np.sin(k * phase) / k for k in range(1, 30))
+
+    frequencies = np.fft.rfftfreq(len(harmonics), 1 / SAMPLE_RATE)
+    envelope = sum(np.exp(-(((frequencies - formant) / 120) ** 2)) for formant in formants) + 0.05
+    audio = np.fft.irfft(np.fft.rfft(harmonics) * envelope, len(harmonics))
+
+    return audio / np.abs(audio).max() * 0.3
+
+
+class TestSpectralDiarizer:
+    def test_assign_speakers(self):
+        '''Test that two alternating voices are told apart and the first one is recognized when it speaks again.'''
+
+        from skynet.modules.stt.streaming_whisper.diarizer import SpectralDiarizer
+
+        first = voice(110, [700, 1200, 2600], 4)
+        second = voice(220, [400, 2000, 3000], 4)
+        audio = (np.concatenate([first, second, first]) * 32767).astype(np.int16).tobytes()
+        words = [{'start': start, 'end': start + 0.35} for start in np.arange(0, 12, 0.4)]
+
+        speakers = SpectralDiarizer().assign(audio, words)
+
+        assert set(speakers[:9]) == {0}
+        assert set(speakers[11:19]) == {1}
+        assert set(speakers[21:]) == {0}
+
+    def test_split_results_by_speaker(self, mocker):
+        '''Test that a mixed stream result is split in one result per speaker turn.'''
+
+        from skynet.modules.stt.streaming_whisper.mixed_state import MixedState
+        from skynet.modules.stt.streaming_whisper.state import WhisperResult
+        from skynet.modules.stt.streaming_whisper.utils import utils
+
+        state = MixedState('room')
+        mocker.patch.object(state.diarizer, 'assign', return_value=[0, 0, 1])
+        words = [
+            {'start': 0.0, 'end': 0.4, 'text': 'hello'},
+            {'start': 0.4, 'end': 0.8, 'text': 'there'},
+            {'start': 1.0, 'end': 1.4, 'text': 'hi'},
+        ]
+        result = utils.TranscriptionResponse(
+            id='1', participant_id='room', ts=1000, text='hello there hi', type='final'
+        )
+
+        split = state.split_by_speaker([result], b'', WhisperResult(text='', segments=words, language='en'), None)
+
+        assert [(r.participant_id, r.text.strip(), r.ts) for r in split] == [
+            ('room#0', 'hello there', 1000),
+            ('room#1', 'hi', 2000),
+        ]
+        assert split[0].id == '1' and split[1].id != '1'
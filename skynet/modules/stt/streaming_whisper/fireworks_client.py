@@ -5,12 +5,27 @@ import json
 import asyncio
 from urllib.parse import urlencode
 
+from skynet.env import fireworks_streaming_url, whisper_backend
+
+
+class TranscriptionError(Exception):
+    """The backend answered with an error, the connection itself is still usable."""
+
+
 class FireworksStreamingClient:
-    def __init__(self, api_key: str, language: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: str,
+        language: Optional[str] = None,
+        base_url: str = fireworks_streaming_url,
+        prompt: Optional[str] = None,
+    ):
         self.api_key = api_key
         self.language = language
+        # only sent when connecting, the streaming API has no way to change it for later requests
+        self.prompt = prompt
         self.ws = None
-        self.base_url = "wss://audio-streaming.us-virginia-1.direct.fireworks.ai/v1/audio/transcriptions/streaming"
+        self.base_url = base_url
 
     async def connect(self):
         params = {
@@ -18,6 +33,8 @@ class FireworksStreamingClient:
         }
         if self.language:
             params["language"] = self.language
+        if self.prompt:
+            params["prompt"] = self.prompt
 
         url = f"{self.base_url}?{urlencode(params)}"
         self.ws = await websockets.connect(
@@ -33,22 +50,24 @@ class FireworksStreamingClient:
     async def receive_transcription(self):
         if not self.ws:
             raise RuntimeError("WebSocket not connected. Call connect() first.")
-        response = await self.ws.recv()
-        return json.loads(response)
+        response = json.loads(await self.ws.recv())
+        if "error" in response:
+            raise TranscriptionError(f"Transcription failed: {response['error']}")
+        return response
 
     async def close(self):
         if self.ws:
             await self.ws.close()
             self.ws = None
 
-# Global client instance
-_client: Optional[FireworksStreamingClient] = None
-
-def get_client(language: Optional[str] = None) -> FireworksStreamingClient:
-    global _client
-    if not _client:
-        api_key = os.getenv("FIREWORKS_API_KEY")
-        if not api_key:
-            raise ValueError("FIREWORKS_API_KEY environment variable not set")
-        _client = FireworksStreamingClient(api_key, language)
-    return _client
+def get_client(language: Optional[str] = None, prompt: Optional[str] = None) -> FireworksStreamingClient:
+    # every participant needs its own stream, responses on a shared one would be mixed up
+    if whisper_backend == "mock":
+        from skynet.modules.stt.streaming_whisper.mock_client import MockStreamingClient
+
+        return MockStreamingClient(language)
+
+    api_key = os.getenv("FIREWORKS_API_KEY")
+    if not api_key:
+        raise ValueError("FIREWORKS_API_KEY environment variable not set")
+    return FireworksStreamingClient(api_key, language, prompt=prompt)
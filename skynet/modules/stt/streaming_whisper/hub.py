@@ -0,0 +1,166 @@
+"""
+Fans the transcriptions of a meeting out to read-only subscribers, e.g. dashboards or recorders, next to the client
+producing the audio.
+
+Every result is serialized once and queued for each subscriber, which sends it from its own task. The queue of a
+subscriber holds at most `WHISPER_SUBSCRIBER_QUEUE_SIZE` messages, a subscriber falling further behind is disconnected
+instead of slowing down the meeting or buffering without bounds.
+
+Subscribers are kept per meeting and customer, so they only receive the results of a meeting if it belongs to the
+customer of their JWT, even when it isn't live yet or is live on another node.
+
+With `WHISPER_SUBSCRIBER_BACKEND=redis` the results are published on a Redis channel per meeting and every worker
+listens to the channels of the meetings it has subscribers for, so subscribers can connect to any worker.
+"""
+
+import asyncio
+
+from starlette.websockets import WebSocket
+
+from skynet.env import whisper_subscriber_backend, whisper_subscriber_queue_size
+from skynet.logs import get_logger
+from skynet.modules.monitoring import dropped_subscribers, live_subscribers
+from skynet.modules.persistence import get_db, key
+
+log = get_logger(__name__)
+
+SLOW_SUBSCRIBER_CODE = 1008
+LISTEN_TIMEOUT = 1
+
+
+class Subscriber:
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str] = asyncio.Queue(queue_size)
+        self.dropped = False
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def put(self, message: str) -> bool:
+        """Queues a message, returns False if the subscriber is too far behind to take it."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            return False
+
+        return True
+
+    def drop(self):
+        # the sender may be stuck on a client that stopped reading, it's cancelled rather than left to catch up
+        self.dropped = True
+        self.task.cancel()
+        self.task = asyncio.get_running_loop().create_task(self.close())
+
+    async def run(self):
+        try:
+            while True:
+                await self.websocket.send_text(await self.queue.get())
+        except Exception as e:
+            log.debug(f'Stopped sending to a subscriber: {e}')
+
+    async def close(self):
+        try:
+            await self.websocket.close(SLOW_SUBSCRIBER_CODE, 'Subscriber is too slow')
+        except Exception as e:
+            log.debug(f'Failed to close a slow subscriber: {e}')
+
+
+class Hub:
+    def __init__(self, queue_size: int = whisper_subscriber_queue_size, backend: str = whisper_subscriber_backend):
+        self.queue_size = queue_size
+        self.backend = backend
+        self.subscribers: dict[str, set[Subscriber]] = {}
+        self.pubsub = None
+        self.listener = None
+
+    def is_distributed(self) -> bool:
+        return self.backend == 'redis'
+
+    @staticmethod
+    def get_channel(meeting_id: str, customer_id: str | None) -> str:
+        return key('transcripts', customer_id or '', meeting_id)
+
+    async def subscribe(self, meeting_id: str, customer_id: str | None, websocket: WebSocket) -> Subscriber:
+        channel = self.get_channel(meeting_id, customer_id)
+        subscriber = Subscriber(websocket, self.queue_size)
+        subscribers = self.subscribers.setdefault(channel, set())
+        subscribers.add(subscriber)
+        live_subscribers.inc()
+
+        if self.is_distributed() and len(subscribers) == 1:
+            if self.pubsub is None:
+                self.pubsub = get_db().pubsub()
+            await self.pubsub.subscribe(channel)
+            if self.listener is None:
+                self.listener = asyncio.get_running_loop().create_task(self.listen())
+
+        log.info(f'Meeting {meeting_id}: new subscriber, {len(subscribers)} subscribed')
+
+        return subscriber
+
+    async def unsubscribe(self, meeting_id: str, customer_id: str | None, subscriber: Subscriber):
+        channel = self.get_channel(meeting_id, customer_id)
+        subscribers = self.subscribers.get(channel)
+        if subscribers is None or subscriber not in subscribers:
+            return
+
+        subscribers.discard(subscriber)
+        subscriber.task.cancel()
+        live_subscribers.dec()
+
+        if not subscribers:
+            del self.subscribers[channel]
+            if self.is_distributed():
+                await self.pubsub.unsubscribe(channel)
+
+    async def publish(self, meeting_id: str, customer_id: str | None, message: str):
+        """`customer_id` is the customer the meeting belongs to."""
+        channel = self.get_channel(meeting_id, customer_id)
+        if not self.is_distributed():
+            self.deliver(channel, message)
+            return
+
+        try:
+            await get_db().publish(channel, message)
+        except Exception as e:
+            log.warning(f'Meeting {meeting_id}: failed to publish a result {e}')
+
+    def deliver(self, channel: str, message: str):
+        for subscriber in self.subscribers.get(channel, ()):
+            if subscriber.dropped or subscriber.put(message):
+                continue
+
+            log.warning(f'Channel {channel}: disconnecting a subscriber {self.queue_size} messages behind')
+            dropped_subscribers.inc()
+            subscriber.drop()
+
+    async def listen(self):
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=LISTEN_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f'Failed to receive the published results: {e}')
+                await asyncio.sleep(LISTEN_TIMEOUT)
+                continue
+
+            if message is not None:
+                self.deliver(message['channel'], message['data'])
+
+    async def close(self, code: int, reason: str):
+        """Disconnects every subscriber, e.g. to have them reconnect to another node."""
+        for channel, subscribers in list(self.subscribers.items()):
+            for subscriber in list(subscribers):
+                try:
+                    await subscriber.websocket.close(code, reason)
+                except Exception as e:
+                    log.debug(f'Channel {channel}: failed to close a subscriber {e}')
+                subscriber.task.cancel()
+                live_subscribers.dec()
+
+            del self.subscribers[channel]
+            if self.is_distributed():
+                await self.pubsub.unsubscribe(channel)
+
+
+hub = Hub()
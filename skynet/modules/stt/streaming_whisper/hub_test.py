@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+
+class TestHub:
+    @pytest.mark.asyncio
+    async def test_fan_out(self, mocker):
+        '''Test that every subscriber of a meeting gets its results, and only them, if it's of the same customer.'''
+
+        from skynet.modules.stt.streaming_whisper.hub import Hub
+
+        hub = Hub(queue_size=10, backend='memory')
+        first, second, other, stranger = [mocker.AsyncMock() for _ in range(4)]
+        subscriber = await hub.subscribe('meeting', 'customer', first)
+        await hub.subscribe('meeting', 'customer', second)
+        await hub.subscribe('other', 'customer', other)
+        await hub.subscribe('meeting', 'stranger', stranger)
+
+        await hub.publish('meeting', 'customer', 'hello')
+        await asyncio.sleep(0)
+        await hub.unsubscribe('meeting', 'customer', subscriber)
+        await hub.publish('meeting', 'customer', 'there')
+        await asyncio.sleep(0)
+
+        assert [call.args for call in first.send_text.call_args_list] == [('hello',)]
+        assert [call.args for call in second.send_text.call_args_list] == [('hello',), ('there',)]
+        other.send_text.assert_not_called()
+        stranger.send_text.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber(self, mocker):
+        '''Test that a subscriber too far behind is disconnected without holding back the others.'''
+
+        from skynet.modules.stt.streaming_whisper.hub import Hub, SLOW_SUBSCRIBER_CODE
+
+        hub = Hub(queue_size=2, backend='memory')
+        slow, fast = mocker.AsyncMock(), mocker.AsyncMock()
+
+        async def block(message):
+            await asyncio.Event().wait()
+
+        slow.send_text.side_effect = block
+        await hub.subscribe('meeting', None, slow)
+        await hub.subscribe('meeting', None, fast)
+
+        for i in range(4):
+            await hub.publish('meeting', None, str(i))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        slow.close.assert_called_once_with(SLOW_SUBSCRIBER_CODE, 'Subscriber is too slow')
+        assert fast.send_text.call_count == 4
+
+    @pytest.mark.asyncio
+    async def test_redis(self, mocker):
+        '''Test that results are published on the meeting's channel and delivered from the channels listened to.'''
+
+        from skynet.modules.stt.streaming_whisper.hub import Hub
+
+        messages = asyncio.Queue()
+
+        async def publish(channel, data):
+            messages.put_nowait({'channel': channel, 'data': data})
+
+        async def get_message(**kwargs):
+            return await messages.get()
+
+        db = mocker.MagicMock()
+        db.publish = mocker.AsyncMock(side_effect=publish)
+        pubsub = db.pubsub.return_value = mocker.AsyncMock()
+        pubsub.get_message.side_effect = get_message
+        mocker.patch('skynet.modules.stt.streaming_whisper.hub.get_db', return_value=db)
+
+        hub = Hub(backend='redis')
+        websocket = mocker.AsyncMock()
+        await hub.subscribe('meeting', 'customer', websocket)
+
+        await hub.publish('meeting', 'customer', 'hello')
+        for _ in range(3):
+            await asyncio.sleep(0)
+        hub.listener.cancel()
+
+        pubsub.subscribe.assert_called_once_with('skynet:transcripts:customer:meeting')
+        websocket.send_text.assert_called_once_with('hello')
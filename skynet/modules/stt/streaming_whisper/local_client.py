@@ -0,0 +1,78 @@
+import asyncio
+
+import numpy as np
+
+from skynet.env import (
+    beam_size,
+    whisper_compute_type,
+    whisper_device,
+    whisper_gpu_indices,
+    whisper_model_name,
+    whisper_model_path,
+)
+from skynet.logs import get_logger
+
+log = get_logger(__name__)
+
+
+class LocalWhisperClient:
+    """
+    Transcribes with a local faster-whisper model, in the verbose_json format of the Fireworks streaming API. The model
+    is only loaded the first time it's needed.
+    """
+
+    def __init__(self):
+        self.model = None
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def is_available() -> bool:
+        try:
+            import faster_whisper  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def load(self):
+        from faster_whisper import WhisperModel
+
+        log.info(f'Loading the local whisper model {whisper_model_name or whisper_model_path}')
+        self.model = WhisperModel(
+            whisper_model_name or whisper_model_path,
+            device=whisper_device,
+            device_index=whisper_gpu_indices,
+            compute_type=whisper_compute_type,
+            download_root=whisper_model_path if whisper_model_name else None,
+        )
+
+    def transcribe_sync(self, audio: bytes, language: str | None, prompt: str | None = None) -> dict:
+        if self.model is None:
+            self.load()
+
+        samples = np.frombuffer(audio, dtype=np.int16).astype(np.float32) / 32768
+        segments, _ = self.model.transcribe(
+            samples, language=language, beam_size=beam_size, word_timestamps=True, initial_prompt=prompt
+        )
+        words = [word for segment in segments for word in segment.words]
+
+        return {
+            'text': ''.join(word.word for word in words).strip(),
+            'segments': [
+                {
+                    'id': i,
+                    'start': word.start,
+                    'end': word.end,
+                    'text': word.word.strip(),
+                    'probability': word.probability,
+                }
+                for i, word in enumerate(words)
+            ],
+        }
+
+    async def transcribe(self, audio: bytes, language: str | None = None, prompt: str | None = None) -> dict:
+        # the model is shared by all the participants, running it concurrently would only make every request slower
+        async with self.lock:
+            return await asyncio.to_thread(self.transcribe_sync, audio, language, prompt)
+
+
+local_client = LocalWhisperClient()
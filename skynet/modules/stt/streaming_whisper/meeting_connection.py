@@ -1,9 +1,13 @@
+import time
 from typing import List
 
 from starlette.websockets import WebSocket
 
 from skynet.logs import get_logger
+from skynet.modules.monitoring import stage_durations
+from skynet.modules.stt.streaming_whisper import snapshot
 from skynet.modules.stt.streaming_whisper.chunk import Chunk
+from skynet.modules.stt.streaming_whisper.mixed_state import MixedState
 from skynet.modules.stt.streaming_whisper.state import State
 from skynet.modules.stt.streaming_whisper.utils import utils
 
@@ -11,12 +15,15 @@ log = get_logger(__name__)
 
 
 class MeetingConnection:
-    participants: dict[str, State] = {}
-    previous_transcription_tokens: List[int]
+    participants: dict[str, State]
 
-    def __init__(self, websocket: WebSocket):
+    def __init__(self, websocket: WebSocket, mixed: bool = False, customer_id: str | None = None):
         self.websocket = websocket
-        self.previous_transcription_tokens = []
+        # the customer of the JWT which started the meeting, only its clients can read the meeting's results
+        self.customer_id = customer_id
+        # a single stream carries all the speakers, who are told apart on the server
+        self.mixed = mixed
+        self.participants = {}
 
     async def connect(self):
         await self.websocket.accept()
@@ -27,7 +34,8 @@ class MeetingConnection:
 
     def add_participant(self, participant_id: str, language: str) -> None:
         if participant_id not in self.participants:
-            self.participants[participant_id] = State(language)
+            state_class = MixedState if self.mixed else State
+            self.participants[participant_id] = state_class(participant_id, language)
 
     def remove_participant(self, participant_id: str) -> None:
         if participant_id in self.participants:
@@ -35,6 +43,45 @@ class MeetingConnection:
             state.close()
             del self.participants[participant_id]
 
+    async def process(
+        self, chunk: bytes, chunk_timestamp: int, received_at: float
+    ) -> List[utils.TranscriptionResponse] | None:
+        """
+        `received_at` is the perf_counter reading taken when the chunk was received.
+        """
+        stage_durations['ingest'].observe(time.perf_counter() - received_at)
+
+        if snapshot.is_snapshot(chunk):
+            self.import_snapshot(chunk)
+            return None
+
+        a_chunk = Chunk(chunk, chunk_timestamp, received_at)
+        self.add_participant(a_chunk.participant_id, a_chunk.language)
+
+        return await self.participants[a_chunk.participant_id].process(a_chunk)
+
+    async def force_transcription(self, participant_id: str) -> List[utils.TranscriptionResponse] | None:
+        if participant_id not in self.participants:
+            return None
+
+        return await self.participants[participant_id].force_transcription()
+
+    def export_snapshot(self) -> bytes:
+        return snapshot.dump_meeting(self.participants)
+
+    def import_snapshot(self, data: bytes) -> None:
+        """Restores the participants of a meeting that was moved here from a draining node."""
+        try:
+            participants = snapshot.load_meeting(data)
+        except Exception as e:
+            log.warning(f'Failed to import the meeting snapshot: {e}')
+            return
+
+        for participant_id, state in participants.items():
+            if participant_id not in self.participants:
+                self.participants[participant_id] = state
+        log.info(f'Imported the state of {len(participants)} participants')
+
     async def transcribe(self, chunk: Chunk) -> None:
         if chunk.participant_id not in self.participants:
             self.add_participant(chunk.participant_id, chunk.language)
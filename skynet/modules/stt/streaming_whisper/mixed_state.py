@@ -0,0 +1,92 @@
+from typing import List
+
+from skynet.modules.stt.streaming_whisper.diarizer import SpectralDiarizer
+from skynet.modules.stt.streaming_whisper.state import State, WhisperResult
+from skynet.modules.stt.streaming_whisper.utils import utils
+
+
+class MixedState(State):
+    """
+    Transcribes a single audio stream carrying all the speakers of a meeting, e.g. a room microphone, with one backend
+    session. The words of each result are attributed to speakers by the diarizer and the result is split in one result
+    per speaker turn, the participant id of a speaker being the stream's participant id followed by `#` and the index
+    of the speaker.
+    """
+
+    def __init__(self, participant_id: str, lang: str = 'en', **kwargs):
+        super().__init__(participant_id, lang, **kwargs)
+        self.diarizer = SpectralDiarizer()
+        self.last_transcription: tuple[bytes, WhisperResult | None] = (b'', None)
+
+    async def do_transcription(self, audio: bytes) -> WhisperResult | None:
+        ts_result = await super().do_transcription(audio)
+        self.last_transcription = (audio, ts_result)
+        return ts_result
+
+    async def process(self, chunk) -> List[utils.TranscriptionResponse] | None:
+        results = await super().process(chunk)
+        audio, ts_result = self.last_transcription
+        if not results or ts_result is None:
+            return results
+
+        cut_mark = utils.get_cut_mark_from_segment_probability(ts_result)
+        return self.split_by_speaker(results, audio, ts_result, cut_mark.end)
+
+    async def force_transcription(self) -> List[utils.TranscriptionResponse] | None:
+        results = await super().force_transcription()
+        audio, ts_result = self.last_transcription
+        if not results or ts_result is None:
+            return results
+
+        return self.split_by_speaker(results, audio, ts_result, None)
+
+    def split_by_speaker(
+        self,
+        results: List[utils.TranscriptionResponse],
+        audio: bytes,
+        ts_result: WhisperResult,
+        cut_at: float | None,
+    ) -> List[utils.TranscriptionResponse]:
+        words = ts_result.segments
+        speakers = self.diarizer.assign(audio, words)
+        has_final = any(result.type == 'final' for result in results)
+
+        split_results = []
+        for result in results:
+            # same split as State._extract_transcriptions, the final is cut at the last pause
+            if cut_at is None or not has_final:
+                indices = range(len(words))
+            elif result.type == 'final':
+                indices = [i for i, word in enumerate(words) if word['start'] < cut_at]
+            else:
+                indices = [i for i, word in enumerate(words) if word['start'] >= cut_at]
+
+            turns = []
+            for i in indices:
+                if turns and turns[-1][0] == speakers[i]:
+                    turns[-1][1].append(words[i])
+                else:
+                    turns.append((speakers[i], [words[i]]))
+
+            if not turns:
+                split_results.append(result)
+                continue
+
+            first_start = turns[0][1][0]['start']
+            for n, (speaker, turn_words) in enumerate(turns):
+                ts = result.ts + int((turn_words[0]['start'] - first_start) * 1000)
+                text = ''.join(word['text'] + ('' if ' ' in word['text'] else ' ') for word in turn_words)
+                split_results.append(
+                    result.model_copy(
+                        update={
+                            # the first turn keeps the id so that clients keep updating the same interim
+                            'id': result.id if n == 0 else str(self.uuid.get(ts)),
+                            'participant_id': f'{self.participant_id}#{speaker}',
+                            'ts': ts,
+                            'text': text,
+                            'audio': result.audio if n == 0 else '',
+                        }
+                    )
+                )
+
+        return split_results
@@ -0,0 +1,67 @@
+import asyncio
+from typing import Optional
+
+from skynet.env import whisper_mock_latency
+from skynet.modules.stt.streaming_whisper.utils import utils
+
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit']
+
+# how long, in seconds, each word spans in the voiced parts of the audio
+WORD_DURATION = 0.35
+
+
+def transcribe(audio: bytes, word_duration: float = WORD_DURATION, probability: float = 0.9) -> dict:
+    """
+    Transcribes each voiced part of the audio as a sequence of placeholder words of `word_duration` seconds, in the
+    verbose_json format of the Fireworks streaming API.
+    """
+    _, speech_timestamps = utils.is_silent(audio)
+
+    segments = []
+    for speech in speech_timestamps:
+        start = speech['start'] / 16000
+        end = speech['end'] / 16000
+        while end - start >= word_duration / 2:
+            word_end = min(start + word_duration, end)
+            segments.append(
+                {
+                    'id': len(segments),
+                    'start': round(start, 3),
+                    'end': round(word_end, 3),
+                    'text': WORDS[len(segments) % len(WORDS)],
+                    'probability': probability,
+                }
+            )
+            start = word_end
+
+    return {'text': ' '.join(segment['text'] for segment in segments), 'segments': segments}
+
+
+class MockStreamingClient:
+    """
+    Stands in for `FireworksStreamingClient` without any network access, so the streaming pipeline can be benchmarked
+    offline. The audio is transcribed with `transcribe` after a fixed latency.
+    """
+
+    def __init__(self, language: Optional[str] = None, latency_ms: int = whisper_mock_latency):
+        self.language = language
+        self.latency = latency_ms / 1000
+        self.audio = None
+
+    async def connect(self):
+        pass
+
+    async def send_audio(self, audio_chunk: bytes):
+        self.audio = audio_chunk
+
+    async def receive_transcription(self):
+        if self.audio is None:
+            raise RuntimeError('No audio was sent.')
+
+        audio, self.audio = self.audio, None
+        await asyncio.sleep(self.latency)
+
+        return transcribe(audio)
+
+    async def close(self):
+        pass
@@ -0,0 +1,280 @@
+"""
+Makes the transcription backend resilient to slow and failing connections.
+
+Every request has a deadline. A connection that fails or misses a deadline is dropped, since a late response would be
+read as the answer to the next request, and re-established on the next request after a jittered backoff. Requests
+that take longer than the p95 of the recent ones are hedged on a second connection and the first answer wins, the
+hedge connection is closed once it went unused for `WHISPER_HEDGE_IDLE_TIMEOUT` seconds. After
+`WHISPER_CIRCUIT_BREAKER_THRESHOLD` consecutive failures the circuit breaker opens and, if enabled, the local model
+transcribes until a probe request to the backend succeeds again. Requests turned away while a connection backs off
+never reach the backend and aren't counted as failures.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+
+from skynet.env import (
+    whisper_backend_timeout,
+    whisper_circuit_breaker_reset,
+    whisper_circuit_breaker_threshold,
+    whisper_fallback_to_local,
+    whisper_hedge_idle_timeout,
+    whisper_hedge_requests,
+    whisper_reconnect_max_backoff,
+)
+from skynet.logs import get_logger
+from skynet.modules.monitoring import (
+    backend_reconnects,
+    backend_sessions,
+    backend_timeouts,
+    circuit_breaker_state,
+    fallback_transcriptions,
+    hedged_requests,
+)
+from skynet.modules.stt.streaming_whisper.fireworks_client import get_client, TranscriptionError
+from skynet.modules.stt.streaming_whisper.local_client import local_client
+
+log = get_logger(__name__)
+
+RECONNECT_BASE_BACKOFF = 0.1
+
+# below this many samples the p95 isn't meaningful and requests are not hedged
+MIN_LATENCY_SAMPLES = 20
+
+
+class BackoffError(ConnectionError):
+    """The connection is waiting to reconnect, the request wasn't sent to the backend."""
+
+
+class LatencyTracker:
+    def __init__(self, size: int = 200):
+        self.latencies = deque(maxlen=size)
+        self.p95 = None
+
+    def add(self, latency: float):
+        self.latencies.append(latency)
+
+        if len(self.latencies) >= MIN_LATENCY_SAMPLES:
+            ordered = sorted(self.latencies)
+            self.p95 = ordered[int(len(ordered) * 0.95) - 1]
+
+    def get_p95(self) -> float | None:
+        return self.p95
+
+
+class CircuitBreaker:
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+    def __init__(
+        self, threshold: int = whisper_circuit_breaker_threshold, reset_timeout: float = whisper_circuit_breaker_reset
+    ):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def set_state(self, state: int):
+        if state != self.state:
+            log.warning(f'Transcription backend circuit breaker is now {["closed", "half open", "open"][state]}')
+        self.state = state
+        circuit_breaker_state.set(state)
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+
+        # once the reset timeout passes a single probe request is let through
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.set_state(self.HALF_OPEN)
+            return True
+
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.set_state(self.CLOSED)
+
+    def record_skipped(self):
+        # a probe that never reached the backend doesn't tell if it recovered, the next request probes again
+        if self.state == self.HALF_OPEN:
+            self.set_state(self.OPEN)
+
+    def record_failure(self):
+        self.failures += 1
+
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self.set_state(self.OPEN)
+
+
+latencies = LatencyTracker()
+circuit_breaker = CircuitBreaker()
+
+
+class BackendConnection:
+    def __init__(self, language: str | None, idle_timeout: float | None = None):
+        self.language = language
+        self.client = None
+        self.dropped = False
+        self.backoff = RECONNECT_BASE_BACKOFF
+        self.retry_at = 0.0
+        # seconds after which an unused connection is closed, None to keep it open
+        self.idle_timeout = idle_timeout
+        self.idle_timer: asyncio.TimerHandle | None = None
+
+    async def ensure_connected(self, prompt: str | None = None):
+        if self.client is not None:
+            return self.client
+
+        now = time.monotonic()
+        if now < self.retry_at:
+            raise BackoffError(f'Reconnecting to the transcription backend in {self.retry_at - now:.1f}s')
+
+        client = get_client(self.language, prompt)
+        try:
+            await client.connect()
+        except Exception:
+            self.schedule_retry()
+            raise
+
+        if self.dropped:
+            backend_reconnects.inc()
+        self.dropped = False
+        self.backoff = RECONNECT_BASE_BACKOFF
+        self.client = client
+        backend_sessions.inc()
+
+        return client
+
+    def schedule_retry(self):
+        # decorrelated jitter, so the connections dropped by the same outage don't all come back at once
+        self.backoff = min(whisper_reconnect_max_backoff, random.uniform(RECONNECT_BASE_BACKOFF, self.backoff * 3))
+        self.retry_at = time.monotonic() + self.backoff
+
+    def drop(self):
+        if self.client is not None:
+            asyncio.create_task(self.client.close()).add_done_callback(lambda task: task.exception())
+            self.client = None
+            backend_sessions.dec()
+        self.dropped = True
+        self.schedule_retry()
+
+    def close_idle(self):
+        self.idle_timer = None
+        if self.client is not None:
+            log.debug('Closing an idle connection to the transcription backend')
+            client, self.client = self.client, None
+            backend_sessions.dec()
+            asyncio.create_task(client.close()).add_done_callback(lambda task: task.exception())
+
+    async def request(self, audio: bytes, prompt: str | None = None) -> dict:
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+
+        client = await self.ensure_connected(prompt)
+
+        try:
+            await client.send_audio(audio)
+            return await client.receive_transcription()
+        except TranscriptionError:
+            raise
+        except BaseException:
+            # includes the cancellation after a missed deadline or a lost hedge
+            self.drop()
+            raise
+        finally:
+            if self.idle_timeout is not None and self.client is not None:
+                self.idle_timer = asyncio.get_running_loop().call_later(self.idle_timeout, self.close_idle)
+
+    async def close(self):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+
+        if self.client is not None:
+            client, self.client = self.client, None
+            backend_sessions.dec()
+            await client.close()
+
+
+class ResilientStreamingClient:
+    def __init__(self, language: str | None = None):
+        self.language = language
+        self.primary = BackendConnection(language)
+        # only needed while the backend is slow, so it doesn't hold a second session for the whole meeting
+        self.hedge = BackendConnection(language, whisper_hedge_idle_timeout)
+        # whether the model was prompted with the text preceding the audio of the last transcription
+        self.prompted = False
+
+    async def transcribe(self, audio: bytes, prompt: str | None = None) -> dict:
+        """
+        `prompt` is the text preceding the audio. The local model is prompted with it on every request, the backend
+        only when a session is opened since its streaming API doesn't take a prompt per request.
+        """
+        if not circuit_breaker.allow():
+            self.prompted = prompt is not None
+            return await self.transcribe_locally(audio, prompt)
+
+        self.prompted = False
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self.hedged_request(audio, prompt), whisper_backend_timeout)
+        except BackoffError:
+            circuit_breaker.record_skipped()
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                backend_timeouts.inc()
+            circuit_breaker.record_failure()
+            raise
+
+        circuit_breaker.record_success()
+        latencies.add(time.perf_counter() - start)
+
+        return result
+
+    async def hedged_request(self, audio: bytes, prompt: str | None = None) -> dict:
+        primary = asyncio.create_task(self.primary.request(audio, prompt))
+        tasks = {primary}
+        hedged = False
+
+        try:
+            hedge_after = latencies.get_p95()
+            if whisper_hedge_requests and hedge_after is not None:
+                await asyncio.wait(tasks, timeout=hedge_after)
+                if not primary.done():
+                    tasks.add(asyncio.create_task(self.hedge.request(audio, prompt)))
+                    hedged = True
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if hedged:
+                            hedged_requests['primary' if task is primary else 'hedge'].inc()
+                        return task.result()
+                    error = task.exception()
+
+            if hedged:
+                hedged_requests['none'].inc()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def transcribe_locally(self, audio: bytes, prompt: str | None = None) -> dict:
+        if not whisper_fallback_to_local or not local_client.is_available():
+            raise ConnectionError('The transcription backend is unavailable')
+
+        fallback_transcriptions.inc()
+        return await local_client.transcribe(audio, self.language, prompt)
+
+    async def close(self):
+        await asyncio.gather(self.primary.close(), self.hedge.close(), return_exceptions=True)
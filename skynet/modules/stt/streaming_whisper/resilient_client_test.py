@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+
+class FakeClient:
+    def __init__(self, delay: float = 0, fail: bool = False, text: str = 'hello'):
+        self.delay = delay
+        self.fail = fail
+        self.text = text
+        self.closed = False
+
+    async def connect(self):
+        pass
+
+    async def send_audio(self, audio_chunk: bytes):
+        pass
+
+    async def receive_transcription(self):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError('Connection lost')
+        return {'text': self.text, 'segments': []}
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture()
+def backend(mocker):
+    from skynet.modules.stt.streaming_whisper.resilient_client import CircuitBreaker, LatencyTracker
+
+    mocker.patch('skynet.modules.stt.streaming_whisper.resilient_client.whisper_backend_timeout', 0.2)
+    mocker.patch('skynet.modules.stt.streaming_whisper.resilient_client.latencies', LatencyTracker())
+    breaker = mocker.patch(
+        'skynet.modules.stt.streaming_whisper.resilient_client.circuit_breaker',
+        CircuitBreaker(threshold=2, reset_timeout=60),
+    )
+    clients = []
+
+    def set_clients(*fake_clients):
+        clients.extend(fake_clients)
+
+    mocker.patch(
+        'skynet.modules.stt.streaming_whisper.resilient_client.get_client',
+        side_effect=lambda language, prompt: clients.pop(0),
+    )
+
+    return set_clients, breaker
+
+
+class TestResilientStreamingClient:
+    @pytest.mark.asyncio
+    async def test_deadline_drops_the_connection(self, backend):
+        '''Test that a request missing its deadline fails and the stalled connection is dropped.'''
+
+        from skynet.modules.stt.streaming_whisper.resilient_client import ResilientStreamingClient
+
+        set_clients, _ = backend
+        stalled = FakeClient(delay=10)
+        set_clients(stalled)
+        client = ResilientStreamingClient('en')
+
+        with pytest.raises(asyncio.TimeoutError):
+            await client.transcribe(b'audio')
+        await asyncio.sleep(0)
+
+        assert stalled.closed
+        assert client.primary.client is None
+
+    @pytest.mark.asyncio
+    async def test_slow_requests_are_hedged(self, backend, mocker):
+        '''Test that a request slower than the p95 is sent to a second connection which answers first.'''
+
+        from skynet.modules.stt.streaming_whisper import resilient_client
+
+        set_clients, _ = backend
+        set_clients(FakeClient(delay=10, text='primary'), FakeClient(text='hedge'))
+        mocker.patch.object(resilient_client.latencies, 'get_p95', return_value=0.01)
+        client = resilient_client.ResilientStreamingClient('en')
+
+        result = await client.transcribe(b'audio')
+
+        assert result['text'] == 'hedge'
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_falls_back_to_local(self, backend, mocker):
+        '''Test that consecutive failures open the circuit breaker and the local model takes over.'''
+
+        from skynet.modules.stt.streaming_whisper import resilient_client
+
+        set_clients, breaker = backend
+        set_clients(FakeClient(fail=True), FakeClient(fail=True))
+        mocker.patch.object(resilient_client, 'whisper_fallback_to_local', True)
+        mocker.patch.object(resilient_client.local_client, 'is_available', return_value=True)
+        local = mocker.patch.object(resilient_client.local_client, 'transcribe', return_value={'text': 'local'})
+        client = resilient_client.ResilientStreamingClient('en')
+
+        for _ in range(2):
+            client.primary.retry_at = 0
+            with pytest.raises(ConnectionError):
+                await client.transcribe(b'audio')
+
+        assert breaker.state == breaker.OPEN
+        assert (await client.transcribe(b'audio'))['text'] == 'local'
+        local.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_backoff_is_not_a_failure(self, backend):
+        '''Test that the requests turned away while reconnecting don't count towards opening the circuit breaker.'''
+
+        from skynet.modules.stt.streaming_whisper.resilient_client import BackoffError, ResilientStreamingClient
+
+        set_clients, breaker = backend
+        set_clients(FakeClient(fail=True))
+        client = ResilientStreamingClient('en')
+
+        with pytest.raises(ConnectionError):
+            await client.transcribe(b'audio')
+        client.primary.retry_at = float('inf')
+        for _ in range(2):
+            with pytest.raises(BackoffError):
+                await client.transcribe(b'audio')
+
+        assert breaker.failures == 1
+        assert breaker.state == breaker.CLOSED
+
+    @pytest.mark.asyncio
+    async def test_idle_hedge_is_closed(self, backend, mocker):
+        '''Test that the hedge connection is closed once it went unused for a while.'''
+
+        from skynet.modules.stt.streaming_whisper import resilient_client
+
+        set_clients, _ = backend
+        hedge = FakeClient(text='hedge')
+        set_clients(FakeClient(delay=10, text='primary'), hedge)
+        mocker.patch.object(resilient_client.latencies, 'get_p95', return_value=0.01)
+        mocker.patch.object(resilient_client, 'whisper_hedge_idle_timeout', 0.05)
+        client = resilient_client.ResilientStreamingClient('en')
+
+        assert (await client.transcribe(b'audio'))['text'] == 'hedge'
+        assert client.hedge.client is hedge
+
+        await asyncio.sleep(0.1)
+
+        assert client.hedge.client is None
+        assert hedge.closed
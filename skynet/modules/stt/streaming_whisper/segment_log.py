@@ -0,0 +1,294 @@
+"""
+Append-only log of the final transcriptions of each meeting, so the transcript can be read back by a reconnecting
+client or summarized without the client uploading it again.
+
+Each meeting has its own file in `WHISPER_SEGMENT_LOG_DIR`. A record is a fixed size header holding its length, the
+timestamp, the variance and the lengths of the id, participant id and text, followed by those three as UTF-8. Reads go
+through a memory map of the file and a sorted index of the timestamps, so reading a time range only touches the records
+in it. The index is rebuilt by scanning the file when a log is opened again, e.g. after the meeting moved to this node.
+
+The customer the meeting belongs to is kept next to its log, so that any node can tell who may read it. Logs no node
+wrote to for `WHISPER_SEGMENT_LOG_RETENTION` seconds are deleted along with their owner.
+
+Only the node the meeting is live on writes to its log. The other nodes, which may share the directory, open it read-only
+and ignore a trailing record they find incomplete, since it may still be being written. Appends run in the threadpool,
+so that a slow disk doesn't hold up the event loop.
+"""
+
+import asyncio
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from contextlib import suppress
+from hashlib import sha256
+
+from skynet.env import whisper_segment_log_dir, whisper_segment_log_retention
+from skynet.logs import get_logger
+from skynet.modules.stt.streaming_whisper.utils import utils
+
+log = get_logger(__name__)
+
+# record length, ts, variance and the lengths of the id, participant id and text
+RECORD_HEADER = struct.Struct('!IqfHHI')
+
+SAFE_MEETING_ID = re.compile(r'^[A-Za-z0-9_.-]{1,128}$')
+
+# seconds between two scans of the directory for expired logs
+EVICTION_INTERVAL = 600
+
+
+def encode(segment: utils.TranscriptionResponse) -> bytes:
+    segment_id = segment.id.encode('utf-8')
+    participant_id = segment.participant_id.encode('utf-8')
+    text = segment.text.encode('utf-8')
+    length = RECORD_HEADER.size + len(segment_id) + len(participant_id) + len(text)
+
+    return b''.join(
+        [
+            RECORD_HEADER.pack(length, segment.ts, segment.variance, len(segment_id), len(participant_id), len(text)),
+            segment_id,
+            participant_id,
+            text,
+        ]
+    )
+
+
+def decode(data, offset: int) -> tuple[utils.TranscriptionResponse, int]:
+    """Returns the record at `offset` and its length."""
+    length, ts, variance, id_length, participant_length, text_length = RECORD_HEADER.unpack_from(data, offset)
+    start = offset + RECORD_HEADER.size
+    participant_start = start + id_length
+    text_start = participant_start + participant_length
+
+    segment = utils.TranscriptionResponse(
+        id=bytes(data[start:participant_start]).decode('utf-8'),
+        participant_id=bytes(data[participant_start:text_start]).decode('utf-8'),
+        ts=ts,
+        text=bytes(data[text_start : text_start + text_length]).decode('utf-8'),
+        type='final',
+        variance=variance,
+    )
+
+    return segment, length
+
+
+class SegmentLog:
+    def __init__(self, path: str, writable: bool = True):
+        self.path = path
+        self.map = None
+        # reads run in the threadpool, a read must not have the map closed under it by another one remapping it, nor
+        # see the index and the size of the log halfway through an append
+        self.map_lock = threading.Lock()
+        # appends run in the threadpool too, one at a time, and the file isn't closed in the middle of one
+        self.write_lock = threading.Lock()
+        # (ts, offset) of every record, sorted by timestamp
+        self.index: list[tuple[int, int]] = []
+        self.size = 0
+        self.load_index(truncate=writable)
+        self.file = open(path, 'ab') if writable else None
+
+    def load_index(self, truncate: bool = True):
+        self.size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        data = self.get_map()
+        offset = 0
+
+        while offset + RECORD_HEADER.size <= self.size:
+            length, ts = struct.unpack_from('!Iq', data, offset)
+            if length < RECORD_HEADER.size or offset + length > self.size:
+                break
+            self.index.append((ts, offset))
+            offset += length
+
+        if offset < self.size and truncate:
+            # a partial record left by a crash, new records must not be appended after it
+            log.warning(f'Truncating a partial record at {offset} in {self.path}')
+            self.close_map()
+            os.truncate(self.path, offset)
+
+        self.size = offset
+
+        self.index.sort()
+
+    def get_map(self):
+        if self.size == 0:
+            return b''
+
+        if self.map is None or len(self.map) < self.size:
+            self.close_map()
+            with open(self.path, 'rb') as file:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return self.map
+
+    def append(self, segment: utils.TranscriptionResponse):
+        record = encode(segment)
+
+        with self.write_lock:
+            if self.file is None:
+                raise ValueError(f'{self.path} is closed')
+
+            self.file.write(record)
+            self.file.flush()
+
+            with self.map_lock:
+                insort(self.index, (segment.ts, self.size))
+                self.size += len(record)
+
+    def read(self, start: int | None = None, end: int | None = None) -> list[utils.TranscriptionResponse]:
+        """Returns the segments starting between the `start` and `end` timestamps, in millis, ordered by timestamp."""
+        with self.map_lock:
+            low = 0 if start is None else bisect_left(self.index, (start, -1))
+            high = len(self.index) if end is None else bisect_right(self.index, (end, self.size))
+            data = self.get_map()
+            return [decode(data, offset)[0] for _, offset in self.index[low:high]]
+
+    def close_map(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def close(self):
+        with self.write_lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+        with self.map_lock:
+            self.close_map()
+
+
+class SegmentLogStore:
+    def __init__(self, directory: str = whisper_segment_log_dir, retention: int = whisper_segment_log_retention):
+        self.directory = directory
+        self.retention = retention
+        self.logs: dict[str, SegmentLog] = {}
+        # the logs are opened by the appends, in the threadpool
+        self.logs_lock = threading.Lock()
+        self.evicted_at = time.monotonic()
+
+    def is_enabled(self) -> bool:
+        return bool(self.directory)
+
+    def get_path(self, meeting_id: str) -> str:
+        filename = meeting_id if SAFE_MEETING_ID.match(meeting_id) else sha256(meeting_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{filename}.log')
+
+    def get(self, meeting_id: str) -> SegmentLog:
+        with self.logs_lock:
+            if meeting_id not in self.logs:
+                os.makedirs(self.directory, exist_ok=True)
+                self.logs[meeting_id] = SegmentLog(self.get_path(meeting_id))
+
+            return self.logs[meeting_id]
+
+    def set_owner(self, meeting_id: str, customer_id: str | None):
+        if not self.is_enabled():
+            return
+
+        path = f'{self.get_path(meeting_id)}.owner'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # written to a temporary file first so that other nodes never read a partial id
+            with open(f'{path}.tmp', 'w') as file:
+                file.write(customer_id or '')
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            log.warning(f'Meeting {meeting_id}: failed to write the owner of the segment log {e}')
+
+    def get_owner(self, meeting_id: str) -> str | None:
+        """The customer id of the meeting, empty if it has none, None if it isn't known."""
+        if not self.is_enabled():
+            return None
+
+        try:
+            with open(f'{self.get_path(meeting_id)}.owner') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, meeting_id: str) -> bool:
+        return meeting_id in self.logs or os.path.exists(self.get_path(meeting_id))
+
+    async def append(self, meeting_id: str, segment: utils.TranscriptionResponse):
+        if not self.is_enabled() or segment.type != 'final':
+            return
+
+        try:
+            await asyncio.to_thread(self.write, meeting_id, segment)
+        except (OSError, ValueError) as e:
+            # ValueError if the meeting ended while the segment was waiting for a thread
+            log.warning(f'Meeting {meeting_id}: failed to append to the segment log {e}')
+
+    def write(self, meeting_id: str, segment: utils.TranscriptionResponse):
+        self.get(meeting_id).append(segment)
+
+        if self.retention and time.monotonic() - self.evicted_at > EVICTION_INTERVAL:
+            self.evicted_at = time.monotonic()
+            self.evict()
+
+    def evict(self):
+        """
+        Deletes the logs which weren't written to for `retention` seconds, and their owner. The owner of a meeting
+        without a log expires on its own.
+        """
+        live = {segment_log.path for segment_log in list(self.logs.values())}
+        deadline = time.time() - self.retention
+
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError as e:
+            log.warning(f'Failed to list the segment logs {e}')
+            return
+
+        for entry in entries:
+            if entry.name.endswith('.log'):
+                path = entry.path
+            elif entry.name.endswith('.log.owner') and not os.path.exists(entry.path.removesuffix('.owner')):
+                path = entry.path.removesuffix('.owner')
+            else:
+                continue
+
+            try:
+                if path in live or entry.stat().st_mtime >= deadline:
+                    continue
+                log.info(f'Deleting the expired segment log {path}')
+                # another node sharing the directory may be deleting it as well
+                for expired in [path, f'{path}.owner']:
+                    with suppress(FileNotFoundError):
+                        os.remove(expired)
+            except OSError as e:
+                log.warning(f'Failed to delete the expired segment log {path} {e}')
+
+    def read(
+        self, meeting_id: str, start: int | None = None, end: int | None = None
+    ) -> list[utils.TranscriptionResponse]:
+        if not self.is_enabled() or not self.exists(meeting_id):
+            return []
+
+        if meeting_id in self.logs:
+            return self.logs[meeting_id].read(start, end)
+
+        # the meeting isn't live on this node, the log is only opened for this read
+        segment_log = SegmentLog(self.get_path(meeting_id), writable=False)
+        try:
+            return segment_log.read(start, end)
+        finally:
+            segment_log.close()
+
+    def get_transcript(self, meeting_id: str, start: int | None = None, end: int | None = None) -> str:
+        """The transcript as text, one line per segment, ready to be summarized."""
+        return '\n'.join(
+            f'{segment.participant_id}: {segment.text.strip()}' for segment in self.read(meeting_id, start, end)
+        )
+
+    def close(self, meeting_id: str):
+        segment_log = self.logs.pop(meeting_id, None)
+        if segment_log is not None:
+            segment_log.close()
+
+
+segment_logs = SegmentLogStore()
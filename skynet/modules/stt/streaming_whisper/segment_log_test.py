@@ -0,0 +1,96 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from skynet.modules.stt.streaming_whisper.utils import utils
+
+
+def segment(ts: int, text: str, participant_id: str = 'someone') -> utils.TranscriptionResponse:
+    return utils.TranscriptionResponse(id=f'id-{ts}', participant_id=participant_id, ts=ts, text=text, type='final')
+
+
+@pytest.fixture()
+def store(tmp_path):
+    from skynet.modules.stt.streaming_whisper.segment_log import SegmentLogStore
+
+    return SegmentLogStore(str(tmp_path))
+
+
+class TestSegmentLog:
+    @pytest.mark.asyncio
+    async def test_range_read(self, store):
+        '''Test that segments are read back ordered by timestamp and filtered by range.'''
+
+        for ts, text in [(3000, 'third'), (1000, 'first'), (2000, 'second')]:
+            await store.append('meeting', segment(ts, text))
+        await store.append('meeting', utils.TranscriptionResponse(id='x', participant_id='p', ts=1500, text='interim'))
+
+        assert [s.text for s in store.read('meeting')] == ['first', 'second', 'third']
+        assert [s.text for s in store.read('meeting', start=1500, end=3000)] == ['second', 'third']
+        assert store.read('meeting', start=1000, end=1000)[0] == segment(1000, 'first')
+
+    @pytest.mark.asyncio
+    async def test_reopen_and_truncated_record(self, store):
+        '''Test that a closed log is read from disk and a partial record left by a crash is dropped.'''
+
+        await store.append('meeting', segment(1000, 'hello', 'ü'))
+        store.close('meeting')
+        with open(store.get_path('meeting'), 'ab') as file:
+            file.write(b'\x00\x00\x01')
+
+        await store.append('meeting', segment(2000, 'there'))
+
+        assert store.get_transcript('meeting') == 'ü: hello\nsomeone: there'
+
+    @pytest.mark.asyncio
+    async def test_read_not_live(self, store):
+        '''Test that reading a log live on another node neither writes to it nor drops a record being appended.'''
+
+        await store.append('meeting', segment(1000, 'hello'))
+        store.close('meeting')
+        path = store.get_path('meeting')
+        with open(path, 'ab') as file:
+            file.write(b'\x00\x00\x01')
+        size = os.path.getsize(path)
+
+        assert store.get_transcript('meeting') == 'someone: hello'
+        assert os.path.getsize(path) == size
+
+    @pytest.mark.asyncio
+    async def test_concurrent_appends(self, store):
+        '''Test that appends running in the threadpool at the same time all end up in the log.'''
+
+        await asyncio.gather(*[store.append('meeting', segment(ts, f'segment {ts}')) for ts in range(50)])
+        store.close('meeting')
+
+        assert [s.ts for s in store.read('meeting')] == list(range(50))
+
+    @pytest.mark.asyncio
+    async def test_append_after_close(self, store):
+        '''Test that a segment waiting for a thread while its meeting ends is dropped without reopening the log.'''
+
+        segment_log = store.get('meeting')
+        store.close('meeting')
+
+        with pytest.raises(ValueError):
+            segment_log.append(segment(1000, 'late'))
+
+    @pytest.mark.asyncio
+    async def test_evict(self, store):
+        '''Test that the logs nobody wrote to within the retention are deleted with their owner, but not live ones.'''
+
+        for meeting_id in ['live', 'expired', 'recent']:
+            await store.append(meeting_id, segment(1000, 'hello'))
+            store.set_owner(meeting_id, 'customer')
+        store.set_owner('no log', 'customer')
+        store.close('expired')
+        store.close('recent')
+
+        expired = time.time() - store.retention - 1
+        for path in [store.get_path('live'), store.get_path('expired'), f'{store.get_path("no log")}.owner']:
+            os.utime(path, (expired, expired))
+        store.evict()
+
+        assert sorted(os.listdir(store.directory)) == ['live.log', 'live.log.owner', 'recent.log', 'recent.log.owner']
@@ -0,0 +1,160 @@
+"""
+Compact binary snapshots of the participants' transcription state, used to move a meeting to another node.
+
+A meeting snapshot is the magic prefix, a version byte, the number of participants and then, for each participant, the
+length of its state followed by the state itself. A participant state is made of length prefixed strings, the kind of
+state, the fixed size counters and the pending audio. The state of a mixed stream is followed by the speakers known to
+its diarizer, so that they keep their index on the new node. All integers are big endian.
+
+Version 1 snapshots, without the kind of state, are still loaded as single speaker states.
+"""
+
+import struct
+
+import numpy as np
+
+from skynet.modules.stt.streaming_whisper.mixed_state import MixedState
+from skynet.modules.stt.streaming_whisper.state import State
+
+SNAPSHOT_MAGIC = b'SKYNET-SNAPSHOT'
+SNAPSHOT_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+
+STATE_KIND = 0
+MIXED_STATE_KIND = 1
+
+# working_audio_starts_at, last_received_chunk, silent_chunks, chunk_count, long_silence
+COUNTERS = struct.Struct('!qqIIB')
+# number of words attributed to the speaker, number of values of its centroid
+SPEAKER = struct.Struct('!IH')
+
+
+def is_snapshot(data: bytes) -> bool:
+    return data.startswith(SNAPSHOT_MAGIC)
+
+
+def pack_str(value: str) -> bytes:
+    encoded = value.encode('utf-8')
+    return struct.pack('!H', len(encoded)) + encoded
+
+
+def unpack_str(data: memoryview, offset: int) -> tuple[str, int]:
+    (length,) = struct.unpack_from('!H', data, offset)
+    offset += 2
+    return bytes(data[offset : offset + length]).decode('utf-8'), offset + length
+
+
+def dump_speakers(state: MixedState) -> bytes:
+    diarizer = state.diarizer
+    parts = [struct.pack('!H', len(diarizer.centroids))]
+
+    for centroid, count in zip(diarizer.centroids, diarizer.counts):
+        parts.append(SPEAKER.pack(count, len(centroid)))
+        parts.append(centroid.astype('>f4').tobytes())
+
+    return b''.join(parts)
+
+
+def load_speakers(state: MixedState, data: memoryview, offset: int) -> int:
+    (count,) = struct.unpack_from('!H', data, offset)
+    offset += 2
+
+    for _ in range(count):
+        words, size = SPEAKER.unpack_from(data, offset)
+        offset += SPEAKER.size
+        centroid = np.frombuffer(data, dtype='>f4', count=size, offset=offset).astype(np.float32)
+        offset += size * 4
+        state.diarizer.centroids.append(centroid)
+        state.diarizer.counts.append(words)
+
+    return offset
+
+
+def dump_state(state: State) -> bytes:
+    mixed = isinstance(state, MixedState)
+
+    return b''.join(
+        [
+            pack_str(state.participant_id),
+            pack_str(state.lang),
+            pack_str(state.transcription_id),
+            struct.pack('!B', MIXED_STATE_KIND if mixed else STATE_KIND),
+            COUNTERS.pack(
+                state.working_audio_starts_at,
+                state.last_received_chunk,
+                state.silent_chunks,
+                state.chunk_count,
+                state.long_silence,
+            ),
+            struct.pack('!I', len(state.working_audio)),
+            state.working_audio,
+            dump_speakers(state) if mixed else b'',
+        ]
+    )
+
+
+def load_state(data: memoryview, version: int = SNAPSHOT_VERSION) -> State:
+    participant_id, offset = unpack_str(data, 0)
+    lang, offset = unpack_str(data, offset)
+    transcription_id, offset = unpack_str(data, offset)
+
+    kind = STATE_KIND
+    if version > 1:
+        (kind,) = struct.unpack_from('!B', data, offset)
+        offset += 1
+
+    state = MixedState(participant_id, lang) if kind == MIXED_STATE_KIND else State(participant_id, lang)
+    state.transcription_id = transcription_id
+    (
+        state.working_audio_starts_at,
+        state.last_received_chunk,
+        state.silent_chunks,
+        state.chunk_count,
+        long_silence,
+    ) = COUNTERS.unpack_from(data, offset)
+    state.long_silence = bool(long_silence)
+    offset += COUNTERS.size
+
+    (audio_length,) = struct.unpack_from('!I', data, offset)
+    offset += 4
+    state.working_audio = bytes(data[offset : offset + audio_length])
+    offset += audio_length
+
+    if isinstance(state, MixedState):
+        load_speakers(state, data, offset)
+
+    return state
+
+
+def dump_meeting(participants: dict[str, State]) -> bytes:
+    parts = [SNAPSHOT_MAGIC, struct.pack('!BH', SNAPSHOT_VERSION, len(participants))]
+
+    for state in participants.values():
+        dumped = dump_state(state)
+        parts.append(struct.pack('!I', len(dumped)))
+        parts.append(dumped)
+
+    return b''.join(parts)
+
+
+def load_meeting(data: bytes) -> dict[str, State]:
+    if not is_snapshot(data):
+        raise ValueError('Not a meeting snapshot')
+
+    view = memoryview(data)
+    offset = len(SNAPSHOT_MAGIC)
+    version, count = struct.unpack_from('!BH', view, offset)
+    offset += 3
+
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f'Unsupported snapshot version {version}')
+
+    participants = {}
+    for _ in range(count):
+        (length,) = struct.unpack_from('!I', view, offset)
+        offset += 4
+        state = load_state(view[offset : offset + length], version)
+        offset += length
+        participants[state.participant_id] = state
+
+    return participants
@@ -0,0 +1,66 @@
+import pytest
+
+from skynet.modules.stt.streaming_whisper.snapshot import dump_meeting, is_snapshot, load_meeting
+from skynet.modules.stt.streaming_whisper.state import State
+
+
+class TestSnapshot:
+    def test_round_trip(self):
+        '''Test that the participants' state survives a dump and a load.'''
+
+        state = State('participant-1', 'ro')
+        state.transcription_id = 'transcription-1'
+        state.working_audio = b'\x01\x02' * 1000
+        state.working_audio_starts_at = 1700000000000
+        state.last_received_chunk = 1700000001000
+        state.silent_chunks = 2
+        state.chunk_count = 7
+        state.long_silence = True
+
+        data = dump_meeting({'participant-1': state, 'participant-2': State('participant-2')})
+        restored = load_meeting(data)
+
+        assert is_snapshot(data)
+        assert list(restored) == ['participant-1', 'participant-2']
+
+        restored_state = restored['participant-1']
+        for attr in [
+            'participant_id',
+            'lang',
+            'transcription_id',
+            'working_audio',
+            'working_audio_starts_at',
+            'last_received_chunk',
+            'silent_chunks',
+            'chunk_count',
+            'long_silence',
+        ]:
+            assert getattr(restored_state, attr) == getattr(state, attr)
+
+    def test_mixed_state(self):
+        '''Test that a mixed stream is restored as such, along with the speakers known to its diarizer.'''
+
+        import numpy as np
+
+        from skynet.modules.stt.streaming_whisper.mixed_state import MixedState
+
+        state = MixedState('room', 'en')
+        state.working_audio = b'\x01\x02' * 10
+        state.diarizer.centroids = [np.array([0.6, 0.8], dtype=np.float32), np.array([1.0, 0.0], dtype=np.float32)]
+        state.diarizer.counts = [5, 1]
+
+        restored = load_meeting(dump_meeting({'room': state, 'participant': State('participant')}))
+
+        assert type(restored['room']) is MixedState
+        assert type(restored['participant']) is State
+        assert restored['room'].working_audio == state.working_audio
+        assert restored['room'].diarizer.counts == [5, 1]
+        for restored_centroid, centroid in zip(restored['room'].diarizer.centroids, state.diarizer.centroids):
+            assert restored_centroid.dtype == np.float32
+            assert np.array_equal(restored_centroid, centroid)
+
+    def test_load_rejects_other_payloads(self):
+        '''Test that audio chunks are not mistaken for snapshots.'''
+
+        with pytest.raises(ValueError):
+            load_meeting(b'participant-1' + b'\x00' * 100)
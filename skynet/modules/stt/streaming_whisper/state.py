@@ -1,17 +1,28 @@
 import asyncio
 import base64
 import time
+from collections import deque
 from typing import List, Optional
+
 from pydantic import BaseModel
 
+from skynet.env import whisper_return_transcribed_audio as return_audio
 from skynet.logs import get_logger
-from skynet.modules.monitoring import TRANSCRIBE_DURATION_METRIC
+from skynet.modules.monitoring import stage_durations, transcription_duration
+from skynet.modules.stt.streaming_whisper.cadence import CadenceController, InterimSuppressor
 from skynet.modules.stt.streaming_whisper.chunk import Chunk
-from skynet.modules.stt.streaming_whisper.fireworks_client import FireworksStreamingClient, get_client
+from skynet.modules.stt.streaming_whisper.context import TranscriptContext
+from skynet.modules.stt.streaming_whisper.resilient_client import ResilientStreamingClient
 from skynet.modules.stt.streaming_whisper.utils import utils
 
 log = get_logger(__name__)
 
+# the working audio is cut at multiples of this many bytes, finer when the next slice is transcribed with the context
+# of the final, whose last words then don't have to be repeated in the audio. The context only reaches the local model,
+# the backend sessions don't take a prompt per request
+SLICE_BYTES = 2048
+SLICE_BYTES_WITH_CONTEXT = 512
+
 class WhisperResult(BaseModel):
     text: str
     segments: List[dict]
@@ -26,7 +37,7 @@ class State:
     working_audio_starts_at: int
     chunk_duration: float
     last_received_chunk: int
-    fireworks_client: Optional[FireworksStreamingClient] = None
+    backend_client: Optional[ResilientStreamingClient] = None
     transcription_state: dict = {}
 
     def __init__(
@@ -42,12 +53,22 @@ class State:
         self.participant_id = participant_id
         self.silent_chunks = 0
         self.chunk_count = 0
+        self.chunk_duration = 0
+        self.long_silence = False
         self.working_audio = b''
         self.lang = lang
-        self.add_max_silent_chunks = add_max_silent_chunks
-        self.final_after_x_silent_chunks = final_after_x_silent_chunks
+        self.cadence = CadenceController(add_max_silent_chunks, final_after_x_silent_chunks)
+        # seconds of audio added since the last transcription request
+        self.new_audio_duration = 0.0
+        self.suppressor = InterimSuppressor()
+        self.context = TranscriptContext()
         self.is_transcribing = False
         self.last_received_chunk = utils.now()
+        # size and perf_counter receipt time of the chunks in the working audio, finals are timed from their first chunk
+        self.audio_received_at: deque[tuple[int, float]] = deque()
+        self.last_received_at: float | None = None
+        # receipt time of the oldest chunk added since the last transcription request
+        self.pending_since: float | None = None
         self.uuid = utils.Uuid7()
         self.transcription_id = str(self.uuid.get())
         self.is_transcribing = False
@@ -65,29 +86,35 @@ class State:
         for word in ts_result.segments:
             space = ' ' if ' ' not in word['text'] else ''
             # search for final up to silence
-            if word['id'] < last_pause.end:
-                final_starts_at = word['id'] if final_starts_at is None else final_starts_at
+            if word['start'] < last_pause.end:
+                final_starts_at = word['start'] if final_starts_at is None else final_starts_at
                 final += word['text'] + space
                 log.debug(f'Participant {self.participant_id}: final is "{final}"')
             # consider everything else as interim
             else:
-                interim_starts_at = word['id'] if interim_starts_at is None else interim_starts_at
+                interim_starts_at = word['start'] if interim_starts_at is None else interim_starts_at
                 interim += word['text'] + space
                 log.debug(f'Participant {self.participant_id}: interim is "{interim}"')
 
         if final.strip():
-            cut_mark_bytes = self.get_num_bytes_for_slicing(last_pause.end)
+            cut_mark_bytes = self.get_num_bytes_for_slicing(last_pause.end, self.get_slice_bytes())
             if cut_mark_bytes > 0:
                 log.debug(f'Participant {self.participant_id}: cut mark set at {cut_mark_bytes} bytes')
                 final_start_timestamp = self.working_audio_starts_at + int(final_starts_at * 1000)
                 final_audio = None
+                final_received_at = self.get_speech_received_at()
                 final_raw_audio = self.trim_working_audio(cut_mark_bytes)
                 if return_audio:
                     final_audio_length = utils.convert_bytes_to_seconds(final_raw_audio)
                     final_audio = utils.get_wav_header([final_raw_audio], final_audio_length) + final_raw_audio
                 results.append(
                     self.get_response_payload(
-                        final, final_start_timestamp, final_audio, True, probability=last_pause.probability
+                        final,
+                        final_start_timestamp,
+                        final_audio,
+                        True,
+                        probability=last_pause.probability,
+                        received_at=final_received_at,
                     )
                 )
                 # advance the start timestamp of the working audio to the start of the interim
@@ -97,7 +124,7 @@ class State:
                 # return everything as interim if failed to slice and acquire cut mark
                 results.append(
                     self.get_response_payload(
-                        final + interim, self.working_audio_starts_at + int(ts_result.segments[0]['id'] * 1000)
+                        final + interim, self.working_audio_starts_at + int(ts_result.segments[0]['start'] * 1000)
                     )
                 )
                 return results
@@ -112,18 +139,24 @@ class State:
         if self.silent_chunks == self.chunk_count:
             return False
         working_audio_duration = utils.convert_bytes_to_seconds(self.working_audio)
-        if working_audio_duration >= 1 and not self.long_silence:
-            return True
-        return False
+        if working_audio_duration < 1 or self.long_silence:
+            return False
+        if self.cadence.finals_only:
+            # wait for the participant to pause, the transcription is then mostly final
+            return self.silent_chunks > 0
+        return self.new_audio_duration >= self.cadence.interim_interval
 
-    async def force_transcription(self, previous_tokens) -> List[utils.TranscriptionResponse] | None:
+    async def force_transcription(self) -> List[utils.TranscriptionResponse] | None:
         results = None
         if self.is_transcribing:
             return results
-        ts_result = await self.do_transcription(self.working_audio, previous_tokens)
+        ts_result = await self.do_transcription(self.working_audio)
+        if ts_result is None:
+            # keep the audio so that it's transcribed on the next attempt
+            return results
         if ts_result.text.strip():
             results = []
-            start_timestamp = int(ts_result.segments[0]['id'] * 1000) + self.working_audio_starts_at
+            start_timestamp = int(ts_result.segments[0]['start'] * 1000) + self.working_audio_starts_at
             final_audio = None
             if return_audio:
                 final_audio_length = utils.convert_bytes_to_seconds(self.working_audio)
@@ -140,8 +173,9 @@ class State:
         self.reset()
         return results
 
-    async def process(self, chunk: Chunk, previous_tokens: list[int]) -> List[utils.TranscriptionResponse] | None:
+    async def process(self, chunk: Chunk) -> List[utils.TranscriptionResponse] | None:
         self.last_received_chunk = self.last_received_chunk if chunk.silent else utils.now()
+        self.last_received_at = chunk.received_at
         self.chunk_count += 1
         if self.chunk_duration == 0:
             self.chunk_duration = chunk.duration
@@ -151,19 +185,31 @@ class State:
             f'total chunks {self.chunk_count}.'
         )
         self.add_to_store(chunk)
+        self.cadence.update()
 
         if self.should_transcribe() and not self.is_transcribing:
-            ts_result = await self.do_transcription(self.working_audio, previous_tokens)
-            last_pause = utils.get_cut_mark_from_segment_probability(ts_result)
-            results = self._extract_transcriptions(last_pause, ts_result)
+            # without a pause there's no final to cut, and with little new speech the interim would be the same
+            if self.silent_chunks == 0 and self.suppressor.should_skip():
+                log.debug(f'Participant {self.participant_id}: skipping the interim, not enough new speech')
+                self.new_audio_duration = 0.0
+                return None
+            ts_result = await self.do_transcription(self.working_audio)
+            with stage_durations['post_process'].time():
+                last_pause = utils.get_cut_mark_from_segment_probability(ts_result)
+                results = self.drop_unchanged_interims(self._extract_transcriptions(last_pause, ts_result))
             if len(results) > 0:
                 return results
         log.debug(f'Participant {self.participant_id}: no ts results')
         return None
 
     def add_to_store(self, chunk: Chunk):
-        if not chunk.silent or (chunk.silent and self.silent_chunks < self.add_max_silent_chunks):
+        if not chunk.silent or (chunk.silent and self.silent_chunks < self.cadence.add_max_silent_chunks):
             self.working_audio += chunk.raw
+            self.audio_received_at.append((chunk.size, chunk.received_at))
+            if self.pending_since is None:
+                self.pending_since = chunk.received_at
+            self.new_audio_duration += chunk.duration
+            self.suppressor.add(chunk.duration, utils.get_speech_duration(chunk.speech_timestamps))
             log.debug(
                 f'Participant {self.participant_id}: the audio buffer is '
                 + f'{utils.convert_bytes_to_seconds(self.working_audio)}s long'
@@ -171,7 +217,7 @@ class State:
         if chunk.silent:
             log.debug(f'Participant {self.participant_id}: the chunk is silent.')
             self.silent_chunks += 1
-            if self.silent_chunks > self.final_after_x_silent_chunks:
+            if self.silent_chunks > self.cadence.final_after_x_silent_chunks:
                 self.long_silence = True
         else:
             if self.working_audio_starts_at == 0:
@@ -179,6 +225,18 @@ class State:
             self.long_silence = False
             self.silent_chunks = 0
 
+    def drop_unchanged_interims(
+        self, results: List[utils.TranscriptionResponse]
+    ) -> List[utils.TranscriptionResponse]:
+        kept = []
+        for result in results:
+            if result.type == 'final':
+                self.suppressor.on_final()
+                kept.append(result)
+            elif not self.suppressor.is_unchanged(result.text):
+                kept.append(result)
+        return kept
+
     def trim_working_audio(self, bytes_to_cut: int) -> bytes:
         log.debug(
             f'Participant {self.participant_id}: '
@@ -186,6 +244,11 @@ class State:
         )
         dropped_chunk = self.working_audio[:bytes_to_cut]
         self.working_audio = self.working_audio[bytes_to_cut:]
+        while self.audio_received_at and self.audio_received_at[0][0] <= bytes_to_cut:
+            bytes_to_cut -= self.audio_received_at.popleft()[0]
+        if self.audio_received_at and bytes_to_cut > 0:
+            size, received_at = self.audio_received_at[0]
+            self.audio_received_at[0] = (size - bytes_to_cut, received_at)
         if len(self.working_audio) == 0:
             self.working_audio_starts_at = 0
         log.debug(
@@ -194,16 +257,25 @@ class State:
         )
         return dropped_chunk
 
+    def get_speech_received_at(self) -> float | None:
+        """
+        When the first chunk of the working audio was received, unknown for the audio imported from a snapshot
+        """
+        return self.audio_received_at[0][1] if self.audio_received_at else None
+
     def get_response_payload(
         self, transcription: str, start_timestamp: int, final_audio: bytes | None = None, final: bool = False, **kwargs
     ) -> utils.TranscriptionResponse:
         prob = kwargs.get('probability', 0.5)
+        # a final is timed from the first chunk of its audio, an interim from the chunk that triggered it
+        received_at = kwargs.get('received_at', self.get_speech_received_at() if final else self.last_received_at)
         if not self.transcription_id:
             self.transcription_id = str(self.uuid.get(start_timestamp))
         ts_id = self.transcription_id
         if final:
             self.transcription_id = ''
-        return utils.TranscriptionResponse(
+            self.context.add(transcription)
+        response = utils.TranscriptionResponse(
             id=ts_id,
             participant_id=self.participant_id,
             ts=start_timestamp,
@@ -212,6 +284,14 @@ class State:
             type='final' if final else 'interim',
             variance=prob,
         )
+        response._received_at = received_at
+        return response
+
+    def close(self):
+        self.cadence.close()
+        if self.backend_client:
+            asyncio.get_running_loop().create_task(self.backend_client.close())
+            self.backend_client = None
 
     def reset(self):
         """
@@ -220,37 +300,44 @@ class State:
         log.debug(f'Participant {self.participant_id}: flushing working audio')
         self.working_audio_starts_at = 0
         self.working_audio = b''
+        self.audio_received_at.clear()
+        self.suppressor.on_final()
+
+    def get_slice_bytes(self) -> int:
+        # the next slice is most likely transcribed the same way as the last one
+        prompted = self.backend_client is not None and self.backend_client.prompted
+        return SLICE_BYTES_WITH_CONTEXT if prompted and self.context.is_enabled() else SLICE_BYTES
 
     @staticmethod
-    def get_num_bytes_for_slicing(cut_mark: float) -> int:
+    def get_num_bytes_for_slicing(cut_mark: float, slice_bytes: int = SLICE_BYTES) -> int:
         byte_threshold = utils.convert_seconds_to_bytes(cut_mark)
-        # the resulting value needs to be a multiple of 2048
-        sliceable_bytes_multiplier, _ = divmod(byte_threshold, 2048)
-        sliceable_bytes = sliceable_bytes_multiplier * 2048
+        # the resulting value needs to be a multiple of `slice_bytes`
+        sliceable_bytes_multiplier, _ = divmod(byte_threshold, slice_bytes)
+        sliceable_bytes = sliceable_bytes_multiplier * slice_bytes
         log.debug(f'Sliceable bytes: {sliceable_bytes}')
         return sliceable_bytes
 
-    async def do_transcription(self, audio: bytes, previous_tokens: list[int]) -> WhisperResult | None:
+    async def do_transcription(self, audio: bytes) -> WhisperResult | None:
         self.is_transcribing = True
+        self.new_audio_duration = 0.0
+        self.suppressor.on_request()
+        if self.pending_since is not None:
+            stage_durations['queue'].observe(time.perf_counter() - self.pending_since)
+            self.pending_since = None
         start = time.perf_counter_ns()
         
         try:
-            if not self.fireworks_client:
-                self.fireworks_client = await get_client(self.lang)
-                await self.fireworks_client.connect()
-            
-            # Send audio chunk
-            await self.fireworks_client.send_audio(audio)
-            
-            # Get transcription result
-            result = await self.fireworks_client.receive_transcription()
+            if not self.backend_client:
+                self.backend_client = ResilientStreamingClient(self.lang)
+
+            result = await self.backend_client.transcribe(audio, self.context.get_prompt())
             
             # Convert to WhisperResult format
-            whisper_result = WhisperResult({
-                'text': ' '.join([segment['text'] for segment in result['segments']]),
-                'segments': result['segments'],
-                'language': self.lang
-            })
+            whisper_result = WhisperResult(
+                text=' '.join([segment['text'] for segment in result['segments']]),
+                segments=result['segments'],
+                language=self.lang,
+            )
             
         except Exception as e:
             log.error(f'Participant {self.participant_id}: failed to transcribe {e}')
@@ -259,7 +346,9 @@ class State:
             
         end = time.perf_counter_ns()
         processing_time = (end - start) / 1e6 / 1000
-        TRANSCRIBE_DURATION_METRIC.observe(processing_time)
+        transcription_duration.observe(processing_time)
+        self.cadence.observe_latency(processing_time)
+        stage_durations['backend'].observe(processing_time)
         log.debug(whisper_result)
         self.is_transcribing = False
         return whisper_result
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+def get_chunk(size: int, received_at: float):
+    return SimpleNamespace(
+        raw=b'\x01' * size,
+        size=size,
+        duration=0.1,
+        silent=False,
+        speech_timestamps=[],
+        timestamp=1000,
+        received_at=received_at,
+    )
+
+
+class TestState:
+    def test_received_at(self):
+        '''Test that a final is timed from the first chunk of its audio and an interim from the last chunk.'''
+
+        from skynet.modules.stt.streaming_whisper.state import State
+
+        state = State('participant')
+        for received_at in [1.0, 2.0, 3.0]:
+            chunk = get_chunk(100, received_at)
+            state.last_received_at = chunk.received_at
+            state.add_to_store(chunk)
+
+        assert state.get_response_payload('final', 0, final=True)._received_at == 1.0
+        assert state.get_response_payload('interim', 0)._received_at == 3.0
+
+        state.trim_working_audio(150)
+        assert state.get_speech_received_at() == 2.0
+        assert list(state.audio_received_at) == [(50, 2.0), (100, 3.0)]
+
+        state.trim_working_audio(150)
+        assert state.get_speech_received_at() is None
+
+    @pytest.mark.asyncio
+    async def test_queue(self, mocker):
+        '''Test that the queue stage is timed from the oldest chunk waiting for a transcription.'''
+
+        from skynet.modules.stt.streaming_whisper import state as state_module
+
+        observe = mocker.patch.object(state_module.stage_durations['queue'], 'observe')
+        mocker.patch('skynet.modules.stt.streaming_whisper.state.time.perf_counter', return_value=5.0)
+
+        state = state_module.State('participant')
+        state.backend_client = mocker.AsyncMock()
+        state.backend_client.transcribe.return_value = {'segments': []}
+        state.add_to_store(get_chunk(100, 1.0))
+        state.add_to_store(get_chunk(100, 2.0))
+
+        await state.do_transcription(state.working_audio)
+        await state.do_transcription(state.working_audio)
+
+        observe.assert_called_once_with(4.0)
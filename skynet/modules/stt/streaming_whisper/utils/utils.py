@@ -2,10 +2,12 @@ import secrets
 import time
 from datetime import datetime, timezone
 from typing import List, Optional, Tuple
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 import base64
 import uuid
 
+import numpy as np
+
 from skynet.logs import get_logger
 
 log = get_logger(__name__)
@@ -40,6 +42,8 @@ class TranscriptionResponse(BaseModel):
     audio: Optional[str] = None
     type: str = "interim"  # "interim" or "final"
     variance: float = 0.0
+    # perf_counter reading of when the audio of the result was received, not sent to the client
+    _received_at: Optional[float] = PrivateAttr(default=None)
 
 
 class CutMark(BaseModel):
@@ -180,6 +184,13 @@ LANGUAGES = {
 
 black_listed_prompts = ['. .']
 
+# energy based voice activity detection, on 30ms frames of 16kHz 16-bit mono audio
+VAD_FRAME_SAMPLES = 480
+VAD_RMS_THRESHOLD = 0.01
+
+# a pause between two words at least this long, in seconds, is where a final can be cut
+MIN_PAUSE_DURATION = 0.3
+
 
 def convert_bytes_to_seconds(byte_str: bytes) -> float:
     return len(byte_str) / (16000 * 2)
@@ -217,6 +228,68 @@ def get_wav_header(chunks: List[bytes], chunk_duration_s: float = 0.256, sample_
     return header
 
 
+def is_silent(audio: bytes) -> Tuple[bool, List[dict]]:
+    """
+    Returns if the audio is silent and the start and end, in samples, of the parts that contain speech
+    """
+    samples = np.frombuffer(audio[: len(audio) - len(audio) % 2], dtype=np.int16).astype(np.float32) / 32768
+    frames = len(samples) // VAD_FRAME_SAMPLES
+    if frames == 0:
+        return True, []
+
+    rms = np.sqrt(np.mean(samples[: frames * VAD_FRAME_SAMPLES].reshape(frames, VAD_FRAME_SAMPLES) ** 2, axis=1))
+    voiced = rms >= VAD_RMS_THRESHOLD
+
+    speech_timestamps = []
+    start = None
+    for i, is_voiced in enumerate(voiced):
+        if is_voiced and start is None:
+            start = i
+        elif not is_voiced and start is not None:
+            speech_timestamps.append({'start': start * VAD_FRAME_SAMPLES, 'end': i * VAD_FRAME_SAMPLES})
+            start = None
+    if start is not None:
+        speech_timestamps.append({'start': start * VAD_FRAME_SAMPLES, 'end': frames * VAD_FRAME_SAMPLES})
+
+    return len(speech_timestamps) == 0, speech_timestamps
+
+
+def get_speech_duration(speech_timestamps: List[dict]) -> float:
+    """Seconds of speech in the parts returned by `is_silent`"""
+    return sum(part['end'] - part['start'] for part in speech_timestamps) / 16000
+
+
+def get_phrase_prob(last_word_idx: int, words: List[dict]) -> float:
+    """Average probability of the words up to and including `last_word_idx`"""
+    probabilities = [word.get('probability', 0.5) for word in words[: last_word_idx + 1]]
+    return sum(probabilities) / len(probabilities) if probabilities else 0.0
+
+
+def get_cut_mark_from_segment_probability(ts_result) -> CutMark:
+    """
+    Returns the last pause between two words of the transcription, the audio before it can be sent as a final
+    """
+    if ts_result is None:
+        return CutMark()
+
+    words = ts_result.segments
+    for i in range(len(words) - 1, 0, -1):
+        pause_start = words[i - 1]['end']
+        pause_end = words[i]['start']
+        if pause_end - pause_start >= MIN_PAUSE_DURATION:
+            return CutMark(start=pause_start, end=pause_end, probability=get_phrase_prob(i - 1, words))
+
+    return CutMark()
+
+
+def get_jwt(ws_headers, ws_url_param: str | None = None) -> str:
+    """Returns the JWT from the auth_token url parameter, falling back to the Authorization header"""
+    if ws_url_param:
+        return ws_url_param
+    auth_header = ws_headers.get('authorization', '')
+    return auth_header.split(' ')[-1]
+
+
 def now() -> int:
     """Returns now UTC timestamp since epoch in millis"""
     return int(datetime.now(timezone.utc).timestamp() * 1000)
@@ -234,5 +307,11 @@ def get_lang(lang: str, short=True) -> str:
 
 
 class Uuid7:
-    def get(self) -> uuid.UUID:
-        return uuid.uuid4()  # Using uuid4 for simplicity
+    def get(self, timestamp: int | None = None) -> uuid.UUID:
+        """Returns a UUIDv7, sortable by the `timestamp` in millis it was generated for"""
+        timestamp = now() if timestamp is None else timestamp
+        value = (timestamp & 0xFFFFFFFFFFFF) << 80 | secrets.randbits(80)
+        # set the version and the variant bits
+        value = value & ~(0xF << 76) | 0x7 << 76
+        value = value & ~(0x3 << 62) | 0x2 << 62
+        return uuid.UUID(int=value)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from skynet.modules.stt.streaming_whisper.state import WhisperResult
+from skynet.modules.stt.streaming_whisper.utils import utils
+
+
+def get_audio(*parts: tuple[float, float]) -> bytes:
+    '''Builds 16kHz 16-bit audio from (duration, amplitude) parts.'''
+
+    samples = [amplitude * np.sin(2 * np.pi * 220 * np.arange(int(16000 * d)) / 16000) for d, amplitude in parts]
+    return (np.concatenate(samples) * 32767).astype(np.int16).tobytes()
+
+
+class TestIsSilent:
+    def test_silence(self):
+        '''Test that silent audio has no speech.'''
+
+        assert utils.is_silent(get_audio((1, 0))) == (True, [])
+
+    def test_speech_timestamps(self):
+        '''Test that the voiced parts of the audio are found.'''
+
+        silent, speech_timestamps = utils.is_silent(get_audio((0.48, 0), (0.48, 0.3), (0.48, 0)))
+
+        assert not silent
+        assert speech_timestamps == [{'start': 7680, 'end': 15360}]
+
+
+class TestGetCutMark:
+    def test_cut_at_last_pause(self):
+        '''Test that the cut mark is set at the last pause between words.'''
+
+        segments = [
+            {'id': 0, 'start': 0.0, 'end': 0.4, 'text': 'hello', 'probability': 0.8},
+            {'id': 1, 'start': 1.0, 'end': 1.4, 'text': 'there', 'probability': 0.6},
+            {'id': 2, 'start': 1.4, 'end': 1.8, 'text': 'friend', 'probability': 0.9},
+        ]
+        result = WhisperResult(text='hello there friend', segments=segments, language='en')
+
+        cut_mark = utils.get_cut_mark_from_segment_probability(result)
+
+        assert (cut_mark.start, cut_mark.end, cut_mark.probability) == (0.4, 1.0, 0.8)
+
+    def test_no_pause(self):
+        '''Test that there is no cut mark without a pause.'''
+
+        assert utils.get_cut_mark_from_segment_probability(None).end == 0
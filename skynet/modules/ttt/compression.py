@@ -0,0 +1,156 @@
+"""
+Extractive compression of transcripts before they're summarized.
+
+Spoken text is full of fillers, stutters and sentences said twice, which cost tokens, and for long meetings more
+chunks in the map stage, without adding anything to the summary. This runs on the CPU before the text is split:
+
+1. fillers ("um", "uh", ...) and immediately repeated words are removed;
+2. near-duplicate sentences are dropped, keeping the first one. Sentences are compared by the MinHash signatures of
+   their word shingles, bucketed with LSH so that only likely duplicates are compared;
+3. if a budget is set and the text is still longer than it, the sentences with the most frequent content words of the
+   text are kept until the budget is reached, in their original order.
+"""
+
+import re
+from collections import Counter
+from hashlib import blake2b
+
+import numpy as np
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 8
+DUPLICATE_THRESHOLD = 0.8
+SHINGLE_SIZE = 3
+
+FILLERS = re.compile(r'(?<![\w-])(?:u+h+|u+m+|u+h+m+|e+r+m+|h+m+|m+h+m+|a+h+)(?![\w-])[,.]?\s*', re.IGNORECASE)
+FILLER_PHRASES = re.compile(r',\s*(?:you know|i mean|like)\s*(?=,)', re.IGNORECASE)
+REPEATED_WORDS = re.compile(r'\b(\w+)(?:[\s,]+\1\b)+', re.IGNORECASE)
+SPEAKER = re.compile(r'^([^:\n]{1,64}):\s+')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+WORD = re.compile(r"[\w']+")
+
+STOPWORDS = frozenset(
+    'a an and are as at be been but by can did do does for from had has have he her his i if in is it its just me my '
+    'no not of on or our she so some than that the their them then there these they this to too up us was we were '
+    'what when which who will with would yeah yes you your okay ok right well really think know going get got'.split()
+)
+
+# one random xor mask per permutation, fixed so that signatures are comparable across runs
+MASKS = np.array(
+    [int.from_bytes(blake2b(str(i).encode(), digest_size=8).digest(), 'big') for i in range(NUM_PERMUTATIONS)],
+    dtype=np.uint64,
+)
+
+
+def remove_disfluencies(text: str) -> str:
+    text = FILLERS.sub('', text)
+    text = FILLER_PHRASES.sub('', text)
+    text = REPEATED_WORDS.sub(r'\1', text)
+
+    return re.sub(r'[ \t]{2,}', ' ', text).strip()
+
+
+def get_words(sentence: str) -> list[str]:
+    return WORD.findall(sentence.lower())
+
+
+def get_signature(words: list[str]) -> np.ndarray:
+    shingles = {' '.join(words[i : i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = np.fromiter(
+        (int.from_bytes(blake2b(shingle.encode(), digest_size=8).digest(), 'big') for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+    return (hashes[:, None] ^ MASKS[None, :]).min(axis=0)
+
+
+def get_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float((a == b).mean())
+
+
+def find_duplicates(sentences: list[list[str]]) -> set[int]:
+    """Returns the indices of the sentences that are near duplicates of an earlier one."""
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    buckets: dict[tuple, list[int]] = {}
+    signatures = []
+    duplicates = set()
+
+    for i, words in enumerate(sentences):
+        signature = get_signature(words) if words else None
+        signatures.append(signature)
+
+        if signature is None:
+            continue
+
+        keys = [(band, signature[band * rows : (band + 1) * rows].tobytes()) for band in range(LSH_BANDS)]
+        candidates = {j for key in keys for j in buckets.get(key, [])}
+
+        if any(get_similarity(signature, signatures[j]) >= DUPLICATE_THRESHOLD for j in candidates):
+            duplicates.add(i)
+            continue
+
+        for key in keys:
+            buckets.setdefault(key, []).append(i)
+
+    return duplicates
+
+
+def rank(sentences: list[list[str]]) -> list[float]:
+    frequencies = Counter(word for words in sentences for word in words if len(word) > 2 and word not in STOPWORDS)
+    top = max(frequencies.values(), default=1)
+
+    return [
+        sum(frequencies[word] for word in words if word in frequencies) / top / max(len(words), 1) ** 0.5
+        for words in sentences
+    ]
+
+
+def compress(text: str, ratio: float = 1.0) -> str:
+    """
+    Returns the text without disfluencies and repeated sentences and, if `ratio` is below 1, shortened by ranking its
+    sentences to about `ratio` times its original length. Lines starting with a speaker name keep it.
+    """
+    # (line index, speaker, sentence) in the order of the text
+    units: list[tuple[int, str | None, str]] = []
+
+    for index, line in enumerate(text.splitlines()):
+        match = SPEAKER.match(line)
+        speaker = match.group(1) if match else None
+        content = remove_disfluencies(line[match.end() :] if match else line)
+
+        for sentence in SENTENCE_END.split(content):
+            if sentence.strip():
+                units.append((index, speaker, sentence.strip()))
+
+    words = [get_words(sentence) for _, _, sentence in units]
+    duplicates = find_duplicates(words)
+    kept = [i for i in range(len(units)) if i not in duplicates]
+
+    budget = len(text) * ratio
+    if ratio < 1 and sum(len(units[i][2]) + 1 for i in kept) > budget:
+        scores = rank([words[i] for i in kept])
+        selected = set()
+        length = 0
+
+        for position in sorted(range(len(kept)), key=lambda p: scores[p], reverse=True):
+            sentence_length = len(units[kept[position]][2]) + 1
+            if length + sentence_length > budget:
+                continue
+            selected.add(kept[position])
+            length += sentence_length
+
+        kept = sorted(selected)
+
+    lines: list[tuple[int, str | None, list[str]]] = []
+    for i in kept:
+        index, speaker, sentence = units[i]
+        if lines and lines[-1][0] == index:
+            lines[-1][2].append(sentence)
+        else:
+            lines.append((index, speaker, [sentence]))
+
+    return '\n'.join(
+        ' '.join(sentences) if speaker is None else f'{speaker}: {" ".join(sentences)}'
+        for _, speaker, sentences in lines
+    )
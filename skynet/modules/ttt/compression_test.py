@@ -0,0 +1,47 @@
+from skynet.modules.ttt.compression import compress, find_duplicates, get_words, remove_disfluencies
+
+transcript = '''Andrew: Um, hello. Uh, so the the release is planned for Friday.
+Beatrix: We need to fix the login bug before the release. I had a coffee this morning.
+Andrew: So the release is planned for Friday.
+Beatrix: The login bug is assigned to Carl, the release depends on the login bug.'''
+
+
+class TestCompression:
+    def test_remove_disfluencies(self):
+        '''Test that fillers and repeated words are removed.'''
+
+        assert remove_disfluencies('Um, so I I think, you know, we should uh ship it. Hmm.') == (
+            'so I think, we should ship it.'
+        )
+        assert remove_disfluencies('The humming of the umbrella.') == 'The humming of the umbrella.'
+
+    def test_find_duplicates(self):
+        '''Test that only the later near duplicates of a sentence are found.'''
+
+        sentences = [
+            'The release is planned for Friday next week.',
+            'We need to fix the login bug.',
+            'So the release is planned for Friday next week.',
+        ]
+
+        assert find_duplicates([get_words(sentence) for sentence in sentences]) == {2}
+
+    def test_compress(self):
+        '''Test that the text keeps its speakers and order, and is only ranked down to a budget if there's one.'''
+
+        assert compress(transcript) == (
+            'Andrew: hello. so the release is planned for Friday.\n'
+            'Beatrix: We need to fix the login bug before the release. I had a coffee this morning.\n'
+            'Beatrix: The login bug is assigned to Carl, the release depends on the login bug.'
+        )
+
+        assert compress(transcript, 0.6) == (
+            'Andrew: hello. so the release is planned for Friday.\n'
+            'Beatrix: We need to fix the login bug before the release.\n'
+            'Beatrix: The login bug is assigned to Carl, the release depends on the login bug.'
+        )
+
+        # the budget is honored however small it is
+        assert compress(transcript, 0.3) == (
+            'Andrew: hello.\nBeatrix: The login bug is assigned to Carl, the release depends on the login bug.'
+        )
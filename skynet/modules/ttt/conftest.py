@@ -0,0 +1,66 @@
+"""
+The summaries service, its models and the LangChain processor aren't always importable next to the modules tested
+here. The ones missing are stubbed with what the tests need, so that the tests are collected and run either way.
+"""
+
+import importlib
+import sys
+from enum import Enum
+from types import ModuleType
+
+from pydantic import BaseModel
+
+import skynet.env
+
+
+def stub_module(name: str, **attributes):
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        module = ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+
+
+class Processors(Enum):
+    OPENAI = 'OPENAI'
+    AZURE = 'AZURE'
+    LOCAL = 'LOCAL'
+
+
+class JobType(Enum):
+    SUMMARY = 'summary'
+    ACTION_ITEMS = 'action_items'
+
+
+class HintType(Enum):
+    CONVERSATION = 'conversation'
+    EMAILS = 'emails'
+    MEETING = 'meeting'
+    TEXT = 'text'
+
+
+class DocumentPayload(BaseModel):
+    text: str
+    hint: HintType = HintType.MEETING
+    prompt: str | None = None
+    max_completion_tokens: int | None = None
+
+
+async def process(payload: DocumentPayload, job_type: JobType, customer_id: str | None = None) -> str:
+    raise NotImplementedError('The processor is stubbed, patch it')
+
+
+for name in ['openai_credentials_file', 'summary_routing_policy']:
+    if not hasattr(skynet.env, name):
+        setattr(skynet.env, name, None)
+
+stub_module('skynet.modules.file_watcher', FileWatcher=object)
+stub_module(
+    'skynet.modules.ttt.summaries.v1.models',
+    DocumentPayload=DocumentPayload,
+    HintType=HintType,
+    JobType=JobType,
+    Processors=Processors,
+)
+stub_module('skynet.modules.ttt.processor', combined_map_instructions='Rewrite the document as notes.', process=process)
@@ -0,0 +1,339 @@
+"""
+Redis backed job queue for the summaries module.
+
+Jobs are kept in one list per (job type, customer). Customers with pending work are kept in a ring per job type which
+is rotated on every dequeue, so a customer submitting a large batch only gets its turn in the rotation instead of
+starving everyone else. Job types are drained in the order given by `JOB_QUEUE_PRIORITIES`.
+
+A dequeued job is added to a sorted set scored by its visibility deadline, `VISIBILITY_MARGIN` seconds past its
+timeout. If the worker handling it crashes, the reaper puts the job back at the head of its customer's queue once the
+deadline passes.
+
+With `ENABLE_JOB_QUEUE` the queue is started with the app and the summaries of the live meetings go through it.
+
+All the bookkeeping is done in Lua scripts so that concurrent workers, possibly on different nodes, always see a
+consistent view of the queues. The scripts build keys dynamically, so this needs a single Redis node, not a cluster.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Awaitable, Callable
+
+from skynet.env import (
+    job_queue_max_attempts,
+    job_queue_poll_interval,
+    job_queue_priorities,
+    job_queue_workers,
+    job_timeout,
+    redis_exp_seconds,
+    redis_namespace,
+)
+from skynet.logs import get_logger
+from skynet.modules.monitoring import (
+    SUMMARY_DURATION_METRIC,
+    SUMMARY_QUEUE_SIZE_METRIC,
+    SUMMARY_QUEUE_TIME_METRIC,
+    SUMMARY_REQUEUED_JOBS_COUNTER,
+    SUMMARY_RUNNING_JOBS_METRIC,
+)
+from skynet.modules.persistence import get_db, key
+from skynet.modules.ttt.rate_limiter import RateLimitExceeded
+
+log = get_logger(__name__)
+
+ANONYMOUS_CUSTOMER = 'anonymous'
+REAPER_INTERVAL = 5
+# seconds the visibility deadline of a job goes past its timeout, so it isn't requeued while its worker wraps it up
+VISIBILITY_MARGIN = 30
+
+JobHandler = Callable[[str, dict, str | None], Awaitable[str]]
+
+# ARGV: namespace, job type, customer id, job id, push to head (0/1)
+ENQUEUE_SCRIPT = '''
+local ns, job_type, customer, job_id = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local queue = ns .. ':queue:' .. job_type .. ':' .. customer
+local len
+if ARGV[5] == '1' then
+    len = redis.call('LPUSH', queue, job_id)
+else
+    len = redis.call('RPUSH', queue, job_id)
+end
+if len == 1 then
+    redis.call('RPUSH', ns .. ':customers:' .. job_type, customer)
+end
+return redis.call('INCR', ns .. ':pending:' .. job_type)
+'''
+
+# ARGV: namespace, now (ms), visibility timeout (ms), job types in priority order...
+DEQUEUE_SCRIPT = '''
+local ns, now = ARGV[1], tonumber(ARGV[2])
+local deadline = now + tonumber(ARGV[3])
+for i = 4, #ARGV do
+    local job_type = ARGV[i]
+    local ring = ns .. ':customers:' .. job_type
+    for _ = 1, redis.call('LLEN', ring) do
+        local customer = redis.call('LMOVE', ring, ring, 'LEFT', 'RIGHT')
+        local queue = ns .. ':queue:' .. job_type .. ':' .. customer
+        local job_id = redis.call('LPOP', queue)
+        if redis.call('LLEN', queue) == 0 then
+            redis.call('LREM', ring, 0, customer)
+        end
+        if job_id then
+            local job = ns .. ':job:' .. job_id
+            redis.call('DECR', ns .. ':pending:' .. job_type)
+            redis.call('ZADD', ns .. ':running', deadline, job_id)
+            redis.call('HSET', job, 'status', 'running', 'started', now)
+            redis.call('HINCRBY', job, 'attempts', 1)
+            return job_id
+        end
+    end
+end
+return false
+'''
+
+# ARGV: namespace, now (ms), max attempts, expiration of the failed jobs (s)
+REQUEUE_SCRIPT = '''
+local ns, now, max_attempts = ARGV[1], ARGV[2], tonumber(ARGV[3])
+local running = ns .. ':running'
+local requeued = 0
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', running, '-inf', now)) do
+    redis.call('ZREM', running, job_id)
+    local job = ns .. ':job:' .. job_id
+    local fields = redis.call('HMGET', job, 'type', 'customer_id', 'attempts')
+    if fields[1] then
+        if tonumber(fields[3] or '0') >= max_attempts then
+            redis.call('HSET', job, 'status', 'error', 'result', 'Job exceeded the maximum number of attempts')
+            redis.call('HDEL', job, 'payload')
+            redis.call('EXPIRE', job, ARGV[4])
+        else
+            local queue = ns .. ':queue:' .. fields[1] .. ':' .. fields[2]
+            if redis.call('LPUSH', queue, job_id) == 1 then
+                redis.call('RPUSH', ns .. ':customers:' .. fields[1], fields[2])
+            end
+            redis.call('INCR', ns .. ':pending:' .. fields[1])
+            redis.call('HSET', job, 'status', 'pending')
+            requeued = requeued + 1
+        end
+    end
+end
+return requeued
+'''
+
+# ARGV: namespace, job id, deadline (ms)
+DEFER_SCRIPT = '''
+local ns, job_id = ARGV[1], ARGV[2]
+local job = ns .. ':job:' .. job_id
+redis.call('HINCRBY', job, 'attempts', -1)
+redis.call('HSET', job, 'status', 'pending')
+redis.call('ZADD', ns .. ':running', ARGV[3], job_id)
+'''
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+async def process_job(job_type: str, payload: dict, customer_id: str | None) -> str:
+    from skynet.modules.ttt.processor import combined_job_type, process, process_combined
+    from skynet.modules.ttt.summaries.v1.models import DocumentPayload, JobType
+
+    document = DocumentPayload.model_validate(payload)
+
+    if job_type == combined_job_type:
+        results = await process_combined(document, customer_id)
+
+        # both results are stored under the same job id
+        return json.dumps({result_type.value: result for result_type, result in results.items()})
+
+    return await process(document, JobType(job_type), customer_id)
+
+
+class JobQueue:
+    def __init__(
+        self,
+        handler: JobHandler = process_job,
+        workers: int = job_queue_workers,
+        priorities: list[str] = job_queue_priorities,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.priorities = [p.strip() for p in priorities if p.strip()]
+        self.tasks: list[asyncio.Task] = []
+        # jobs of all types waiting for a worker on any node, as of the last reaper pass
+        self.pending = 0
+
+    async def enqueue(self, job_type: str, payload: dict, customer_id: str | None = None) -> str:
+        if job_type not in self.priorities:
+            raise ValueError(f'Unknown job type {job_type}')
+
+        db = get_db()
+        job_id = str(uuid.uuid4())
+        customer = customer_id or ANONYMOUS_CUSTOMER
+
+        await db.hset(
+            key('job', job_id),
+            mapping={
+                'id': job_id,
+                'type': job_type,
+                'customer_id': customer,
+                'payload': json.dumps(payload),
+                'status': 'pending',
+                'created': now_ms(),
+                'attempts': 0,
+            },
+        )
+        await db.eval(ENQUEUE_SCRIPT, 0, redis_namespace, job_type, customer, job_id, 0)
+        log.info(f'Job {job_id} of type {job_type} queued for customer {customer}')
+
+        return job_id
+
+    async def get_job(self, job_id: str) -> dict | None:
+        job = await get_db().hgetall(key('job', job_id))
+        if not job:
+            return None
+
+        job.pop('payload', None)
+        job['duration'] = float(job.get('duration', 0))
+
+        return job
+
+    async def run(self, job_type: str, payload: dict, customer_id: str | None = None) -> str:
+        """
+        Queues a job and waits for a worker, possibly on another node, to complete it. Gives up once all of its attempts
+        could have timed out, e.g. if no worker is left to run it.
+        """
+        job_id = await self.enqueue(job_type, payload, customer_id)
+        # every attempt may run until its visibility deadline and wait for the next reaper pass
+        deadline = time.monotonic() + (job_timeout + VISIBILITY_MARGIN + REAPER_INTERVAL) * job_queue_max_attempts
+
+        while True:
+            await asyncio.sleep(job_queue_poll_interval)
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'Job {job_id} did not complete in time')
+
+            job = await self.get_job(job_id)
+            if job is None:
+                raise RuntimeError(f'Job {job_id} expired before it completed')
+            if job['status'] == 'success':
+                return job['result']
+            if job['status'] == 'error':
+                raise RuntimeError(job.get('result'))
+
+    async def queue_depth(self) -> dict[str, int]:
+        db = get_db()
+        values = await db.mget([key('pending', job_type) for job_type in self.priorities])
+
+        return {job_type: int(value or 0) for job_type, value in zip(self.priorities, values)}
+
+    async def dequeue(self) -> str | None:
+        visibility_timeout = (job_timeout + VISIBILITY_MARGIN) * 1000
+
+        return await get_db().eval(DEQUEUE_SCRIPT, 0, redis_namespace, now_ms(), visibility_timeout, *self.priorities)
+
+    async def requeue_expired(self) -> int:
+        requeued = await get_db().eval(
+            REQUEUE_SCRIPT, 0, redis_namespace, now_ms(), job_queue_max_attempts, redis_exp_seconds
+        )
+        if requeued:
+            log.warning(f'Requeued {requeued} jobs whose workers did not complete them in time')
+            SUMMARY_REQUEUED_JOBS_COUNTER.inc(requeued)
+
+        return requeued
+
+    async def run_job(self, job_id: str):
+        db = get_db()
+        job_key = key('job', job_id)
+        job = await db.hgetall(job_key)
+        job_type = job['type']
+        customer_id = None if job['customer_id'] == ANONYMOUS_CUSTOMER else job['customer_id']
+
+        SUMMARY_QUEUE_TIME_METRIC.labels(job_type).observe((int(job['started']) - int(job['created'])) / 1000)
+        SUMMARY_RUNNING_JOBS_METRIC.inc()
+
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                self.handler(job_type, json.loads(job['payload']), customer_id), timeout=job_timeout
+            )
+            status = 'success'
+        except RateLimitExceeded as e:
+            log.info(f'Job {job_id} deferred by {e.retry_after:.1f}s: {e}')
+            await self.defer(job_id, e.retry_after)
+            return
+        except Exception as e:
+            log.error(f'Job {job_id} failed: {e}')
+            result = str(e)
+            status = 'error'
+        finally:
+            SUMMARY_RUNNING_JOBS_METRIC.dec()
+
+        duration = round(time.perf_counter() - start, 3)
+        SUMMARY_DURATION_METRIC.labels(job_type).observe(duration)
+
+        await db.zrem(key('running'), job_id)
+        await db.hset(job_key, mapping={'status': status, 'result': result, 'duration': duration})
+        await db.expire(job_key, redis_exp_seconds)
+
+        log.info(f'Job {job_id} finished with status {status} in {duration}s')
+
+    async def defer(self, job_id: str, delay: float):
+        """
+        Frees the worker and lets the reaper put the job back in its queue once `delay` seconds passed, without
+        counting the attempt.
+        """
+        await get_db().eval(DEFER_SCRIPT, 0, redis_namespace, job_id, now_ms() + int(delay * 1000))
+
+    async def worker(self):
+        while True:
+            try:
+                job_id = await self.dequeue()
+            except Exception as e:
+                log.error(f'Failed to dequeue a job: {e}')
+                job_id = None
+
+            if job_id is None:
+                await asyncio.sleep(job_queue_poll_interval)
+                continue
+
+            try:
+                await self.run_job(job_id)
+            except Exception as e:
+                # the job stays in the running set, the reaper puts it back in the queue once its deadline passes
+                log.error(f'Failed to run job {job_id}: {e}')
+
+    async def reaper(self):
+        while True:
+            try:
+                await self.requeue_expired()
+
+                depths = await self.queue_depth()
+                for job_type, depth in depths.items():
+                    SUMMARY_QUEUE_SIZE_METRIC.labels(job_type).set(depth)
+                self.pending = sum(depths.values())
+            except Exception as e:
+                log.error(f'Job queue maintenance failed: {e}')
+
+            await asyncio.sleep(REAPER_INTERVAL)
+
+    def start(self):
+        if self.tasks:
+            return
+
+        log.info(f'Starting {self.workers} job queue workers')
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self.worker()) for _ in range(self.workers)]
+        self.tasks.append(loop.create_task(self.reaper()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        self.tasks = []
+
+
+job_queue = JobQueue()
+
+__all__ = ['JobQueue', 'job_queue', 'process_job']
@@ -0,0 +1,119 @@
+import fakeredis
+import pytest
+
+from skynet.modules.ttt.job_queue import JobQueue
+
+
+@pytest.fixture()
+def db(mocker):
+    db = fakeredis.FakeAsyncRedis(decode_responses=True)
+    mocker.patch('skynet.modules.ttt.job_queue.get_db', return_value=db)
+
+    return db
+
+
+async def dequeue_customers(queue: JobQueue, db) -> list[str]:
+    customers = []
+    while (job_id := await queue.dequeue()) is not None:
+        customers.append(await db.hget(f'skynet:job:{job_id}', 'customer_id'))
+
+    return customers
+
+
+class TestJobQueue:
+    @pytest.mark.asyncio
+    async def test_fair_scheduling(self, db):
+        '''Test that customers take turns, however many jobs each of them queued.'''
+
+        queue = JobQueue(priorities=['summary'])
+
+        for customer in ['large', 'large', 'large', 'small']:
+            await queue.enqueue('summary', {'text': 'text'}, customer)
+
+        assert await dequeue_customers(queue, db) == ['large', 'small', 'large', 'large']
+        assert await queue.queue_depth() == {'summary': 0}
+
+    @pytest.mark.asyncio
+    async def test_pending(self, db, mocker):
+        '''Test that the reaper keeps track of the jobs waiting on all the nodes.'''
+
+        import asyncio
+
+        queue = JobQueue(priorities=['summary', 'action_items'])
+        await queue.enqueue('summary', {'text': 'text'}, 'customer')
+        await queue.enqueue('action_items', {'text': 'text'}, 'customer')
+
+        mocker.patch('skynet.modules.ttt.job_queue.asyncio.sleep', side_effect=asyncio.CancelledError)
+        with pytest.raises(asyncio.CancelledError):
+            await queue.reaper()
+
+        assert queue.pending == 2
+
+    @pytest.mark.asyncio
+    async def test_priorities(self, db):
+        '''Test that job types are picked up in the order of the priorities.'''
+
+        queue = JobQueue(priorities=['summary', 'action_items'])
+
+        action_items = await queue.enqueue('action_items', {'text': 'text'}, 'customer')
+        summary = await queue.enqueue('summary', {'text': 'text'}, 'customer')
+
+        assert [await queue.dequeue(), await queue.dequeue()] == [summary, action_items]
+
+    @pytest.mark.asyncio
+    async def test_requeue(self, db, mocker):
+        '''Test that a job is only requeued once its deadline passed and a deferred attempt isn't counted.'''
+
+        from skynet.env import job_timeout
+        from skynet.modules.ttt.job_queue import now_ms, VISIBILITY_MARGIN
+
+        queue = JobQueue(priorities=['summary'])
+        job_id = await queue.enqueue('summary', {'text': 'text'}, 'customer')
+        assert await queue.dequeue() == job_id
+
+        now = now_ms()
+        mocker.patch('skynet.modules.ttt.job_queue.now_ms', return_value=now + job_timeout * 1000)
+        assert await queue.requeue_expired() == 0
+
+        mocker.patch('skynet.modules.ttt.job_queue.now_ms', return_value=now + (job_timeout + VISIBILITY_MARGIN) * 1000)
+        assert await queue.requeue_expired() == 1
+        assert await queue.dequeue() == job_id
+
+        await queue.defer(job_id, 0)
+        assert await queue.requeue_expired() == 1
+        assert await queue.dequeue() == job_id
+        assert (await queue.get_job(job_id))['attempts'] == '2'
+
+    @pytest.mark.asyncio
+    async def test_max_attempts(self, db, mocker):
+        '''Test that a job out of attempts fails, loses its payload and expires.'''
+
+        from skynet.env import job_queue_max_attempts, job_timeout
+        from skynet.modules.ttt.job_queue import now_ms, VISIBILITY_MARGIN
+
+        queue = JobQueue(priorities=['summary'])
+        job_id = await queue.enqueue('summary', {'text': 'text'}, 'customer')
+        now = now_ms()
+
+        for attempt in range(job_queue_max_attempts):
+            assert await queue.dequeue() == job_id
+            now += (job_timeout + VISIBILITY_MARGIN) * 1000
+            mocker.patch('skynet.modules.ttt.job_queue.now_ms', return_value=now)
+            await queue.requeue_expired()
+
+        job = await queue.get_job(job_id)
+        assert job['status'] == 'error'
+        assert not await db.hexists(f'skynet:job:{job_id}', 'payload')
+        assert await db.ttl(f'skynet:job:{job_id}') > 0
+
+    @pytest.mark.asyncio
+    async def test_run_timeout(self, db, mocker):
+        '''Test that waiting for a job gives up once all of its attempts could have timed out.'''
+
+        queue = JobQueue(priorities=['summary'])
+        for name in ['job_timeout', 'VISIBILITY_MARGIN', 'REAPER_INTERVAL']:
+            mocker.patch(f'skynet.modules.ttt.job_queue.{name}', 0)
+        mocker.patch('skynet.modules.ttt.job_queue.job_queue_poll_interval', 0.01)
+
+        with pytest.raises(RuntimeError, match='did not complete in time'):
+            await queue.run('summary', {'text': 'text'}, 'customer')
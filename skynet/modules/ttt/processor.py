@@ -1,13 +1,36 @@
+import asyncio
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
 from langchain.chains.summarize import load_summarize_chain
 from langchain.prompts import ChatPromptTemplate
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
+from langchain_core.runnables import Runnable
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
-
-from skynet.auth.user_info import CredentialsType, get_credentials
-from skynet.env import app_uuid, azure_openai_api_version, llama_n_ctx, llama_path, openai_api_base_url
+from pydantic import BaseModel
+
+from skynet.auth.user_info import get_credentials_version, get_customer_credentials
+from skynet.env import (
+    app_uuid,
+    azure_openai_api_version,
+    enable_summary_compression,
+    llama_n_ctx,
+    llama_path,
+    openai_api_base_url,
+    summary_compression_budget,
+)
 from skynet.logs import get_logger
-
+from skynet.modules.monitoring import (
+    SUMMARY_COMPRESSION_DURATION_METRIC,
+    SUMMARY_COMPRESSION_RATIO_METRIC,
+    SUMMARY_COMPRESSION_SAVED_TOKENS_COUNTER,
+)
+from skynet.modules.ttt.compression import compress
+from skynet.modules.ttt.rate_limiter import rate_limiter
+from skynet.modules.ttt.router import Route, router
 from skynet.modules.ttt.summaries.prompts.action_items import (
     action_items_conversation,
     action_items_emails,
@@ -40,36 +63,184 @@ hint_type_to_prompt = {
     },
 }
 
+# The text goes right after a system message shared by all job types and the job specific instructions come last, so
+# that every request for the same text starts with a byte-identical prefix and the backend can reuse its KV cache.
+shared_system_message = (
+    'You will be given a document, followed by instructions on how to process it. '
+    'Follow the instructions and only use the information from the document.'
+)
+
+
+@lru_cache(maxsize=128)
+def build_prompt(instructions: str) -> ChatPromptTemplate:
+    return ChatPromptTemplate(
+        [
+            ("system", shared_system_message),
+            ("human", "{text}\n\n" + instructions),
+        ]
+    )
+
+
+compiled_prompts = {
+    job_type: {hint: build_prompt(instructions) for hint, instructions in prompts.items()}
+    for job_type, prompts in hint_type_to_prompt.items()
+}
+
+
+# Used when both a summary and action items are requested for the same text, so the text is only processed once.
+combined_job_type = 'summary_and_action_items'
+
+combined_map_instructions = (
+    'Rewrite the document above as detailed notes. Keep every topic, decision, task, owner and deadline, '
+    'and leave out small talk.'
+)
+
+
+def get_combined_instructions(payload: DocumentPayload) -> str:
+    return (
+        'Process the document in two ways.\n\n'
+        f'First, as a summary. {hint_type_to_prompt[JobType.SUMMARY][payload.hint]}\n\n'
+        f'Second, as action items. {hint_type_to_prompt[JobType.ACTION_ITEMS][payload.hint]}\n\n'
+        'Respond only with a JSON object with two string fields: "summary" and "action_items".'
+    )
+
+
+class CombinedResult(BaseModel):
+    summary: str
+    action_items: str
+
+
+def get_prompt(payload: DocumentPayload, job_type: JobType) -> ChatPromptTemplate:
+    if payload.prompt:
+        return build_prompt(payload.prompt)
+
+    return compiled_prompts[job_type][payload.hint]
+
 
 def get_job_processor(customer_id: str) -> Processors:
-    options = get_credentials(customer_id)
-    secret = options.get('secret')
-    api_type = options.get('type')
-
-    if secret:
-        if api_type == CredentialsType.OPENAI.value:
-            return Processors.OPENAI
-        elif api_type == CredentialsType.AZURE_OPENAI.value:
-            return Processors.AZURE
-
-    return Processors.LOCAL
-
-
-def get_local_llm(**kwargs):
-    return ChatOpenAI(
-        model=llama_path,
-        api_key='placeholder',  # use a placeholder value to bypass validation, and allow the custom base url to be used
-        base_url=f'{openai_api_base_url}/v1',
-        default_headers={"X-Skynet-UUID": app_uuid},
-        frequency_penalty=1,
-        max_retries=0,
-        temperature=0,
-        **kwargs,
+    return get_customer_credentials(customer_id).processor
+
+
+# LLM clients are expensive to create, so they are reused until the credentials are reloaded. The least recently used
+# ones are dropped past the max size, a client is created for each deployment of each customer.
+LLM_CACHE_MAX_SIZE = 128
+
+llm_cache: OrderedDict[tuple, ChatOpenAI] = OrderedDict()
+llm_cache_version = 0
+
+
+def get_cached_llm(key: tuple, factory):
+    global llm_cache_version
+
+    version = get_credentials_version()
+    if version != llm_cache_version:
+        llm_cache.clear()
+        llm_cache_version = version
+
+    if key in llm_cache:
+        llm_cache.move_to_end(key)
+        return llm_cache[key]
+
+    llm = llm_cache[key] = factory()
+    while len(llm_cache) > LLM_CACHE_MAX_SIZE:
+        llm_cache.popitem(last=False)
+
+    return llm
+
+
+def bind_max_completion_tokens(model: ChatOpenAI, payload: DocumentPayload) -> Runnable:
+    """The output limit of the request, applied per call so that a client is shared by all the limits."""
+    if payload.max_completion_tokens is None:
+        return model
+
+    return model.bind(max_completion_tokens=payload.max_completion_tokens)
+
+
+def get_local_llm():
+    return get_cached_llm(
+        ('local',),
+        lambda: ChatOpenAI(
+            model=llama_path,
+            api_key='placeholder',  # use a placeholder value to bypass validation, and allow the custom base url to be used
+            base_url=f'{openai_api_base_url}/v1',
+            default_headers={"X-Skynet-UUID": app_uuid},
+            frequency_penalty=1,
+            max_retries=0,
+            temperature=0,
+        ),
     )
 
 
-async def summarize(payload: DocumentPayload, job_type: JobType, model: ChatOpenAI = None) -> str:
-    current_model = model or get_local_llm(max_completion_tokens=payload.max_completion_tokens)
+def get_openai_llm(api_key: str, model_name=None):
+    return get_cached_llm(
+        ('openai', api_key, model_name),
+        lambda: ChatOpenAI(
+            api_key=api_key,
+            model_name=model_name,
+            temperature=0,
+        ),
+    )
+
+
+def get_azure_llm(api_key: str, endpoint: str, deployment_name: str):
+    return get_cached_llm(
+        ('azure', api_key, endpoint, deployment_name),
+        lambda: AzureChatOpenAI(
+            api_key=api_key,
+            api_version=azure_openai_api_version,
+            azure_endpoint=endpoint,
+            azure_deployment=deployment_name,
+            temperature=0,
+        ),
+    )
+
+
+def get_threshold() -> float:
+    # allow some buffer for the model to generate the output
+    return llama_n_ctx * 3 / 4
+
+
+async def compress_text(text: str, num_tokens: int, model: ChatOpenAI) -> tuple[str, int]:
+    """
+    Removes disfluencies and repeated sentences from the text and, if a token budget is set, ranks its sentences down
+    to it. Returns the compressed text and its number of tokens.
+    """
+    if not enable_summary_compression:
+        return text, num_tokens
+
+    start = time.perf_counter()
+    # without a budget nothing is ranked away, texts too long for a single request go through the map stage instead
+    ratio = min(summary_compression_budget / num_tokens, 1) if summary_compression_budget else 1
+    compressed = await asyncio.to_thread(compress, text, ratio)
+    compressed_num_tokens = model.get_num_tokens(compressed)
+    duration = time.perf_counter() - start
+
+    SUMMARY_COMPRESSION_DURATION_METRIC.observe(duration)
+    SUMMARY_COMPRESSION_RATIO_METRIC.observe(compressed_num_tokens / num_tokens)
+    SUMMARY_COMPRESSION_SAVED_TOKENS_COUNTER.inc(max(num_tokens - compressed_num_tokens, 0))
+
+    log.info(f'Compressed the text from {num_tokens} to {compressed_num_tokens} tokens in {duration:.2f}s')
+
+    return compressed, compressed_num_tokens
+
+
+def split_text(text: str, num_tokens: int, threshold: float) -> list[Document]:
+    # split the text into roughly equal chunks
+    num_chunks = num_tokens // threshold + 1
+    chunk_size = num_tokens // num_chunks
+
+    log.info(f"Splitting text into {num_chunks} chunks of {chunk_size} tokens")
+
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=chunk_size, chunk_overlap=100)
+
+    return text_splitter.create_documents([text])
+
+
+async def summarize(
+    payload: DocumentPayload, job_type: JobType, model: ChatOpenAI = None, customer_id: str | None = None
+) -> str:
+    current_model = model or get_local_llm()
+    llm = bind_max_completion_tokens(current_model, payload)
     chain = None
     text = payload.text
 
@@ -77,33 +248,21 @@ async def summarize(payload: DocumentPayload, job_type: JobType, model: ChatOpen
         return ""
 
     system_message = payload.prompt or hint_type_to_prompt[job_type][payload.hint]
-
-    prompt = ChatPromptTemplate(
-        [
-            ("system", system_message),
-            ("human", "{text}"),
-        ]
-    )
+    prompt = get_prompt(payload, job_type)
 
     # this is a rough estimate of the number of tokens in the input text, since llama models will have a different tokenization scheme
     num_tokens = current_model.get_num_tokens(text)
+    text, num_tokens = await compress_text(text, num_tokens, current_model)
+    await rate_limiter.acquire(customer_id, num_tokens)
 
-    # allow some buffer for the model to generate the output
-    threshold = llama_n_ctx * 3 / 4
+    threshold = get_threshold()
 
     if num_tokens < threshold:
-        chain = load_summarize_chain(current_model, chain_type="stuff", prompt=prompt)
+        chain = load_summarize_chain(llm, chain_type="stuff", prompt=prompt)
         docs = [Document(page_content=text)]
     else:
-        # split the text into roughly equal chunks
-        num_chunks = num_tokens // threshold + 1
-        chunk_size = num_tokens // num_chunks
-
-        log.info(f"Splitting text into {num_chunks} chunks of {chunk_size} tokens")
-
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=chunk_size, chunk_overlap=100)
-        docs = text_splitter.create_documents([text])
-        chain = load_summarize_chain(current_model, chain_type="map_reduce", combine_prompt=prompt, map_prompt=prompt)
+        docs = split_text(text, num_tokens, threshold)
+        chain = load_summarize_chain(llm, chain_type="map_reduce", combine_prompt=prompt, map_prompt=prompt)
 
     result = await chain.ainvoke(input={"input_documents": docs})
     formatted_result = result['output_text'].replace('Response:', '', 1).strip()
@@ -114,54 +273,154 @@ async def summarize(payload: DocumentPayload, job_type: JobType, model: ChatOpen
     return formatted_result
 
 
-async def process_open_ai(payload: DocumentPayload, job_type: JobType, api_key: str, model_name=None) -> str:
-    llm = ChatOpenAI(
-        api_key=api_key,
-        max_completion_tokens=payload.max_completion_tokens,
-        model_name=model_name,
-        temperature=0,
+async def summarize_combined(
+    payload: DocumentPayload, model: ChatOpenAI = None, customer_id: str | None = None
+) -> dict[JobType, str]:
+    """
+    Produces both the summary and the action items in a single pass. Long texts go through a single map stage whose
+    notes are shared by both outputs, instead of one full map_reduce per job type.
+    """
+    current_model = model or get_local_llm()
+    llm = bind_max_completion_tokens(current_model, payload)
+    text = payload.text
+
+    if not text:
+        return {JobType.SUMMARY: "", JobType.ACTION_ITEMS: ""}
+
+    threshold = get_threshold()
+    num_tokens = current_model.get_num_tokens(text)
+    text, num_tokens = await compress_text(text, num_tokens, current_model)
+    await rate_limiter.acquire(customer_id, num_tokens)
+
+    if num_tokens >= threshold:
+        map_chain = build_prompt(combined_map_instructions) | llm | StrOutputParser()
+
+        while num_tokens >= threshold:
+            docs = split_text(text, num_tokens, threshold)
+            notes = await asyncio.gather(*[map_chain.ainvoke({"text": doc.page_content}) for doc in docs])
+            text = '\n\n'.join(notes)
+            previous_num_tokens, num_tokens = num_tokens, current_model.get_num_tokens(text)
+
+            if num_tokens >= previous_num_tokens:
+                log.warning('The map stage did not shrink the text, continuing with the notes as they are')
+                break
+
+    # what with_structured_output(method="json_mode") builds, which would drop the output limit bound to the model
+    structured_model = llm.bind(response_format={"type": "json_object"}) | PydanticOutputParser(
+        pydantic_object=CombinedResult
     )
+    chain = build_prompt(get_combined_instructions(payload)) | structured_model
+    result = await chain.ainvoke({"text": text})
 
-    return await summarize(payload, job_type, llm)
+    log.info(f'input length: {len(payload.text)}')
+    log.info(f'output length: {len(result.summary) + len(result.action_items)}')
 
+    return {JobType.SUMMARY: result.summary.strip(), JobType.ACTION_ITEMS: result.action_items.strip()}
 
-async def process_azure(
-    payload: DocumentPayload, job_type: JobType, api_key: str, endpoint: str, deployment_name: str
+
+async def process_open_ai(
+    payload: DocumentPayload, job_type: JobType, api_key: str, model_name=None, customer_id: str | None = None
 ) -> str:
-    llm = AzureChatOpenAI(
-        api_key=api_key,
-        api_version=azure_openai_api_version,
-        azure_endpoint=endpoint,
-        azure_deployment=deployment_name,
-        max_completion_tokens=payload.max_completion_tokens,
-        temperature=0,
-    )
+    llm = get_openai_llm(api_key, model_name)
 
-    return await summarize(payload, job_type, llm)
+    return await summarize(payload, job_type, llm, customer_id)
 
 
-async def process(payload: DocumentPayload, job_type: JobType, customer_id: str | None = None) -> str:
-    processor = get_job_processor(customer_id)
-    options = get_credentials(customer_id)
+async def process_azure(
+    payload: DocumentPayload,
+    job_type: JobType,
+    api_key: str,
+    endpoint: str,
+    deployment_name: str,
+    customer_id: str | None = None,
+) -> str:
+    llm = get_azure_llm(api_key, endpoint, deployment_name)
+
+    return await summarize(payload, job_type, llm, customer_id)
 
+
+async def process_route(route: Route, payload: DocumentPayload, job_type: JobType, customer_id: str | None) -> str:
+    options = route.options
     secret = options.get('secret')
 
-    if processor == Processors.OPENAI:
+    if route.processor == Processors.OPENAI:
         log.info(f"Forwarding inference to OpenAI for customer {customer_id}")
 
         model = options.get('metadata').get('model')
-        result = await process_open_ai(payload, job_type, secret, model)
-    elif processor == Processors.AZURE:
+        result = await process_open_ai(payload, job_type, secret, model, customer_id)
+    elif route.processor == Processors.AZURE:
         log.info(f"Forwarding inference to Azure openai for customer {customer_id}")
 
         metadata = options.get('metadata')
         result = await process_azure(
-            payload, job_type, secret, metadata.get('endpoint'), metadata.get('deploymentName')
+            payload, job_type, secret, metadata.get('endpoint'), metadata.get('deploymentName'), customer_id
         )
     else:
         if customer_id:
             log.info(f'Customer {customer_id} has no API key configured, falling back to local processing')
 
-        result = await summarize(payload, job_type)
+        result = await summarize(payload, job_type, customer_id=customer_id)
 
     return result
+
+
+async def process(payload: DocumentPayload, job_type: JobType, customer_id: str | None = None) -> str:
+    credentials = get_customer_credentials(customer_id)
+
+    return await router.run(
+        credentials,
+        len(payload.text),
+        lambda route: process_route(route, payload, job_type, customer_id),
+        customer_id,
+    )
+
+
+async def process_many(
+    payload: DocumentPayload, job_types: list[JobType], customer_id: str | None = None
+) -> dict[JobType, str]:
+    """
+    Processes the same text for several job types. The requests share their prompt prefix: the first job runs alone so
+    that the backend has the prefill of the text cached once its siblings, sent together, arrive.
+    """
+    if not job_types:
+        return {}
+
+    first, *siblings = job_types
+    results = [await process(payload, first, customer_id)]
+    results += await asyncio.gather(*[process(payload, job_type, customer_id) for job_type in siblings])
+
+    return dict(zip(job_types, results))
+
+
+async def process_combined_route(route: Route, payload: DocumentPayload, customer_id: str | None) -> dict[JobType, str]:
+    options = route.options
+    secret = options.get('secret')
+    metadata = options.get('metadata')
+
+    if route.processor == Processors.OPENAI:
+        log.info(f"Forwarding combined inference to OpenAI for customer {customer_id}")
+
+        model = get_openai_llm(secret, metadata.get('model'))
+    elif route.processor == Processors.AZURE:
+        log.info(f"Forwarding combined inference to Azure openai for customer {customer_id}")
+
+        model = get_azure_llm(secret, metadata.get('endpoint'), metadata.get('deploymentName'))
+    else:
+        model = None
+
+    return await summarize_combined(payload, model, customer_id)
+
+
+async def process_combined(payload: DocumentPayload, customer_id: str | None = None) -> dict[JobType, str]:
+    if payload.prompt:
+        # a custom prompt replaces the instructions of both job types, each of them runs it as a job of its own
+        return await process_many(payload, [JobType.SUMMARY, JobType.ACTION_ITEMS], customer_id)
+
+    credentials = get_customer_credentials(customer_id)
+
+    return await router.run(
+        credentials,
+        len(payload.text),
+        lambda route: process_combined_route(route, payload, customer_id),
+        customer_id,
+    )
@@ -1,6 +1,9 @@
+import asyncio
+
 import pytest
 
-from skynet.modules.ttt.summaries.v1.models import DocumentMetadata, DocumentPayload, Job, JobType
+from skynet.auth.user_info import CustomerCredentials
+from skynet.modules.ttt.summaries.v1.models import DocumentMetadata, DocumentPayload, Job, JobType, Processors
 
 
 @pytest.fixture()
@@ -42,8 +45,11 @@ class TestProcess:
         model = 'gpt-3.5-turbo'
 
         process_fixture.patch(
-            'skynet.modules.ttt.processor.get_credentials',
-            return_value={'secret': secret, 'type': 'OPENAI', 'metadata': {'model': model}},
+            'skynet.modules.ttt.processor.get_customer_credentials',
+            return_value=CustomerCredentials(
+                processor=Processors.OPENAI,
+                options={'secret': secret, 'type': 'OPENAI', 'metadata': {'model': model}},
+            ),
         )
 
         job = Job(
@@ -70,12 +76,15 @@ class TestProcess:
         endpoint = 'https://myopenai.azure.com'
 
         process_fixture.patch(
-            'skynet.modules.ttt.processor.get_credentials',
-            return_value={
-                'secret': secret,
-                'type': 'AZURE_OPENAI',
-                'metadata': {'deploymentName': deployment_name, 'endpoint': endpoint},
-            },
+            'skynet.modules.ttt.processor.get_customer_credentials',
+            return_value=CustomerCredentials(
+                processor=Processors.AZURE,
+                options={
+                    'secret': secret,
+                    'type': 'AZURE_OPENAI',
+                    'metadata': {'deploymentName': deployment_name, 'endpoint': endpoint},
+                },
+            ),
         )
 
         job = Job(
@@ -90,3 +99,77 @@ class TestProcess:
         await process(job.payload, job.type, job.metadata.customer_id)
 
         process_azure.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_process_many(self, mocker):
+        '''Test that the first job runs alone, and its siblings together once it's done.'''
+
+        from skynet.modules.ttt import processor
+
+        events = []
+
+        async def process(payload, job_type, customer_id=None):
+            events.append(('start', job_type))
+            await asyncio.sleep(0)
+            events.append(('end', job_type))
+            return job_type.value
+
+        mocker.patch.object(processor, 'process', process)
+        results = await processor.process_many(DocumentPayload(text='text'), [JobType.SUMMARY, JobType.ACTION_ITEMS])
+
+        assert results == {JobType.SUMMARY: JobType.SUMMARY.value, JobType.ACTION_ITEMS: JobType.ACTION_ITEMS.value}
+        assert events == [
+            ('start', JobType.SUMMARY),
+            ('end', JobType.SUMMARY),
+            ('start', JobType.ACTION_ITEMS),
+            ('end', JobType.ACTION_ITEMS),
+        ]
+
+
+    @pytest.mark.asyncio
+    async def test_process_combined_with_prompt(self, mocker):
+        '''Test that a combined job with a custom prompt runs as separate jobs.'''
+
+        from skynet.modules.ttt import processor
+
+        process_many = mocker.patch.object(processor, 'process_many')
+        summarize_combined = mocker.patch.object(processor, 'summarize_combined')
+        payload = DocumentPayload(text='text', prompt='Summarize the text in French.')
+
+        await processor.process_combined(payload, 'customer')
+
+        process_many.assert_called_once_with(payload, [JobType.SUMMARY, JobType.ACTION_ITEMS], 'customer')
+        summarize_combined.assert_not_called()
+
+
+class TestLlmCache:
+    def test_lru(self, mocker):
+        '''Test that the least recently used clients are dropped past the max size of the cache.'''
+
+        from skynet.modules.ttt import processor
+
+        mocker.patch.object(processor, 'LLM_CACHE_MAX_SIZE', 2)
+        mocker.patch.object(processor, 'get_credentials_version', return_value=processor.llm_cache_version)
+        mocker.patch.object(processor, 'llm_cache', processor.OrderedDict())
+
+        first = processor.get_cached_llm(('first',), object)
+        processor.get_cached_llm(('second',), object)
+
+        assert processor.get_cached_llm(('first',), object) is first
+
+        processor.get_cached_llm(('third',), object)
+
+        assert list(processor.llm_cache) == [('first',), ('third',)]
+
+    def test_max_completion_tokens(self, mocker):
+        '''Test that the output limit is bound per call rather than being part of the cached client.'''
+
+        from skynet.modules.ttt.processor import bind_max_completion_tokens
+
+        model = mocker.MagicMock()
+
+        assert bind_max_completion_tokens(model, DocumentPayload(text='text', max_completion_tokens=None)) is model
+
+        bind_max_completion_tokens(model, DocumentPayload(text='text', max_completion_tokens=100))
+
+        model.bind.assert_called_once_with(max_completion_tokens=100)
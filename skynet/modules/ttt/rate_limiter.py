@@ -0,0 +1,247 @@
+"""
+Per customer rate limits on the summary requests and on the tokens they send to the LLM.
+
+Every customer has two token buckets, one for requests and one for tokens, refilled continuously so that a customer
+can use up to `SUMMARY_RATE_LIMIT_REQUESTS` requests and `SUMMARY_RATE_LIMIT_TOKENS` tokens per minute, in bursts of
+at most a minute's worth. A job over the limit raises `RateLimitExceeded` with the time after which it would pass.
+
+With a single node the buckets are kept in memory. With `SUMMARY_RATE_LIMIT_BACKEND=redis` the buckets are shared in
+Redis and every node leases a slice of a customer's budget at a time, so most requests are admitted from the local
+lease without a network call and only the requests exhausting it go to Redis. What's left of a lease when it expires
+is given back to the shared bucket the next time the node goes to Redis.
+
+A job is charged once, when its input is first sent to an LLM. Retrying it on another route within `charge_once()`
+reuses that grant.
+"""
+
+import abc
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from skynet.env import summary_rate_limit_backend, summary_rate_limit_requests, summary_rate_limit_tokens
+from skynet.logs import get_logger
+from skynet.modules.monitoring import SUMMARY_RATE_LIMITED_JOBS_COUNTER
+from skynet.modules.persistence import get_db, key
+
+log = get_logger(__name__)
+
+# the part of a customer's budget leased by a node at once
+LEASE_FRACTION = 0.1
+# leases unused for this long are dropped, so an idle node doesn't hold on to a customer's budget
+LEASE_TTL = 10
+
+ANONYMOUS_CUSTOMER = 'anonymous'
+
+# ARGV: now (ms), then for every bucket: key, rate (per second), capacity, needed, lease
+LEASE_SCRIPT = '''
+local now = tonumber(ARGV[1])
+local buckets = {}
+local wait = 0
+for i = 2, #ARGV, 5 do
+    local bucket_key, rate, capacity = ARGV[i], tonumber(ARGV[i + 1]), tonumber(ARGV[i + 2])
+    local needed, lease = tonumber(ARGV[i + 3]), tonumber(ARGV[i + 4])
+    local state = redis.call('HMGET', bucket_key, 'tokens', 'updated')
+    local tokens = tonumber(state[1] or capacity)
+    local updated = tonumber(state[2] or now)
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate / 1000)
+    if tokens < needed then
+        wait = math.max(wait, math.ceil((needed - tokens) * 1000 / rate))
+    end
+    table.insert(buckets, {bucket_key, rate, capacity, tokens, math.max(needed, lease)})
+end
+if wait > 0 then
+    return {wait}
+end
+local result = {0}
+for _, bucket in ipairs(buckets) do
+    local granted = math.floor(math.min(bucket[4], bucket[5]))
+    redis.call('HSET', bucket[1], 'tokens', tostring(bucket[4] - granted), 'updated', now)
+    redis.call('PEXPIRE', bucket[1], math.ceil(bucket[3] * 1000 / bucket[2]) + 1000)
+    table.insert(result, granted)
+end
+return result
+'''
+
+# ARGV: for every bucket: key, capacity, unused tokens
+RELEASE_SCRIPT = '''
+for i = 1, #ARGV, 3 do
+    local tokens = redis.call('HGET', ARGV[i], 'tokens')
+    if tokens then
+        local capacity, unused = tonumber(ARGV[i + 1]), tonumber(ARGV[i + 2])
+        redis.call('HSET', ARGV[i], 'tokens', tostring(math.min(capacity, tonumber(tokens) + unused)))
+    end
+end
+'''
+
+# whether the job running in the current context was already charged, None outside of `charge_once()`
+job_charged: ContextVar[list[bool] | None] = ContextVar('job_charged', default=None)
+
+
+@contextmanager
+def charge_once():
+    """Only the first acquire of the job running within it is charged, e.g. not its retries on other routes."""
+    token = job_charged.set([False])
+    try:
+        yield
+    finally:
+        job_charged.reset(token)
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, customer_id: str | None, retry_after: float):
+        super().__init__(f'Rate limit exceeded for customer {customer_id}, retry after {retry_after:.1f}s')
+        self.customer_id = customer_id
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def get_wait(self, amount: float) -> float:
+        """Seconds until `amount` can be taken, 0 if it can be taken now."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter(abc.ABC):
+    def __init__(
+        self, requests_per_minute: int = summary_rate_limit_requests, tokens_per_minute: int = summary_rate_limit_tokens
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+    def is_enabled(self) -> bool:
+        return self.requests_per_minute > 0 or self.tokens_per_minute > 0
+
+    def get_limits(self, tokens: int) -> list[tuple[str, int, int]]:
+        """The (bucket name, per minute limit, amount needed) of every limit that applies to a request."""
+        limits = []
+
+        if self.requests_per_minute > 0:
+            limits.append(('requests', self.requests_per_minute, 1))
+        if self.tokens_per_minute > 0:
+            limits.append(('tokens', self.tokens_per_minute, min(tokens, self.tokens_per_minute)))
+
+        return limits
+
+    async def acquire(self, customer_id: str | None, tokens: int):
+        charged = job_charged.get()
+        if not self.is_enabled() or (charged is not None and charged[0]):
+            return
+
+        wait = await self.try_acquire(customer_id or ANONYMOUS_CUSTOMER, self.get_limits(tokens))
+
+        if wait > 0:
+            SUMMARY_RATE_LIMITED_JOBS_COUNTER.inc()
+            raise RateLimitExceeded(customer_id, wait)
+
+        if charged is not None:
+            charged[0] = True
+
+    @abc.abstractmethod
+    async def try_acquire(self, customer: str, limits: list[tuple[str, int, int]]) -> float:
+        """Takes what every limit needs if they all allow it and returns 0, otherwise the seconds to wait."""
+
+
+class InMemoryRateLimiter(RateLimiter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets: dict[tuple[str, str], TokenBucket] = {}
+
+    def get_bucket(self, customer: str, name: str, per_minute: int) -> TokenBucket:
+        bucket = self.buckets.get((customer, name))
+        if bucket is None:
+            bucket = self.buckets[(customer, name)] = TokenBucket(per_minute)
+
+        return bucket
+
+    async def try_acquire(self, customer: str, limits: list[tuple[str, int, int]]) -> float:
+        buckets = [(self.get_bucket(customer, name, per_minute), needed) for name, per_minute, needed in limits]
+        wait = max(bucket.get_wait(needed) for bucket, needed in buckets)
+
+        # nothing is taken unless every limit lets the request through
+        if wait == 0:
+            for bucket, needed in buckets:
+                bucket.take(needed)
+
+        return wait
+
+
+class Lease:
+    def __init__(self):
+        self.remaining: dict[str, float] = {}
+        self.expires_at = 0.0
+
+
+class RedisRateLimiter(RateLimiter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.leases: dict[str, Lease] = {}
+
+    async def release_expired_leases(self):
+        """Gives what's left of the expired leases back to the shared buckets, so it isn't lost to the customers."""
+        now = time.monotonic()
+        capacities = {'requests': self.requests_per_minute, 'tokens': self.tokens_per_minute}
+        args = []
+
+        for customer in [customer for customer, lease in self.leases.items() if lease.expires_at < now]:
+            for name, remaining in self.leases.pop(customer).remaining.items():
+                if remaining > 0:
+                    args += [key('ratelimit', customer, name), capacities[name], remaining]
+
+        if args:
+            await get_db().eval(RELEASE_SCRIPT, 0, *args)
+
+    async def try_acquire(self, customer: str, limits: list[tuple[str, int, int]]) -> float:
+        lease = self.leases.get(customer)
+
+        if (
+            lease is not None
+            and lease.expires_at >= time.monotonic()
+            and all(lease.remaining.get(name, 0) >= needed for name, _, needed in limits)
+        ):
+            for name, _, needed in limits:
+                lease.remaining[name] -= needed
+            return 0
+
+        await self.release_expired_leases()
+        lease = self.leases.setdefault(customer, Lease())
+
+        # what's left of the lease is used first, the rest comes from the shared bucket along with a new lease
+        args = [int(time.time() * 1000)]
+        for name, per_minute, needed in limits:
+            needed = max(0, math.ceil(needed - lease.remaining.get(name, 0)))
+            args += [key('ratelimit', customer, name), per_minute / 60, per_minute, needed, per_minute * LEASE_FRACTION]
+
+        result = await get_db().eval(LEASE_SCRIPT, 0, *args)
+
+        if result[0] > 0:
+            return result[0] / 1000
+
+        for (name, _, needed), granted in zip(limits, result[1:]):
+            lease.remaining[name] = lease.remaining.get(name, 0) + granted - needed
+        lease.expires_at = time.monotonic() + LEASE_TTL
+
+        return 0
+
+
+def create_rate_limiter() -> RateLimiter:
+    if summary_rate_limit_backend == 'redis':
+        return RedisRateLimiter()
+
+    return InMemoryRateLimiter()
+
+
+rate_limiter = create_rate_limiter()
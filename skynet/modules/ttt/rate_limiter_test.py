@@ -0,0 +1,121 @@
+import pytest
+
+from skynet.modules.ttt.rate_limiter import (
+    charge_once,
+    InMemoryRateLimiter,
+    RateLimitExceeded,
+    RedisRateLimiter,
+    RELEASE_SCRIPT,
+)
+
+
+class TestInMemoryRateLimiter:
+    @pytest.mark.asyncio
+    async def test_requests(self):
+        '''Test that a customer over its request limit is rejected while other customers aren't.'''
+
+        limiter = InMemoryRateLimiter(requests_per_minute=2, tokens_per_minute=0)
+
+        await limiter.acquire('customer', 100)
+        await limiter.acquire('customer', 100)
+
+        with pytest.raises(RateLimitExceeded) as e:
+            await limiter.acquire('customer', 100)
+
+        assert 29 < e.value.retry_after <= 30
+
+        await limiter.acquire('other', 100)
+
+    @pytest.mark.asyncio
+    async def test_tokens(self):
+        '''Test that the tokens are limited and a rejected request doesn't use the budget.'''
+
+        limiter = InMemoryRateLimiter(requests_per_minute=10, tokens_per_minute=6000)
+
+        # larger than the budget, still allowed when the bucket is full
+        await limiter.acquire('customer', 10000)
+
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire('customer', 3000)
+
+        assert limiter.buckets[('customer', 'requests')].tokens == pytest.approx(9, abs=0.01)
+
+    @pytest.mark.asyncio
+    async def test_charge_once(self):
+        '''Test that a job retried on another route is only charged once.'''
+
+        limiter = InMemoryRateLimiter(requests_per_minute=1, tokens_per_minute=0)
+
+        with charge_once():
+            await limiter.acquire('customer', 100)
+            await limiter.acquire('customer', 100)
+
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire('customer', 100)
+
+
+class TestRedisRateLimiter:
+    @pytest.mark.asyncio
+    async def test_lease(self, mocker):
+        '''Test that requests are admitted from the local lease and only go to Redis once it's exhausted.'''
+
+        db = mocker.AsyncMock()
+        db.eval.return_value = [0, 3, 900]
+        mocker.patch('skynet.modules.ttt.rate_limiter.get_db', return_value=db)
+
+        limiter = RedisRateLimiter(requests_per_minute=30, tokens_per_minute=6000)
+
+        await limiter.acquire('customer', 300)
+        await limiter.acquire('customer', 300)
+        await limiter.acquire('customer', 300)
+
+        # the first request leases 3 requests and 900 tokens, enough for the next two
+        db.eval.assert_called_once()
+        assert db.eval.call_args.args[3:] == (
+            'skynet:ratelimit:customer:requests',
+            0.5,
+            30,
+            1,
+            3.0,
+            'skynet:ratelimit:customer:tokens',
+            100.0,
+            6000,
+            300,
+            600.0,
+        )
+
+        db.eval.return_value = [1500]
+
+        with pytest.raises(RateLimitExceeded) as e:
+            await limiter.acquire('customer', 300)
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire('customer', 300)
+
+        assert db.eval.call_count == 3
+        assert e.value.retry_after == 1.5
+
+    @pytest.mark.asyncio
+    async def test_release_expired_lease(self, mocker):
+        '''Test that what's left of an expired lease is given back to the shared bucket.'''
+
+        db = mocker.AsyncMock()
+        db.eval.return_value = [0, 3, 900]
+        mocker.patch('skynet.modules.ttt.rate_limiter.get_db', return_value=db)
+
+        limiter = RedisRateLimiter(requests_per_minute=30, tokens_per_minute=6000)
+
+        await limiter.acquire('customer', 300)
+        limiter.leases['customer'].expires_at = 0
+        await limiter.acquire('customer', 300)
+
+        assert db.eval.call_args_list[1].args == (
+            RELEASE_SCRIPT,
+            0,
+            'skynet:ratelimit:customer:requests',
+            30,
+            2,
+            'skynet:ratelimit:customer:tokens',
+            6000,
+            600,
+        )
+        assert db.eval.call_count == 3
@@ -0,0 +1,173 @@
+"""
+Rolling summaries of live meetings.
+
+Instead of summarizing the whole transcript once the meeting ends, the final transcriptions are grouped in windows of
+about `ROLLING_SUMMARY_WINDOW_TOKENS` tokens as they arrive. Each closed window is condensed into notes in the
+background while the meeting goes on, so the summary of the meeting only has to reduce the cached notes, along with
+the lines of the window still open, and takes about the same time whatever the length of the meeting.
+
+With `ENABLE_JOB_QUEUE` the windows and the summaries are processed by the job queue, alongside the other jobs of the
+customer.
+"""
+
+import asyncio
+import time
+
+from skynet.env import (
+    enable_job_queue,
+    enable_rolling_summaries,
+    rolling_summary_retention,
+    rolling_summary_window_tokens,
+)
+from skynet.logs import get_logger
+
+log = get_logger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    # about 4 characters per token, good enough to size the windows without loading a tokenizer
+    return len(text) // 4 + 1
+
+
+async def process(payload, job_type, customer_id: str | None) -> str:
+    if enable_job_queue:
+        from skynet.modules.ttt.job_queue import job_queue
+
+        return await job_queue.run(job_type.value, payload.model_dump(mode='json'), customer_id)
+
+    from skynet.modules.ttt import processor
+
+    return await processor.process(payload, job_type, customer_id)
+
+
+class RollingSummary:
+    def __init__(self, customer_id: str | None = None, window_tokens: int = rolling_summary_window_tokens):
+        self.customer_id = customer_id
+        self.window_tokens = window_tokens
+        self.lines: list[str] = []
+        self.num_tokens = 0
+        # one task per closed window, resolving to the notes of the window
+        self.windows: list[asyncio.Task] = []
+        # the summary, and the number of windows and lines it was reduced from
+        self.summary: tuple[tuple[int, int], str] | None = None
+        self.ended_at: float | None = None
+
+    def add(self, participant_id: str, text: str):
+        line = f'{participant_id}: {text.strip()}'
+        self.lines.append(line)
+        self.num_tokens += estimate_tokens(line)
+
+        if self.num_tokens >= self.window_tokens:
+            self.close_window()
+
+    def close_window(self):
+        if not self.lines:
+            return
+
+        text = '\n'.join(self.lines)
+        self.lines = []
+        self.num_tokens = 0
+        self.windows.append(asyncio.create_task(self.summarize_window(text)))
+
+    async def summarize_window(self, text: str) -> str:
+        from skynet.modules.ttt.processor import combined_map_instructions
+        from skynet.modules.ttt.summaries.v1.models import DocumentPayload, JobType
+
+        payload = DocumentPayload(text=text, prompt=combined_map_instructions)
+
+        try:
+            return await process(payload, JobType.SUMMARY, self.customer_id)
+        except Exception as e:
+            # the transcript of the window is still better than losing it, the final reduce will split it if needed
+            log.warning(f'Failed to summarize a window of {len(text)} characters, keeping its transcript: {e}')
+            return text
+
+    async def get_summary(self) -> str:
+        from skynet.modules.ttt.summaries.v1.models import DocumentPayload, HintType, JobType
+
+        windows = list(self.windows)
+        lines = list(self.lines)
+
+        if not windows and not lines:
+            return ''
+
+        if self.summary is not None and self.summary[0] == (len(windows), len(lines)):
+            return self.summary[1]
+
+        # asyncio.wait doesn't cancel the windows if the request is cancelled, they stay cached for the next one
+        if windows:
+            await asyncio.wait(windows)
+
+        # the window still open isn't closed, that would cost a map call per request to a meeting polled for its summary
+        notes = [window.result() for window in windows] + (['\n'.join(lines)] if lines else [])
+        summary = await process(
+            DocumentPayload(text='\n\n'.join(notes), hint=HintType.MEETING), JobType.SUMMARY, self.customer_id
+        )
+        self.summary = ((len(windows), len(lines)), summary)
+
+        return summary
+
+
+class RollingSummaries:
+    def __init__(self):
+        self.summaries: dict[str, RollingSummary] = {}
+
+    def is_enabled(self) -> bool:
+        return enable_rolling_summaries
+
+    def start(self, meeting_id: str, customer_id: str | None = None):
+        if not self.is_enabled():
+            return
+
+        self.evict()
+
+        summary = self.summaries.get(meeting_id)
+        if summary is None:
+            self.summaries[meeting_id] = RollingSummary(customer_id)
+        else:
+            # the meeting reconnected, keep the windows summarized so far
+            summary.ended_at = None
+
+    def add(self, meeting_id: str, participant_id: str, text: str):
+        summary = self.summaries.get(meeting_id)
+        if summary is not None:
+            summary.add(participant_id, text)
+
+    def end(self, meeting_id: str):
+        summary = self.summaries.get(meeting_id)
+        if summary is not None:
+            summary.close_window()
+            summary.ended_at = time.monotonic()
+
+    def evict(self):
+        now = time.monotonic()
+        for meeting_id, summary in list(self.summaries.items()):
+            if summary.ended_at is not None and now - summary.ended_at > rolling_summary_retention:
+                del self.summaries[meeting_id]
+
+    def get(self, meeting_id: str) -> RollingSummary | None:
+        return self.summaries.get(meeting_id)
+
+    async def get_summary(
+        self, meeting_id: str, lines: list[tuple[str, str]] | None = None, customer_id: str | None = None
+    ) -> str | None:
+        """
+        Returns the summary of the meeting so far. A meeting that isn't tracked, e.g. one that ended before this node
+        started, is summarized window by window from its `(participant id, text)` lines if given, for `customer_id`.
+        """
+        summary = self.summaries.get(meeting_id)
+
+        if summary is None:
+            if not lines:
+                return None
+
+            summary = RollingSummary(customer_id)
+            for participant_id, text in lines:
+                summary.add(participant_id, text)
+            summary.ended_at = time.monotonic()
+            self.summaries[meeting_id] = summary
+
+        return await summary.get_summary()
+
+
+rolling_summaries = RollingSummaries()
@@ -0,0 +1,50 @@
+import pytest
+
+
+@pytest.fixture()
+def process_fixture(mocker):
+    async def process(payload, job_type, customer_id=None):
+        return f'notes {len(payload.text)}'
+
+    return mocker.patch('skynet.modules.ttt.processor.process', side_effect=process)
+
+
+class TestRollingSummary:
+    @pytest.mark.asyncio
+    async def test_windows(self, process_fixture):
+        '''Test that closed windows are summarized as they fill and the summary only reduces their notes.'''
+
+        from skynet.modules.ttt.rolling_summary import RollingSummary
+
+        summary = RollingSummary(customer_id='test', window_tokens=10)
+        summary.add('Andrew', 'Hello, where are you?')
+        summary.add('Beatrix', 'At the station, I missed my train.')
+        summary.add('Andrew', 'Oh no.')
+
+        assert len(summary.windows) == 1
+
+        result = await summary.get_summary()
+
+        # the closed window and the reduce, the lines of the open window are reduced as they are
+        assert process_fixture.call_count == 2
+        assert process_fixture.call_args.args[0].text == 'notes 73\n\nAndrew: Oh no.'
+        assert process_fixture.call_args.args[2] == 'test'
+        assert result == 'notes 24'
+        assert len(summary.windows) == 1
+
+    @pytest.mark.asyncio
+    async def test_cached_summary(self, process_fixture):
+        '''Test that the summary isn't computed again if nothing was said since.'''
+
+        from skynet.modules.ttt.rolling_summary import RollingSummary
+
+        summary = RollingSummary(window_tokens=1000)
+        summary.add('Andrew', 'Hello.')
+
+        assert await summary.get_summary() == await summary.get_summary()
+        assert process_fixture.call_count == 1
+
+        summary.add('Beatrix', 'Hi.')
+        await summary.get_summary()
+
+        assert process_fixture.call_count == 2
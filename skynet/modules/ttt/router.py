@@ -0,0 +1,228 @@
+"""
+Routes summary jobs across the local LLM and the OpenAI and Azure deployments configured for a customer.
+
+Every deployment, the local LLM or an OpenAI or Azure deployment identified by its endpoint, model and secret, keeps
+track of the jobs running on it, of how many characters of input it processes per second and of its recent error rate.
+The customers sharing a deployment share its stats, one customer's failing deployment doesn't affect the others. The
+`routingPolicy` of the customer, `SUMMARY_ROUTING_POLICY` by default, decides how they're used:
+
+- `pinned`: always the first enabled credentials of the customer, the local LLM if there are none;
+- `cost`: the local LLM, unless all of its `JOB_QUEUE_WORKERS` slots are busy or it's failing, in which case the job
+  spills to the customer's own deployments. The jobs waiting in the job queue count as busy slots: every node's workers
+  route their jobs themselves, so a node alone never sees the local LLM saturated while the queue backs up;
+- `latency`: the deployment expected to finish the job first, given its queue and throughput.
+
+Deployments failing more than half of their jobs are avoided. With a policy other than `pinned` a job that fails is
+retried once on the next best deployment, unless it failed on the rate limit of its customer or was cancelled. The
+retry isn't charged to the customer's rate limit again.
+"""
+
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Mapping
+
+from skynet.auth.user_info import CustomerCredentials, default_credentials, resolve_processor, RoutingPolicy
+from skynet.env import job_queue_workers
+from skynet.logs import get_logger
+from skynet.modules.monitoring import (
+    SUMMARY_BACKEND_ERROR_RATE_METRIC,
+    SUMMARY_BACKEND_INFLIGHT_METRIC,
+    SUMMARY_BACKEND_THROUGHPUT_METRIC,
+    SUMMARY_ROUTED_JOBS_COUNTER,
+    SUMMARY_SPILLED_JOBS_COUNTER,
+)
+from skynet.modules.ttt.job_queue import job_queue
+from skynet.modules.ttt.rate_limiter import charge_once, RateLimitExceeded
+from skynet.modules.ttt.summaries.v1.models import Processors
+
+log = get_logger(__name__)
+
+# characters of input per second assumed until a processor completed a job
+DEFAULT_THROUGHPUT = {Processors.LOCAL: 2000, Processors.OPENAI: 4000, Processors.AZURE: 4000}
+
+EWMA_ALPHA = 0.2
+MAX_ERROR_RATE = 0.5
+MAX_ATTEMPTS = 2
+
+
+@dataclass(frozen=True)
+class Route:
+    processor: Processors
+    options: Mapping
+
+    @property
+    def deployment(self) -> str:
+        if self.processor == Processors.LOCAL:
+            return self.processor.value
+
+        metadata = self.options.get('metadata') or {}
+        # the secret tells apart the accounts of the customers, and their quotas
+        secret = hashlib.sha256((self.options.get('secret') or '').encode()).hexdigest()[:16]
+        model = metadata.get('model') or metadata.get('deploymentName') or ''
+        return ':'.join([self.processor.value, metadata.get('endpoint') or '', model, secret])
+
+
+class BackendStats:
+    def __init__(self, processor: Processors, capacity: int | None = None, get_queued: Callable[[], int] = lambda: 0):
+        self.processor = processor
+        # the number of jobs the processor runs at the same time, remote deployments are assumed to scale
+        self.capacity = capacity
+        self.inflight = 0
+        # the jobs waiting for the processor elsewhere than on this node
+        self.get_queued = get_queued
+        self.throughput = DEFAULT_THROUGHPUT[processor]
+        self.average_duration = None
+        self.error_rate = 0.0
+
+    def get_load(self) -> int:
+        return self.inflight + self.get_queued()
+
+    def is_full(self) -> bool:
+        return self.capacity is not None and self.get_load() >= self.capacity
+
+    def is_failing(self) -> bool:
+        return self.error_rate > MAX_ERROR_RATE
+
+    def get_expected_duration(self, length: int) -> float:
+        duration = length / self.throughput
+
+        if self.is_full():
+            # the jobs beyond the capacity wait for a running job to complete
+            queued = self.get_load() - self.capacity + 1
+            duration += queued * (self.average_duration or duration) / self.capacity
+
+        # a failed job has to run again somewhere else
+        return duration / max(1 - self.error_rate, 0.1)
+
+    def start(self):
+        self.inflight += 1
+        SUMMARY_BACKEND_INFLIGHT_METRIC.labels(self.processor.value).inc()
+
+    def cancel(self):
+        """A job that didn't run, e.g. rejected by the rate limiter, says nothing about the processor."""
+        self.inflight -= 1
+        SUMMARY_BACKEND_INFLIGHT_METRIC.labels(self.processor.value).dec()
+
+    def complete(self, length: int, duration: float, failed: bool):
+        self.cancel()
+
+        self.error_rate += EWMA_ALPHA * (float(failed) - self.error_rate)
+        SUMMARY_BACKEND_ERROR_RATE_METRIC.labels(self.processor.value).set(self.error_rate)
+
+        if failed or duration <= 0:
+            return
+
+        self.throughput += EWMA_ALPHA * (length / duration - self.throughput)
+        self.average_duration = (
+            duration
+            if self.average_duration is None
+            else self.average_duration + EWMA_ALPHA * (duration - self.average_duration)
+        )
+        SUMMARY_BACKEND_THROUGHPUT_METRIC.labels(self.processor.value).set(self.throughput)
+
+
+class Router:
+    def __init__(self):
+        self.local = BackendStats(Processors.LOCAL, job_queue_workers, lambda: job_queue.pending)
+        # keyed by deployment, only the ones configured for a customer are ever added
+        self.backends: dict[str, BackendStats] = {Processors.LOCAL.value: self.local}
+
+    def get_backend(self, route: Route) -> BackendStats:
+        backend = self.backends.get(route.deployment)
+        if backend is None:
+            backend = self.backends[route.deployment] = BackendStats(route.processor)
+        return backend
+
+    def get_candidates(self, credentials: CustomerCredentials) -> list[Route]:
+        routes = [Route(credentials.processor, credentials.options)]
+        routes += [Route(resolve_processor(options), options) for options in credentials.alternatives]
+
+        # alternatives without a secret would run locally anyway
+        routes = [route for i, route in enumerate(routes) if route.processor != Processors.LOCAL or i == 0]
+        if all(route.processor != Processors.LOCAL for route in routes):
+            routes.append(Route(Processors.LOCAL, default_credentials.options))
+
+        return routes
+
+    def route(self, credentials: CustomerCredentials, length: int) -> list[Route]:
+        """Returns the routes to try for a job with `length` characters of input, the preferred one first."""
+        candidates = self.get_candidates(credentials)
+
+        if credentials.policy == RoutingPolicy.PINNED:
+            return candidates[:1]
+
+        healthy = [route for route in candidates if not self.get_backend(route).is_failing()] or candidates
+        local = self.local
+
+        if credentials.policy == RoutingPolicy.COST:
+            # sorting is stable, the remote deployments keep the order of the customer's credentials
+            return sorted(
+                healthy, key=lambda route: route.processor != Processors.LOCAL or local.is_full() or local.is_failing()
+            )
+
+        return sorted(healthy, key=lambda route: self.get_backend(route).get_expected_duration(length))
+
+    async def run(
+        self,
+        credentials: CustomerCredentials,
+        length: int,
+        job: Callable[[Route], Awaitable],
+        customer_id: str | None = None,
+    ):
+        """Runs `job` on the preferred route of the customer and on the next one if it fails."""
+        with charge_once():
+            return await self.run_routes(credentials, length, job, customer_id)
+
+    async def run_routes(
+        self,
+        credentials: CustomerCredentials,
+        length: int,
+        job: Callable[[Route], Awaitable],
+        customer_id: str | None,
+    ):
+        routes = self.route(credentials, length)[:MAX_ATTEMPTS]
+
+        for attempt, route in enumerate(routes):
+            backend = self.get_backend(route)
+            SUMMARY_ROUTED_JOBS_COUNTER.labels(route.processor.value, credentials.policy.value).inc()
+
+            if route.processor != credentials.processor:
+                if attempt > 0:
+                    reason = 'retry'
+                elif self.get_backend(Route(credentials.processor, credentials.options)).is_failing():
+                    reason = 'failing'
+                else:
+                    reason = credentials.policy.value
+                SUMMARY_SPILLED_JOBS_COUNTER.labels(route.processor.value, reason).inc()
+                log.info(f'Routing the job of customer {customer_id} to {route.processor.value} ({reason})')
+
+            backend.start()
+            start = time.perf_counter()
+            failed = True
+            rejected = False
+
+            try:
+                result = await job(route)
+                failed = False
+            except (RateLimitExceeded, asyncio.CancelledError):
+                # the customer's budget is the same on every route, a cancelled job says nothing of the deployment
+                rejected = True
+                raise
+            except Exception as e:
+                if attempt == len(routes) - 1:
+                    raise
+
+                log.warning(f'Job of customer {customer_id} failed on {route.processor.value}, retrying: {e}')
+                continue
+            finally:
+                if rejected:
+                    backend.cancel()
+                else:
+                    backend.complete(length, time.perf_counter() - start, failed)
+
+            return result
+
+
+router = Router()
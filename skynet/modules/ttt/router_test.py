@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from skynet.auth.user_info import CustomerCredentials, default_credentials, RoutingPolicy
+from skynet.modules.ttt.summaries.v1.models import Processors
+
+openai_options = {'secret': 'secret', 'type': 'OPENAI', 'metadata': {'model': 'gpt-4o-mini'}}
+azure_options = {
+    'secret': 'secret',
+    'type': 'AZURE_OPENAI',
+    'metadata': {'endpoint': 'https://myopenai.azure.com', 'deploymentName': 'gpt-4o-mini'},
+}
+
+
+def get_credentials(policy: RoutingPolicy) -> CustomerCredentials:
+    return CustomerCredentials(
+        processor=Processors.OPENAI, options=openai_options, alternatives=(azure_options,), policy=policy
+    )
+
+
+class TestRouter:
+    def test_pinned(self):
+        '''Test that the configured processor is always used with the pinned policy.'''
+
+        from skynet.modules.ttt.router import Router
+
+        router = Router()
+
+        routes = router.route(get_credentials(RoutingPolicy.PINNED), 1000)
+
+        assert [route.processor for route in routes] == [Processors.OPENAI]
+
+    def test_cost(self):
+        '''Test that jobs run locally with the cost policy and spill to the customer's deployments when it's full.'''
+
+        from skynet.modules.ttt.router import Router
+
+        router = Router()
+        credentials = get_credentials(RoutingPolicy.COST)
+
+        assert [route.processor for route in router.route(credentials, 1000)] == [
+            Processors.LOCAL,
+            Processors.OPENAI,
+            Processors.AZURE,
+        ]
+
+        for _ in range(router.local.capacity):
+            router.local.start()
+
+        assert router.route(credentials, 1000)[0].processor == Processors.OPENAI
+
+    def test_cost_queued(self, mocker):
+        '''Test that the jobs waiting in the job queue count as busy local slots.'''
+
+        from skynet.modules.ttt.job_queue import job_queue
+        from skynet.modules.ttt.router import Router
+
+        router = Router()
+        credentials = get_credentials(RoutingPolicy.COST)
+        local = router.local
+
+        local.start()
+        mocker.patch.object(job_queue, 'pending', local.capacity - 2)
+        assert router.route(credentials, 1000)[0].processor == Processors.LOCAL
+
+        mocker.patch.object(job_queue, 'pending', local.capacity - 1)
+        assert router.route(credentials, 1000)[0].processor == Processors.OPENAI
+
+    def test_latency(self):
+        '''Test that the processor expected to finish first is preferred and failing processors are avoided.'''
+
+        from skynet.modules.ttt.router import Route, Router
+
+        router = Router()
+        credentials = get_credentials(RoutingPolicy.LATENCY)
+        azure = router.get_backend(Route(Processors.AZURE, azure_options))
+
+        azure.start()
+        azure.complete(10000, 1, failed=False)
+
+        assert router.route(credentials, 1000)[0].processor == Processors.AZURE
+
+        for _ in range(5):
+            azure.start()
+            azure.complete(1000, 1, failed=True)
+
+        assert Processors.AZURE not in [route.processor for route in router.route(credentials, 1000)]
+
+    def test_deployments(self):
+        '''Test that the deployments of a processor keep their own stats.'''
+
+        from skynet.modules.ttt.router import Route, Router
+
+        router = Router()
+        other_options = {**openai_options, 'secret': 'other secret'}
+        other = Route(Processors.OPENAI, other_options)
+        credentials = CustomerCredentials(
+            processor=Processors.OPENAI,
+            options=openai_options,
+            alternatives=(other_options,),
+            policy=RoutingPolicy.COST,
+        )
+
+        assert router.get_backend(Route(Processors.OPENAI, dict(openai_options))) is router.get_backend(
+            Route(Processors.OPENAI, openai_options)
+        )
+        assert router.get_backend(other) is not router.get_backend(Route(Processors.OPENAI, openai_options))
+
+        for _ in range(5):
+            router.get_backend(other).start()
+            router.get_backend(other).complete(1000, 1, failed=True)
+
+        assert [route.options for route in router.route(credentials, 1000)] == [
+            default_credentials.options,
+            openai_options,
+        ]
+
+    @pytest.mark.asyncio
+    async def test_retry(self):
+        '''Test that a failed job is retried on the next route.'''
+
+        from skynet.modules.ttt.router import Router
+
+        router = Router()
+        processors = []
+
+        async def job(route):
+            processors.append(route.processor)
+            if route.processor == Processors.LOCAL:
+                raise RuntimeError('overloaded')
+            return 'summary'
+
+        assert await router.run(get_credentials(RoutingPolicy.COST), 1000, job) == 'summary'
+        assert processors == [Processors.LOCAL, Processors.OPENAI]
+        assert router.local.inflight == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled(self):
+        '''Test that a cancelled job isn't retried and doesn't count as a failure of the deployment.'''
+
+        from skynet.modules.ttt.router import Router
+
+        router = Router()
+
+        async def job(route):
+            raise asyncio.CancelledError()
+
+        with pytest.raises(asyncio.CancelledError):
+            await router.run(get_credentials(RoutingPolicy.COST), 1000, job)
+
+        assert router.local.inflight == 0
+        assert router.local.error_rate == 0
+
+    @pytest.mark.asyncio
+    async def test_rate_limited(self):
+        '''Test that a job rejected by the rate limiter isn't retried and doesn't count in the processor's stats.'''
+
+        from skynet.modules.ttt.rate_limiter import RateLimitExceeded
+        from skynet.modules.ttt.router import DEFAULT_THROUGHPUT, Router
+
+        router = Router()
+        local = router.local
+
+        async def job(route):
+            raise RateLimitExceeded('customer', 1)
+
+        with pytest.raises(RateLimitExceeded):
+            await router.run(get_credentials(RoutingPolicy.COST), 1000, job)
+
+        assert local.inflight == 0
+        assert local.throughput == DEFAULT_THROUGHPUT[Processors.LOCAL]
+        assert local.error_rate == 0
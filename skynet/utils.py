@@ -2,7 +2,6 @@ import uvicorn
 from fastapi import APIRouter, Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from skynet.auth.bearer import JWTBearer
 from skynet.env import bypass_auth, ws_max_ping_interval, ws_max_ping_timeout, ws_max_queue_size, ws_max_size_bytes
 from skynet.logs import get_logger, uvicorn_log_config
 
@@ -21,7 +20,13 @@ def create_app(**kwargs):
     return app
 
 
-dependencies = [] if bypass_auth else [Depends(JWTBearer())]
+# the JWT libraries are only needed when authorization is enabled
+if bypass_auth:
+    dependencies = []
+else:
+    from skynet.auth.bearer import JWTBearer
+
+    dependencies = [Depends(JWTBearer())]
 responses = (
     {}
     if bypass_auth
@@ -0,0 +1,89 @@
+# Description: A local stand-in for the Fireworks streaming transcription websocket, used to benchmark the streaming
+# whisper pipeline deterministically and without network access. Every binary message is treated as the audio to
+# transcribe and answered with a verbose_json transcription after a configurable latency, failing a configurable share
+# of the requests.
+# Usage: poetry run python tools/mock_fireworks_server.py -p <port> -l <latency-ms> -j <jitter-ms> -d <distribution>
+# Then start skynet with FIREWORKS_STREAMING_URL=ws://localhost:<port> and any FIREWORKS_API_KEY.
+
+import asyncio
+import json
+import math
+import random
+from argparse import ArgumentParser
+
+import websockets
+
+from skynet.modules.stt.streaming_whisper.mock_client import transcribe, WORD_DURATION
+
+parser = ArgumentParser()
+parser.add_argument('-H', '--host', dest='host', help='host to listen on', default='localhost')
+parser.add_argument('-p', '--port', dest='port', help='port to listen on', type=int, default=8765)
+parser.add_argument('-l', '--latency', dest='latency', help='mean latency in milliseconds', type=float, default=150)
+parser.add_argument('-j', '--jitter', dest='jitter', help='latency spread in milliseconds', type=float, default=50)
+parser.add_argument(
+    '-d',
+    '--distribution',
+    dest='distribution',
+    help='latency distribution',
+    choices=['fixed', 'uniform', 'normal', 'lognormal'],
+    default='lognormal',
+)
+parser.add_argument('-e', '--error-rate', dest='error_rate', help='share of failed requests', type=float, default=0)
+parser.add_argument(
+    '-x',
+    '--disconnect-rate',
+    dest='disconnect_rate',
+    help='share of requests dropping the connection',
+    type=float,
+    default=0,
+)
+parser.add_argument(
+    '-w', '--word-duration', dest='word_duration', help='seconds per word', type=float, default=WORD_DURATION
+)
+parser.add_argument('-s', '--seed', dest='seed', help='random seed, for reproducible runs', type=int, default=None)
+
+args = parser.parse_args()
+rng = random.Random(args.seed)
+
+
+def get_latency() -> float:
+    if args.distribution == 'fixed':
+        latency = args.latency
+    elif args.distribution == 'uniform':
+        latency = rng.uniform(args.latency - args.jitter, args.latency + args.jitter)
+    elif args.distribution == 'normal':
+        latency = rng.gauss(args.latency, args.jitter)
+    else:
+        # a long tail like real network and inference latencies, with the requested mean and standard deviation
+        sigma = math.sqrt(math.log(1 + (args.jitter / args.latency) ** 2))
+        latency = rng.lognormvariate(math.log(args.latency) - sigma**2 / 2, sigma)
+
+    return max(latency, 0) / 1000
+
+
+async def handler(websocket):
+    async for message in websocket:
+        if not isinstance(message, bytes):
+            await websocket.send(json.dumps({'error': 'Expected binary audio'}))
+            continue
+
+        await asyncio.sleep(get_latency())
+
+        roll = rng.random()
+        if roll < args.disconnect_rate:
+            await websocket.close(1011, 'Simulated failure')
+            return
+        if roll < args.disconnect_rate + args.error_rate:
+            await websocket.send(json.dumps({'error': 'Simulated error'}))
+            continue
+
+        await websocket.send(json.dumps(transcribe(message, args.word_duration)))
+
+
+async def main():
+    async with websockets.serve(handler, args.host, args.port):
+        print(f'Mock Fireworks server listening on ws://{args.host}:{args.port}')
+        await asyncio.Future()
+
+
+asyncio.run(main())
@@ -0,0 +1,57 @@
+# Description: Measures how long processing the same text for both the summary and the action items takes through
+# process_many, which runs the first job alone so that vLLM's automatic prefix caching (--enable-prefix-caching) reuses
+# its KV cache for the sibling, compared to sending both jobs at once, when the sibling finds nothing cached yet.
+# Usage: LLAMA_PATH=<model> OPENAI_API_BASE_URL=<vllm-url> poetry run python tools/prefix_cache_benchmark.py
+#   -f <transcript.txt> -r <runs>
+# Prerequisites: a running vLLM OpenAI compatible server started with --enable-prefix-caching
+
+import asyncio
+import statistics
+import time
+import uuid
+from argparse import ArgumentParser
+
+from skynet.modules.ttt.processor import process, process_many
+from skynet.modules.ttt.summaries.v1.models import DocumentPayload, HintType, JobType
+
+parser = ArgumentParser()
+parser.add_argument('-f', '--file', dest='filename', help='text file to process', metavar='FILE', required=True)
+parser.add_argument('-r', '--runs', dest='runs', help='number of runs per layout', default=5)
+
+args = parser.parse_args()
+
+job_types = [JobType.SUMMARY, JobType.ACTION_ITEMS]
+
+
+async def process_at_once(payload: DocumentPayload) -> dict[JobType, str]:
+    results = await asyncio.gather(*[process(payload, job_type) for job_type in job_types])
+
+    return dict(zip(job_types, results))
+
+
+async def run(text: str, process_jobs) -> float:
+    # a unique marker per run prevents hits from previous runs, while keeping the sibling requests identical
+    payload = DocumentPayload(text=f'[{uuid.uuid4()}]\n{text}', hint=HintType.MEETING)
+    start = time.perf_counter()
+
+    await process_jobs(payload)
+
+    return time.perf_counter() - start
+
+
+async def main():
+    text = open(args.filename, 'r').read()
+    runs = int(args.runs)
+
+    at_once = [await run(text, process_at_once) for _ in range(runs)]
+    many = [await run(text, lambda payload: process_many(payload, job_types)) for _ in range(runs)]
+
+    at_once_duration = statistics.median(at_once)
+    many_duration = statistics.median(many)
+
+    print(f'Summary and action items sent at once: {at_once_duration:.3f}s')
+    print(f'Summary and action items through process_many: {many_duration:.3f}s')
+    print(f'Time saved by process_many: {at_once_duration - many_duration:.3f}s')
+
+
+asyncio.run(main())
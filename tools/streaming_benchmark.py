@@ -0,0 +1,197 @@
+# Description: Load tests the streaming whisper websocket by opening N meetings with M participants each and streaming a
+# WAV file in real time for every participant, using the same chunk format as the web client. Reports the time to the
+# first interim, the latency of the finals, from the first chunk of their audio, the frames that couldn't be sent in
+# time and the CPU and memory used by the server, read from its Prometheus process metrics. Finals are matched to their
+# first chunk by their timestamp, which the server takes from its clock: run it on the same host or with synced clocks.
+# Usage: poetry run python tools/streaming_benchmark.py -f <audio.wav> -n <meetings> -m <participants> -u <skynet-url>
+# Prerequisites: a running skynet instance with the streaming_whisper module and metrics enabled. To run fully offline
+# start it with WHISPER_BACKEND=mock and BYPASS_AUTHORIZATION=true.
+
+import asyncio
+import statistics
+import struct
+import time
+import uuid
+import wave
+from argparse import ArgumentParser
+from bisect import bisect_right
+from dataclasses import dataclass, field
+
+import aiohttp
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+parser = ArgumentParser()
+parser.add_argument('-f', '--file', dest='filename', help='WAV file to stream', metavar='FILE', required=True)
+parser.add_argument('-n', '--meetings', dest='meetings', help='number of meetings', type=int, default=1)
+parser.add_argument('-m', '--participants', dest='participants', help='participants per meeting', type=int, default=2)
+parser.add_argument('-c', '--chunk', dest='chunk_ms', help='chunk duration in milliseconds', type=int, default=1024)
+parser.add_argument('-l', '--lang', dest='lang', help='language of the audio', default='en')
+parser.add_argument('-u', '--url', dest='url', help='skynet url', default='http://localhost:8001')
+parser.add_argument(
+    '-mu', '--metrics-url', dest='metrics_url', help='metrics url', default='http://localhost:8001/metrics/'
+)
+parser.add_argument('-jwt', '--jwt', dest='jwt', help='jwt token', default=None)
+parser.add_argument(
+    '-x', '--mixed', dest='mixed', help='send one mixed stream per meeting, ignoring -m', action='store_true'
+)
+parser.add_argument('-w', '--wait', dest='wait', help='seconds to wait for the last results', type=float, default=5)
+
+args = parser.parse_args()
+
+
+@dataclass
+class ParticipantStats:
+    started_at: float = 0
+    # wall clock time in millis of every chunk sent and its perf counter, to time a final from its first chunk
+    sent_timestamps: list[int] = field(default_factory=list)
+    sent_at: list[float] = field(default_factory=list)
+    first_interim: float | None = None
+    final_latencies: list[float] = field(default_factory=list)
+    sent_frames: int = 0
+    dropped_frames: int = 0
+
+
+def load_audio(filename: str) -> np.ndarray:
+    with wave.open(filename, 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError('Only 16-bit WAV files are supported')
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+
+    audio = samples.reshape(-1, channels).mean(axis=1) / 32768
+    if rate != SAMPLE_RATE:
+        positions = np.arange(0, len(audio), rate / SAMPLE_RATE)
+        audio = np.interp(positions, np.arange(len(audio)), audio)
+
+    return audio.astype(np.float32)
+
+
+def build_chunks(audio: np.ndarray, participant_id: str) -> list[bytes]:
+    # 36 bytes participant id, 2 bytes language length, the language and then the float32 audio
+    header = participant_id.encode('utf-8').ljust(36) + struct.pack('!H', len(args.lang)) + args.lang.encode('utf-8')
+    size = SAMPLE_RATE * args.chunk_ms // 1000
+
+    return [header + audio[i : i + size].tobytes() for i in range(0, len(audio), size)]
+
+
+async def get_process_metrics(session: aiohttp.ClientSession) -> dict[str, float]:
+    try:
+        async with session.get(args.metrics_url) as response:
+            text = await response.text()
+    except aiohttp.ClientError as e:
+        print(f'Failed to read the server metrics: {e}')
+        return {}
+
+    values = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(' ')
+        if name in ('process_cpu_seconds_total', 'process_resident_memory_bytes'):
+            values[name] = float(value)
+
+    return values
+
+
+async def stream(ws: aiohttp.ClientWebSocketResponse, chunks: list[bytes], stats: ParticipantStats):
+    interval = args.chunk_ms / 1000
+    stats.started_at = time.perf_counter()
+
+    for i, chunk in enumerate(chunks):
+        deadline = stats.started_at + i * interval
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif -delay > interval:
+            # a real time client can't catch up either, the frame is lost
+            stats.dropped_frames += 1
+            continue
+
+        try:
+            await ws.send_bytes(chunk)
+        except ConnectionError:
+            stats.dropped_frames += len(chunks) - i
+            return
+        stats.sent_timestamps.append(int(time.time() * 1000))
+        stats.sent_at.append(time.perf_counter())
+        stats.sent_frames += 1
+
+
+async def receive(ws: aiohttp.ClientWebSocketResponse, participants: dict[str, ParticipantStats]):
+    async for message in ws:
+        if message.type != aiohttp.WSMsgType.TEXT:
+            break
+
+        result = message.json()
+        # in mixed mode the participant id is followed by the index of the speaker
+        stats = participants.get(result.get('participant_id', '').strip().split('#')[0])
+        if stats is None:
+            continue
+
+        received_at = time.perf_counter()
+        if stats.first_interim is None and result['type'] == 'interim':
+            stats.first_interim = received_at - stats.started_at
+        elif result['type'] == 'final':
+            # the last chunk sent before the speech started holds its beginning
+            index = bisect_right(stats.sent_timestamps, result['ts']) - 1
+            if index >= 0:
+                stats.final_latencies.append(received_at - stats.sent_at[index])
+
+
+async def run_meeting(session: aiohttp.ClientSession, audio: np.ndarray) -> list[ParticipantStats]:
+    meeting_id = str(uuid.uuid4())
+    # a mixed stream carries all the speakers of the meeting under a single participant id
+    participants = {str(uuid.uuid4()): ParticipantStats() for _ in range(1 if args.mixed else args.participants)}
+    url = f'{args.url.replace("http", "ws", 1)}/streaming-whisper/ws/{meeting_id}'
+    params = {'auth_token': args.jwt} if args.jwt else {}
+    if args.mixed:
+        params['mixed'] = 'true'
+
+    async with session.ws_connect(url, params=params) as ws:
+        receiver = asyncio.create_task(receive(ws, participants))
+        await asyncio.gather(*[stream(ws, build_chunks(audio, pid), stats) for pid, stats in participants.items()])
+        await asyncio.sleep(args.wait)
+        await ws.send_bytes(b'\x00')
+        receiver.cancel()
+
+    return list(participants.values())
+
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return 'n/a'
+    if len(values) == 1:
+        return f'p50 {values[0]:.3f}s'
+
+    quantiles = statistics.quantiles(values, n=100)
+    return f'p50 {quantiles[49]:.3f}s p95 {quantiles[94]:.3f}s max {max(values):.3f}s'
+
+
+async def main():
+    audio = load_audio(args.filename)
+
+    async with aiohttp.ClientSession() as session:
+        before = await get_process_metrics(session)
+        start = time.perf_counter()
+        results = await asyncio.gather(*[run_meeting(session, audio) for _ in range(args.meetings)])
+        elapsed = time.perf_counter() - start
+        after = await get_process_metrics(session)
+
+    stats = [participant for meeting in results for participant in meeting]
+    first_interims = [s.first_interim for s in stats if s.first_interim is not None]
+    final_latencies = [latency for s in stats for latency in s.final_latencies]
+    sent = sum(s.sent_frames for s in stats)
+    dropped = sum(s.dropped_frames for s in stats)
+
+    print(f'Meetings: {args.meetings}, participants: {len(stats)}, audio: {len(audio) / SAMPLE_RATE:.1f}s')
+    print(f'Time to first interim: {percentiles(first_interims)}, missing for {len(stats) - len(first_interims)}')
+    print(f'Final latency: {percentiles(final_latencies)}, {len(final_latencies)} finals')
+    print(f'Frames sent: {sent}, dropped: {dropped} ({dropped / max(sent + dropped, 1):.1%})')
+
+    if 'process_cpu_seconds_total' in before and 'process_cpu_seconds_total' in after:
+        cpu = (after['process_cpu_seconds_total'] - before['process_cpu_seconds_total']) / elapsed
+        print(f'Server CPU: {cpu:.1%}, RSS: {after["process_resident_memory_bytes"] / 2**20:.1f}MiB')
+
+
+asyncio.run(main())